@@ -0,0 +1,73 @@
+"""
+MAAS Practice - Admin View
+Latency, token and cost breakdown of recorded model calls
+"""
+
+import streamlit as st
+
+import instrumentation
+from request_scheduler import scheduler
+from response_cache import response_cache
+from warm_start import opener_pool
+
+
+def render_admin_page():
+    """Show p50/p95 latency and cost per case and per command."""
+    st.title("MAAS Practice — Call Metrics")
+    render_scheduler_stats()
+    render_cache_stats()
+    render_warm_start_stats()
+    records = instrumentation.load_records()
+    if not records:
+        st.info("No model calls recorded yet.")
+        return
+
+    total_cost = sum(r["cost_usd"] for r in records if r.get("cost_usd") is not None)
+    errors = sum(1 for r in records if r.get("error"))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Calls", len(records))
+    col2.metric("Errors", errors)
+    col3.metric("Estimated cost", f"${total_cost:.2f}")
+
+    st.subheader("Per command")
+    st.dataframe(instrumentation.summarize(records, ("call_type",)))
+
+    st.subheader("Per case")
+    st.dataframe(instrumentation.summarize(records, ("patient_id", "consultation_id")))
+
+    st.subheader("Per case and command")
+    st.dataframe(
+        instrumentation.summarize(records, ("patient_id", "consultation_id", "call_type"))
+    )
+
+    with st.expander("Recent calls"):
+        st.dataframe(records[-200:][::-1])
+
+
+def render_scheduler_stats():
+    """Show the live request queue of this server process."""
+    stats = scheduler.snapshot()
+    st.subheader("Request queue (this process)")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queued", stats["queued"])
+    col2.metric("In flight", stats["in_flight"])
+    col3.metric("Wait p50 / p95", f"{stats['wait_p50_ms']:.0f} / {stats['wait_p95_ms']:.0f} ms")
+    col4.metric("Retries", stats["retries"], help=f"{stats['failures']} calls failed after retrying")
+    if stats["wait_by_call_type"]:
+        st.dataframe(stats["wait_by_call_type"])
+
+
+def render_cache_stats():
+    """Show response cache hit rates since this server process started."""
+    rows = response_cache.stats()
+    if rows:
+        st.subheader("Response cache (this process)")
+        st.dataframe(rows)
+
+
+def render_warm_start_stats():
+    """Show how far the warm-up has got and how many openers were served."""
+    stats = opener_pool.stats()
+    if stats["state"] != "disabled":
+        st.subheader("Warm start (this process)")
+        st.dataframe([stats])
@@ -0,0 +1,70 @@
+"""
+MAAS Practice - Shared Anthropic client
+One pooled, thread-safe client per process, plus connection reuse counters
+"""
+
+import threading
+
+import anthropic
+
+try:
+    import httpx
+except ImportError:  # newer anthropic releases ship their httpx fork instead
+    import httpx2 as httpx
+
+import config
+import instrumentation
+
+
+class ConnectionStats:
+    """Thread-safe counters of HTTP requests and newly opened connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def on_request(self, request):
+        """httpx request hook: count the request, its retry and its connection."""
+        with self._lock:
+            self.requests += 1
+        instrumentation.count_attempt()
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+
+    def snapshot(self):
+        """Return the current counters as a dict."""
+        with self._lock:
+            requests, connections = self.requests, self.connections
+        reused = max(requests - connections, 0)
+        return {
+            "requests": requests,
+            "connections": connections,
+            "reused": reused,
+            "reuse_rate": reused / requests if requests else 0.0,
+        }
+
+
+stats = ConnectionStats()
+
+
+def create_client(api_key):
+    """Create an Anthropic client with pool limits, timeouts and retries from config."""
+    http_client = anthropic.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=config.API_MAX_CONNECTIONS,
+            max_keepalive_connections=config.API_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.API_KEEPALIVE_EXPIRY,
+        ),
+        event_hooks={"request": [stats.on_request]},
+    )
+    return anthropic.Anthropic(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=anthropic.Timeout(config.API_TIMEOUT, connect=config.API_CONNECT_TIMEOUT),
+        max_retries=config.API_MAX_RETRIES,
+    )
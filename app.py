@@ -4,15 +4,38 @@ Patient Responses Adapted to Clinical Technique in Calibrated Encounters
 """
 
 import streamlit as st
-import anthropic
+import hashlib
+import itertools
 import json
 import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
-# Configuration
-MODEL = "claude-sonnet-4-20250514"
-MAX_TOKENS = 500
+import api_client
+import config
+import instrumentation
+from admin import render_admin_page
+from background_jobs import StreamingJob
+from case_model import compile_case
+from case_repository import CaseRepository
+from response_cache import request_key, response_cache
+from request_scheduler import describe_error, is_model_unavailable, is_overloaded, request_tokens, scheduler
+from session_backend import create_backend
+from session_store import SessionStore
+from conversation_context import ConversationContext
+from conversation_tree import ConversationTree
+from elicitation import ElicitationTracker
+from patient_history import digest_prompt, follow_ups, parse_digest, pending_digests, render_digest
+from prompt_compaction import system_prompt_parts
+from warm_start import opener_pool
+
+# Configuration (models and token budgets are routed per call type in config.MODEL_ROUTES)
+STREAM_RESPONSES = True  # Render replies token-by-token as they arrive
+CHAT_PANE_MAX_TURNS = 8  # Turns chat_pane redraws before a full rerun moves them into the history
 
 # Page config
 st.set_page_config(
@@ -23,211 +46,361 @@ st.set_page_config(
 
 # Initialize session state
 if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "patient" not in st.session_state:
-    st.session_state.patient = None
-if "consultation" not in st.session_state:
-    st.session_state.consultation = None
+    st.session_state.messages = []  # The active branch of the conversation tree
+if "tree" not in st.session_state:
+    st.session_state.tree = ConversationTree()
+if "patient_id" not in st.session_state:
+    # Only ids are kept per session; the case itself is shared by every session (see current_case)
+    st.session_state.patient_id = None
+if "consultation_id" not in st.session_state:
+    st.session_state.consultation_id = None
 if "session_active" not in st.session_state:
     st.session_state.session_active = False
 if "feedback_shown" not in st.session_state:
     st.session_state.feedback_shown = False
 if "paused" not in st.session_state:
     st.session_state.paused = False
-if "last_exchange" not in st.session_state:
-    st.session_state.last_exchange = None
 if "user_feedback_given" not in st.session_state:
     st.session_state.user_feedback_given = False
 if "feedback_focus" not in st.session_state:
     st.session_state.feedback_focus = "Balanced"
+if "context" not in st.session_state:
+    st.session_state.context = None
+if "feedback_job" not in st.session_state:
+    st.session_state.feedback_job = None
+if "browser_id" not in st.session_state:
+    # Set as a cookie on the first visit (see remember_browser), so a session link only resumes in this browser
+    browser_cookie = st.context.cookies.get(config.BROWSER_COOKIE_NAME, "")
+    st.session_state.browser_cookie_set = isinstance(browser_cookie, str) and bool(
+        re.fullmatch(r"[0-9a-f]{32}", browser_cookie)
+    )
+    st.session_state.browser_id = browser_cookie if st.session_state.browser_cookie_set else uuid.uuid4().hex
+if "session_id" not in st.session_state:
+    # Carried in the URL so a session can be resumed by any worker
+    requested_id = st.query_params.get("session", "")
+    st.session_state.session_id = requested_id if re.fullmatch(r"[0-9a-f]{32}", requested_id) else uuid.uuid4().hex
+if "interview_id" not in st.session_state:
+    st.session_state.interview_id = None
 
 # Configuration - Feedback email
 FEEDBACK_EMAIL = "acrijnen@gmail.com"
 FEEDBACK_URL = f"mailto:{FEEDBACK_EMAIL}?subject=MAAS%20Practice%20Feedback&body=Patient%20practiced%3A%20%0A%0AWhat%20worked%3A%20%0A%0AWhat%20could%20be%20better%3A%20%0A"
 
 
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """Return the process-wide session store; it also receives call metrics."""
+    store = SessionStore(
+        config.SESSION_DB_PATH,
+        batch_size=config.SESSION_DB_BATCH_SIZE,
+        flush_interval=config.SESSION_DB_FLUSH_SECONDS,
+    )
+    instrumentation.add_sink(store.record_call)
+    return store
+
+
 def log_user_feedback(patient_id, consultation_id, feedback_text):
-    """Save user feedback to a local log file."""
-    log_path = Path(__file__).parent / "data" / "feedback_log.txt"
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-    entry = f"{timestamp} | {patient_id} | Consultation {consultation_id} | {feedback_text}\n"
-    try:
-        with open(log_path, "a") as f:
-            f.write(entry)
-    except Exception:
-        pass  # Don't break the app if logging fails
+    """Save user feedback to the session store."""
+    get_session_store().log_user_feedback(
+        patient_id, consultation_id, feedback_text, session_id=st.session_state.session_id
+    )
+
+
+def save_transcript(ended=False, feedback=None):
+    """Save the current interview's transcript to the session store."""
+    get_session_store().save_transcript(
+        st.session_state.interview_id,
+        st.session_state.patient_id,
+        st.session_state.consultation_id,
+        st.session_state.messages,
+        session_id=st.session_state.session_id,
+        focus=st.session_state.feedback_focus,
+        ended=ended,
+        feedback=feedback,
+    )
+
+
+def save_output(kind, content):
+    """Save a generated summary or feedback text to the session store."""
+    get_session_store().save_output(
+        st.session_state.interview_id,
+        st.session_state.patient_id,
+        st.session_state.consultation_id,
+        kind,
+        content,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_case_repository():
+    """Return the process-wide case repository shared by every session."""
+    data_dir = Path(__file__).parent / "data"
+    return CaseRepository(
+        data_dir / "patients",
+        data_dir / "prompts",
+        check_interval=config.CASE_RELOAD_CHECK_SECONDS,
+    )
+
+
+def current_case():
+    """Return this session's (patient, consultation), or (None, None) if none is selected.
+
+    The dicts come from the shared case repository and must not be modified.
+    """
+    patient_id = st.session_state.patient_id
+    if patient_id is None:
+        return None, None
+    repository = get_case_repository()
+    patient = repository.patient(patient_id)
+    consultation = repository.consultation(patient_id, st.session_state.consultation_id)
+    if patient is None or consultation is None:
+        return None, None
+    return patient, consultation
 
 
 def load_patients():
     """Load all available patients from data/patients folder."""
-    patients_dir = Path(__file__).parent / "data" / "patients"
-    patients = {}
-    if patients_dir.exists():
-        for patient_file in patients_dir.glob("*.json"):
-            with open(patient_file, "r") as f:
-                patient_data = json.load(f)
-                patients[patient_data["patient_id"]] = patient_data
-    return patients
-
-
-def load_prompt(prompt_name):
-    """Load a prompt from data/prompts folder."""
-    prompt_path = Path(__file__).parent / "data" / "prompts" / f"{prompt_name}.txt"
-    if prompt_path.exists():
-        with open(prompt_path, "r") as f:
-            return f.read()
-    return ""
-
-
-def load_introduction():
-    """Load the introduction text."""
-    intro_path = Path(__file__).parent.parent / "APP-INTRODUCTION.md"
-    if intro_path.exists():
-        with open(intro_path, "r") as f:
-            content = f.read()
-            # Remove the header and trailing separator for display
-            lines = content.split('\n')
-            # Skip first line (# header) and last lines (--- and Ready?)
-            return '\n'.join(lines[2:-3])
-    return ""
-
-
-def build_system_prompt(patient, consultation):
-    """Build the complete system prompt for patient simulation."""
-    base_prompt = load_prompt("patient-simulation")
-
-    # Build follow-up context if applicable
-    follow_up_context = ""
-    if consultation.get("for_follow_up"):
-        fu = consultation["for_follow_up"]
-        follow_up_context = f"""
-## Follow-Up Context
+    return get_case_repository().patients()
 
-**Previous consultation:** {fu.get('previous_consultation_summary', 'N/A')}
 
-**What was recommended:**
-{json.dumps(fu.get('what_was_recommended', []), indent=2)}
+def load_catalogue():
+    """Load sidebar metadata for all patients without parsing their case files."""
+    return get_case_repository().catalogue_entries()
 
-**What patient remembers:**
-{json.dumps(fu.get('what_patient_remembers', []), indent=2)}
 
-**What patient forgot:**
-{json.dumps(fu.get('what_patient_forgot', []), indent=2)}
-
-**Interval since last visit:** {fu.get('interval', {}).get('duration', 'N/A')}
-**Symptom evolution:** {fu.get('interval', {}).get('symptom_evolution', 'N/A')}
-**Compliance:** {fu.get('interval', {}).get('compliance', {}).get('details', 'N/A')}
-**Patient experience during interval:** {fu.get('interval', {}).get('patient_experience', 'N/A')}
-"""
-        if fu.get('results'):
-            follow_up_context += f"""
-**Test results to discuss:**
-{json.dumps(fu['results'].get('tests', {}), indent=2)}
-
-**How to explain results:** {fu['results'].get('how_to_explain', 'N/A')}
-"""
-
-    # Build ICE section
-    ice = consultation.get('ideas_concerns_expectations', {})
+# Session state that is checkpointed
+CHECKPOINT_KEYS = (
+    "patient_id", "consultation_id", "session_active", "feedback_shown", "paused", "user_feedback_given",
+    "user_feedback_text", "feedback_focus", "feedback", "interview_id", "system_message", "feedback_mark",
+)
 
-    system_prompt = f"""{base_prompt}
 
-## Patient Identity (Constant)
+@st.cache_resource(show_spinner=False)
+def get_session_backend():
+    """Return the process-wide backend that session checkpoints are kept in."""
+    return create_backend(
+        config.SESSION_BACKEND,
+        sqlite_path=config.SESSION_DB_PATH,
+        redis_url=config.SESSION_REDIS_URL,
+        ttl=config.SESSION_STATE_TTL_SECONDS,
+    )
 
-**Name:** {patient['patient']['name']}
-**Age:** {patient['patient']['age']} years old
-**Gender:** {patient['patient']['gender']}
-**Occupation:** {patient['patient']['occupation']}
-**Education:** {patient['patient']['education_level']}
 
-**Personality:**
-- Style: {patient['patient']['personality']['baseline_style']}
-- Trust building: {patient['patient']['personality']['trust_building']}
-- Core traits: {patient['patient']['personality']['core_traits']}
+def browser_owner():
+    """Fingerprint of this browser's cookie, stored with its checkpoints (never the cookie itself)."""
+    return hashlib.sha256(st.session_state.browser_id.encode()).hexdigest()[:32]
 
-## Background
 
-**Living situation:** {patient['background']['living_situation']}
-**Family:** {patient['background']['family']}
-**Support system:** {patient['background']['support_system']}
-**Work context:** {patient['background']['work_context']}
+def student_id():
+    """Who a student's own visits are kept for (see previous_visit), never taken from the session link.
 
-## Medical History at This Point
+    The signed-in account when the app is set up with st.login, otherwise
+    this browser: the maas_browser cookie, shared by all its tabs.
+    """
+    if st.user.get("is_logged_in") and st.user.get("email"):
+        return "user:" + hashlib.sha256(st.user.get("email").lower().encode()).hexdigest()[:32]
+    return "browser:" + browser_owner()
 
-**Past medical:** {json.dumps(patient['baseline_medical_history'].get('past_medical', []))}
-**Current medications:** {json.dumps(consultation['history_at_this_point'].get('current_medications', []))}
-**Allergies:** {json.dumps(patient['baseline_medical_history'].get('allergies', []))}
-**Family history:** {json.dumps(patient['baseline_medical_history'].get('family_history', []))}
-**Smoking:** {patient['baseline_medical_history']['social_history'].get('smoking', 'N/A')}
-**Alcohol:** {patient['baseline_medical_history']['social_history'].get('alcohol', 'N/A')}
 
-## This Consultation
+def remember_browser():
+    """Set the browser cookie on a first visit; the app can only read cookies, so a script sets it."""
+    if st.session_state.browser_cookie_set:
+        return
+    st.session_state.browser_cookie_set = True
+    max_age = config.BROWSER_COOKIE_DAYS * 24 * 60 * 60
+    st.html(
+        f"<script>document.cookie = '{config.BROWSER_COOKIE_NAME}={st.session_state.browser_id}; "
+        f"max-age={max_age}; path=/; SameSite=Lax';</script>",
+        unsafe_allow_javascript=True,
+    )
+
+
+def session_snapshot():
+    """Return the checkpointed part of this session as a JSON-serialisable dict."""
+    snapshot = {key: st.session_state.get(key) for key in CHECKPOINT_KEYS}
+    snapshot["owner"] = browser_owner()
+    snapshot["tree"] = st.session_state.tree.to_dict()
+    context = st.session_state.context
+    if context is not None:
+        snapshot["context"] = [st.session_state.interview_id, context.summary, context.summarized_upto]
+    else:
+        snapshot["context"] = st.session_state.get("context_snapshot")
+    return snapshot
 
-**Setting:** {consultation['scenario']['time_context']}
-**Appearance:** {consultation['scenario']['appearance']}
-**Emotional state:** {consultation['scenario']['emotional_state']}
-**Trust level:** {consultation['scenario']['trust_level']}
 
-## Presenting Problem
+def resume_session():
+    """Restore this session from its last checkpoint (once per browser session)."""
+    if st.session_state.get("session_resumed"):
+        return
+    st.session_state.session_resumed = True
+    st.query_params["session"] = st.session_state.session_id
+    try:
+        snapshot = get_session_backend().load(st.session_state.session_id)
+    except Exception:
+        return  # Start fresh rather than fail if the backend is unavailable
+    if not snapshot:
+        return
+    if snapshot.get("owner") not in (None, browser_owner()):
+        # The link was opened in another browser: start a new session rather than take this one over
+        st.session_state.session_id = uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
+        st.session_state.session_notice = "That session link belongs to another browser, so a new session was started."
+        return
 
-**Stated reason:** {consultation['presenting_problem']['stated_reason']}
-**Real reason:** {consultation['presenting_problem']['real_reason']}
-**Hidden agenda:** {consultation['presenting_problem'].get('hidden_agenda', 'None')}
+    version = snapshot.pop("version", 0)
+    if snapshot.get("patient_id") is not None:
+        repository = get_case_repository()
+        if repository.consultation(snapshot["patient_id"], snapshot["consultation_id"]) is None:
+            return  # The case was removed since the checkpoint
+    for key in CHECKPOINT_KEYS:
+        if key in snapshot:
+            st.session_state[key] = snapshot[key]
+    st.session_state.tree = ConversationTree.from_dict(snapshot.get("tree") or {})
+    st.session_state.messages = st.session_state.tree.messages()
+    st.session_state.context = None
+    st.session_state.context_snapshot = snapshot.get("context")
+    st.session_state.checkpoint_version = version
+    st.session_state.checkpoint_digest = checkpoint_digest(json.dumps(snapshot, sort_keys=True))
+
+
+def new_conversation():
+    """Start an empty conversation tree."""
+    st.session_state.tree = ConversationTree()
+    st.session_state.messages = []
+    st.session_state.elicitation = None
+    st.session_state.feedback_mark = None
 
-## Ideas, Concerns, Expectations
 
-**Ideas (what patient thinks):** {ice.get('ideas', 'N/A')}
-**Concerns (what patient fears):** {ice.get('concerns', 'N/A')}
-**Expectations (what patient wants):** {ice.get('expectations', 'N/A')}
+def add_turn(role, content):
+    """Append a turn to the active branch."""
+    st.session_state.messages.append(st.session_state.tree.append(role, content))
 
-## Clinical Information
 
-**Chief Complaint:** {consultation['complaint']['chief_complaint']}
+def switch_branch(node):
+    """Make another attempt the active branch; no turn is regenerated."""
+    tree = st.session_state.tree
+    context = st.session_state.context
+    if context is not None and tree.common_prefix(node, tree.head) < context.summarized_upto:
+        context.reset()  # The summary covers turns that aren't on the new branch
+    tree.switch(node)
+    st.session_state.messages = tree.messages()
 
-**Heuristic 1 - Nature:**
-{json.dumps(consultation['complaint']['heuristic_1_nature'], indent=2)}
 
-**Heuristic 2 - Time:**
-{json.dumps(consultation['complaint']['heuristic_2_time'], indent=2)}
+def branch_label(tree, number, node):
+    """Sidebar label for one attempt."""
+    messages = tree.messages(node)
+    last_question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    if len(last_question) > 40:
+        last_question = last_question[:40] + "…"
+    exchanges = len(messages) // 2
+    return f"Attempt {number}: {exchanges} exchange{'' if exchanges == 1 else 's'} — \"{last_question}\""
 
-**Heuristic 3 - Modifiers:**
-{json.dumps(consultation['complaint']['heuristic_3_modifiers'], indent=2)}
 
-**Heuristic 4 - Accompanying:**
-{json.dumps(consultation['complaint']['heuristic_4_accompanying'], indent=2)}
-{follow_up_context}
+def checkpoint_digest(data):
+    """Fingerprint of a serialised checkpoint (kept instead of a copy of it)."""
+    return hashlib.sha1(data.encode()).hexdigest()
 
-## Red Flags
 
-**Present:** {json.dumps(consultation['red_flags'].get('present', []))}
-**Absent:** {json.dumps(consultation['red_flags'].get('absent', []))}
-**Notes:** {consultation['red_flags'].get('notes', '')}
+def checkpoint_session():
+    """Save this session's state to the session backend if it changed.
 
-## Information Reveal Rules
+    If another tab or worker saved the same session since this one last
+    loaded or saved it, nothing is saved and the student is asked to reload.
+    """
+    if not st.session_state.get("session_resumed") or st.session_state.get("checkpoint_conflict"):
+        return
+    snapshot = session_snapshot()
+    digest = checkpoint_digest(json.dumps(snapshot, sort_keys=True))
+    if digest == st.session_state.get("checkpoint_digest"):
+        return
+    version = st.session_state.get("checkpoint_version", 0)
+    try:
+        saved = get_session_backend().save(st.session_state.session_id, snapshot, version)
+    except Exception:
+        return  # Checkpointing must never break a consultation
+    if not saved:
+        st.session_state.checkpoint_conflict = True
+        return
+    st.session_state.checkpoint_version = version + 1
+    st.session_state.checkpoint_digest = digest
 
-**Freely shared (volunteer without prompting):**
-{json.dumps(consultation['simulation_guidance']['information_reveal']['freely_shared'], indent=2)}
 
-**If asked directly:**
-{json.dumps(consultation['simulation_guidance']['information_reveal']['if_asked_directly'], indent=2)}
+def load_prompt(prompt_name):
+    """Load a prompt from data/prompts folder."""
+    return get_case_repository().prompt(prompt_name)
 
-**If asked sensitively (requires trust):**
-{json.dumps(consultation['simulation_guidance']['information_reveal']['if_asked_sensitively'], indent=2)}
 
-**Will not share (protect until significant rapport):**
-{json.dumps(consultation['simulation_guidance']['information_reveal']['will_not_share'], indent=2)}
+def load_introduction():
+    """Load the introduction text."""
+    intro_path = Path(__file__).parent.parent / "APP-INTRODUCTION.md"
+    if intro_path.exists():
+        with open(intro_path, "r") as f:
+            content = f.read()
+            # Remove the header and trailing separator for display
+            lines = content.split('\n')
+            # Skip first line (# header) and last lines (--- and Ready?)
+            return '\n'.join(lines[2:-3])
+    return ""
 
-**Emotional moments (topics that trigger emotion):**
-{json.dumps(consultation['simulation_guidance'].get('emotional_moments', []), indent=2)}
 
-## Guardrails
-{json.dumps(consultation['simulation_guidance']['guardrails'], indent=2)}
+def prompt_mtime(prompt_name):
+    """Return the modification time of a prompt file (0 if missing)."""
+    return get_case_repository().prompt_mtime(prompt_name)
 
----
 
-You are now {patient['patient']['name']}. Respond only as this patient. Wait for the student to speak first.
-"""
-    return system_prompt
+def build_system_prompt(patient, consultation):
+    """Build the complete system prompt for patient simulation."""
+    base_prompt, case_prompt = system_prompt_parts(
+        load_prompt("patient-simulation"), get_compiled_case(patient, consultation)
+    )
+    return f"{base_prompt}\n\n{case_prompt}"
+
+
+def get_compiled_case(patient, consultation):
+    """Return the compiled, pre-rendered case for a consultation.
+
+    Cases from data/patients are compiled once when loaded; any other
+    patient dict is compiled on the fly.
+    """
+    compiled = get_case_repository().compiled(patient["patient_id"], consultation["consultation_id"])
+    if compiled is None:
+        compiled = compile_case(patient, consultation)
+    return compiled
+
+
+def cached_block(text):
+    """Wrap text in a system content block marked for prompt caching."""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _system_blocks(patient_id, consultation_id, case_signature, base_mtime, carried, _patient, _consultation):
+    """Memoised system blocks, keyed by case ids, patient and prompt file signatures and carried-forward variant."""
+    base_prompt, case_prompt = system_prompt_parts(
+        load_prompt("patient-simulation"), get_compiled_case(_patient, _consultation), carried
+    )
+    return [cached_block(base_prompt), cached_block(case_prompt)]
+
+
+def build_system_blocks(patient, consultation, carried=False):
+    """Build the patient simulation system prompt as cache-marked blocks.
+
+    The static base prompt and the per-consultation case block each get their
+    own cache breakpoint, so the base prompt is shared across every case of
+    the same kind (initial or follow-up) and the case block is reused across
+    every turn of a consultation. ``carried`` leaves the authored previous
+    visit out of a follow-up's case block, for a student whose own previous
+    visit is sent instead (see previous_visit).
+    """
+    return _system_blocks(
+        patient["patient_id"],
+        consultation["consultation_id"],
+        get_case_repository().patient_signature(patient["patient_id"]),
+        prompt_mtime("patient-simulation"),
+        carried,
+        patient,
+        consultation,
+    )
 
 
 def get_api_key():
@@ -243,31 +416,360 @@ def get_api_key():
             return os.environ.get("ANTHROPIC_API_KEY")
 
 
-def get_patient_response(messages, system_prompt):
-    """Get response from Claude API."""
+class MissingAPIKeyError(RuntimeError):
+    """Raised when no Anthropic API key is configured."""
+
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    """Return the process-wide Anthropic client shared by every session.
+
+    Failures are not cached, so a key added later is picked up on the next call.
+    """
     api_key = get_api_key()
     if not api_key:
-        return "Error: ANTHROPIC_API_KEY not set. Please set the environment variable."
+        raise MissingAPIKeyError("ANTHROPIC_API_KEY not set. Please set the environment variable.")
+    return api_client.create_client(api_key)
+
+
+class GenerationError(str):
+    """Error text returned in place of generated output: shown to the student, never stored as output."""
+
+
+FEEDBACK_CALL_TYPES = {"interim": "interim_feedback", "advice": "advice", "full": "full_feedback"}
+
+
+def case_tags(patient, consultation):
+    """Metric tags identifying the case a call belongs to."""
+    return {"patient_id": patient["patient_id"], "consultation_id": consultation["consultation_id"]}
+
+
+def model_route(call_type):
+    """Model settings for a call type: config.DEFAULT_ROUTE overridden by config.MODEL_ROUTES."""
+    return {**config.DEFAULT_ROUTE, **config.MODEL_ROUTES.get(call_type, {})}
+
+
+# Models the API has answered not_found for in this process; their routes go straight to the fallback
+unavailable_models = set()
+
+
+def model_request(call_type, system, messages):
+    """Build a Messages API request with the model, max_tokens, temperature and timeout routed for call_type."""
+    route = model_route(call_type)
+    model = route["model"]
+    if model in unavailable_models and route.get("fallback"):
+        model = route["fallback"]
+    request = {
+        "model": model,
+        "max_tokens": route["max_tokens"],
+        "system": system,
+        "messages": messages,
+    }
+    if route.get("temperature") is not None:
+        request["temperature"] = route["temperature"]
+    if route.get("timeout"):
+        request["timeout"] = route["timeout"]
+    return request
+
+
+def fallback_request(request, call_type, error):
+    """The same request for the call type's fallback model if ``error`` calls for one, else None.
+
+    Overload and timeouts call for one, and so does a model the API doesn't
+    know (retired or misspelt), which is remembered so later requests skip it.
+    """
+    fallback = model_route(call_type).get("fallback")
+    if not fallback or fallback == request["model"]:
+        return None
+    if is_model_unavailable(error):
+        unavailable_models.add(request["model"])
+    elif not is_overloaded(error):
+        return None
+    return {**request, "model": fallback}
+
 
+def create_message(request, call_type, tags=None, client=None):
+    """Send a blocking request through the scheduler and return its text, recording call metrics.
+
+    Call types enabled in the response cache are answered from it when
+    possible. An overloaded, timed-out or unavailable model is retried with
+    the route's fallback model.
+    """
+    cache_key = request_key(request, call_type) if response_cache.enabled(call_type) else None
+    if cache_key:
+        cached = response_cache.get(cache_key, call_type)
+        if cached is not None:
+            return cached
+    current = [request]
+
+    def send():
+        try:
+            return client.messages.create(**current[0])
+        except Exception as e:
+            fallback = fallback_request(current[0], call_type, e)
+            if fallback is None:
+                raise
+            current[0] = fallback
+            if not is_model_unavailable(e):
+                raise  # Retried by the scheduler after a backoff
+        return client.messages.create(**current[0])  # An unavailable model won't come back; switch now
+
+    with instrumentation.record_call(call_type, request["model"], tags) as call:
+        client = client or get_client()
+        response = scheduler.run(send, call_type, request_tokens(request))
+        call.set_usage(response.usage, response.model)
+    text = response.content[0].text
+    if cache_key and current[0] is request:  # Fallback replies aren't cached
+        response_cache.put(cache_key, call_type, text)
+    return text
+
+
+def get_patient_response(messages, system_prompt, tags=None):
+    """Get response from Claude API.
+
+    Errors are raised, never returned, so they can't appear as the patient's words.
+    """
+    return create_message(patient_request(messages, system_prompt), "patient_turn", tags)
+
+
+@st.cache_resource(show_spinner=False)
+def get_background_executor():
+    """Return the process-wide worker pool for background model calls."""
+    return ThreadPoolExecutor(max_workers=config.BACKGROUND_WORKERS, thread_name_prefix="maas-bg")
+
+
+def summarize_turns(client, patient, consultation, previous_summary, messages):
+    """Fold older consultation turns into the running summary."""
+    earlier = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+    request = model_request(
+        "context_summary",
+        "You condense medical consultation transcripts so a simulated patient can stay consistent.",
+        [{
+            "role": "user",
+            "content": f"""{earlier}Next part of the consultation:
+{build_transcript(patient, messages)}
+
+Update the summary to cover everything above in a few short bullet points: what the student asked, what {patient['patient']['name']} has already told them, anything held back, and how trust and mood have changed. Reply with the summary only."""
+        }],
+    )
+    return create_message(request, "context_summary", case_tags(patient, consultation), client)
+
+
+def get_conversation_context(patient, consultation):
+    """Return this session's bounded conversation context, creating it if needed."""
+    if st.session_state.context is None:
+        client = get_client()
+        st.session_state.context = ConversationContext(
+            lambda summary, messages: summarize_turns(client, patient, consultation, summary, messages),
+            get_background_executor(),
+            keep_exchanges=config.CONTEXT_KEEP_EXCHANGES,
+            fold_batch=config.CONTEXT_FOLD_BATCH,
+            token_budget=config.CONTEXT_TOKEN_BUDGET,
+        )
+        saved = st.session_state.pop("context_snapshot", None)
+        if saved and saved[0] == st.session_state.interview_id:
+            st.session_state.context.restore(saved[1], saved[2])
+    return st.session_state.context
+
+
+def prepare_patient_turn(patient, consultation, messages):
+    """Return (system prompt, messages) to send for the next patient reply.
+
+    Older turns are replaced by a running summary appended to the system
+    prompt; the full message list is left untouched for the UI and transcript.
+    """
+    carried = previous_visit(patient, consultation)
+    system_prompt = build_system_blocks(patient, consultation, carried is not None)
+    if carried is not None:
+        system_prompt = system_prompt + [cached_block(carried)]
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=MAX_TOKENS,
-            system=system_prompt,
-            messages=messages
+        summary, window = get_conversation_context(patient, consultation).prepare(messages)
+    except MissingAPIKeyError:
+        return system_prompt, messages
+    if summary:
+        system_prompt = system_prompt + [cached_block(f"## Earlier in This Consultation\n\n{summary}")]
+    return system_prompt, window
+
+
+class ResponseStream:
+    """Iterable of text chunks from a streamed API call.
+
+    The call waits for a scheduler slot and holds it until the stream ends;
+    transient failures before the first token are retried (on the route's
+    fallback model after overload, a timeout or an unavailable model).
+    Replies found in the response cache are yielded at once without a call.
+    Any other error ends the iteration and is kept in ``error`` so the
+    caller can decide how to show it. Pass ``client`` when iterating off the
+    script thread.
+    """
+
+    def __init__(self, request, client=None, call_type="patient_turn", tags=None):
+        self.request = request
+        self.client = client
+        self.call_type = call_type
+        self.tags = tags
+        self.error = None
+
+    def __iter__(self):
+        cache_key = request_key(self.request, self.call_type) if response_cache.enabled(self.call_type) else None
+        if cache_key:
+            cached = response_cache.get(cache_key, self.call_type)
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        request = self.request
+        tokens = request_tokens(request)
+        with instrumentation.record_call(self.call_type, request["model"], self.tags, stream=True) as call:
+            for attempt in itertools.count():
+                started = False
+                try:
+                    client = self.client or get_client()
+                    with scheduler.slot(self.call_type, tokens):
+                        with client.messages.stream(**request) as stream:
+                            for text in stream.text_stream:
+                                started = True
+                                call.first_token()
+                                chunks.append(text)
+                                yield text
+                            final = stream.get_final_message()
+                            call.set_usage(final.usage, final.model)
+                    if cache_key and request is self.request:  # Fallback replies aren't cached
+                        response_cache.put(cache_key, self.call_type, "".join(chunks))
+                    return
+                except Exception as e:
+                    # Text already shown can't be taken back, so only retry before the first token
+                    fallback = None if started else fallback_request(request, self.call_type, e)
+                    if fallback is not None and is_model_unavailable(e):
+                        delay = 0.0  # An unavailable model won't come back; switch now
+                    else:
+                        delay = None if started else scheduler.retry_delay(e, attempt)
+                    if delay is not None:
+                        request = fallback or request
+                    if delay is None:
+                        call.fail(e)
+                        self.error = describe_error(e)
+                        return
+                time.sleep(delay)
+
+
+def patient_request(messages, system_prompt):
+    """Build the API request for the next patient reply."""
+    return model_request("patient_turn", system_prompt, messages)
+
+
+def stream_patient_response(messages, system_prompt, tags=None):
+    """Stream the next patient reply token-by-token."""
+    return ResponseStream(patient_request(messages, system_prompt), tags=tags)
+
+
+def warm_start_case(case):
+    """Load and compile one consultation and build its system prompt (a warm-up step)."""
+    repository = get_case_repository()
+    patient = repository.patient(case[0])
+    consultation = repository.consultation(*case)
+    if patient is None or consultation is None:
+        return None
+    build_system_blocks(patient, consultation)
+    return patient, consultation
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_start():
+    """Start the warm-up once per server process (see warm_start) and return the opener pool."""
+    if not config.WARM_START_ENABLED:
+        return opener_pool
+    try:
+        client = get_client()
+    except MissingAPIKeyError:
+        client = None  # Still compile every case; openers need the API
+
+    def generate(patient, consultation, greeting):
+        if client is None:
+            return None
+        request = patient_request([{"role": "user", "content": greeting}], build_system_blocks(patient, consultation))
+        return create_message(request, "warm_start", case_tags(patient, consultation), client)
+
+    cases = [
+        (patient_id, c["consultation_id"])
+        for patient_id, entry in get_case_repository().catalogue_entries().items()
+        for c in entry["consultations"]
+    ]
+    return opener_pool.start(cases, warm_start_case, generate, workers=config.WARM_START_WORKERS)
+
+
+def warm_opener(patient, consultation, text):
+    """A pre-generated patient reply to a common opening greeting, or None."""
+    if not config.WARM_START_ENABLED or previous_visit(patient, consultation) is not None:
+        return None  # Openers were generated with the case file's own account of the previous visit
+    with instrumentation.record_call("patient_turn_opener", "local", case_tags(patient, consultation)) as call:
+        opener = opener_pool.match(
+            (patient["patient_id"], consultation["consultation_id"]), text, [patient["patient"]["name"]]
         )
-        return response.content[0].text
-    except Exception as e:
-        return f"Error: {str(e)}"
+        if opener is None:
+            call.skip()  # Only openers actually served count as calls
+    return opener
 
 
-def generate_feedback(patient, consultation, messages, feedback_type="full", focus="Balanced"):
-    """Generate feedback on the consultation based on focus setting."""
-    api_key = get_api_key()
-    if not api_key:
-        return "Error: ANTHROPIC_API_KEY not set."
+def build_transcript(patient, messages):
+    """Render the conversation as plain "Speaker: text" lines."""
+    return "\n".join([
+        f"{'Student' if m['role'] == 'user' else patient['patient']['name']}: {m['content']}"
+        for m in messages
+    ])
+
+
+def get_elicitation(patient, consultation, messages):
+    """Return this session's elicitation tracker, brought up to date with ``messages``."""
+    hints = get_compiled_case(patient, consultation).hints
+    tracker = st.session_state.get("elicitation")
+    if tracker is None or tracker.hints is not hints:
+        tracker = st.session_state.elicitation = ElicitationTracker(hints)
+    return tracker.update(messages)
+
 
+def transcript_progress(patient, consultation, messages, mark=False):
+    """(elicitation digest, first message to send) for a long consultation, else None.
+
+    The turns sent are those since the last interim feedback or summary
+    (``mark=True`` records this call as one), and never fewer than
+    config.FEEDBACK_RECENT_EXCHANGES exchanges.
+    """
+    seen, previous_start = st.session_state.get("feedback_mark") or (0, 0)
+    if seen > len(messages):
+        seen, previous_start = 0, 0
+    if seen == len(messages):
+        start = previous_start  # Nothing new: send the same request again (a response cache hit)
+    else:
+        start = max(0, min(seen, len(messages) - 2 * config.FEEDBACK_RECENT_EXCHANGES))
+        start -= start % 2  # Begin on a student turn
+    if mark:
+        st.session_state.feedback_mark = [len(messages), start]
+    if len(messages) < 2 * config.FEEDBACK_DIGEST_AFTER_EXCHANGES:
+        return None
+    return get_elicitation(patient, consultation, messages).digest(), start
+
+
+def transcript_sections(patient, messages, progress=None):
+    """The transcript part of a feedback or summary prompt (see transcript_progress)."""
+    if progress is None:
+        return f"## Transcript\n{build_transcript(patient, messages)}"
+    digest, start = progress
+    return f"""## Elicited So Far (exchange first covered)
+{digest}
+
+## Latest Turns (from exchange {start // 2 + 1} of {(len(messages) + 1) // 2})
+{build_transcript(patient, messages[start:])}"""
+
+
+def feedback_request(patient, consultation, messages, feedback_type="full", focus="Balanced", alternatives=None,
+                     progress=None):
+    """Build the API request for feedback based on focus setting.
+
+    ``alternatives`` are earlier attempts the student redid with "again"
+    (see ConversationTree.alternatives); full feedback compares them.
+    ``progress`` replaces the full transcript with a digest and recent turns.
+    """
     # Select prompt based on feedback focus
     if focus == "Interview skills":
         feedback_prompt = load_prompt("feedback-interviewing")
@@ -280,11 +782,8 @@ def generate_feedback(patient, consultation, messages, feedback_type="full", foc
     if not feedback_prompt:
         feedback_prompt = load_prompt("feedback-generation")
 
-    # Build transcript
-    transcript = "\n".join([
-        f"{'Student' if m['role'] == 'user' else patient['patient']['name']}: {m['content']}"
-        for m in messages
-    ])
+    transcript = transcript_sections(patient, messages, progress)
+    compiled = get_compiled_case(patient, consultation)
 
     if feedback_type == "interim":
         instruction = "Provide brief interim feedback on how the consultation is going so far. Focus on 2-3 specific observations about technique."
@@ -293,61 +792,166 @@ def generate_feedback(patient, consultation, messages, feedback_type="full", foc
     else:
         instruction = "Provide complete MAAS-mapped feedback on this consultation."
 
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=1500 if feedback_type == "full" else 500,
-            system=feedback_prompt if feedback_prompt else "You are a medical education expert providing feedback on consultation skills.",
-            messages=[{
-                "role": "user",
-                "content": f"""
+    retried = ""
+    if alternatives and feedback_type == "full":
+        retried = "\n## Earlier Attempts (redone with \"again\")\n"
+        for number, turns in enumerate(alternatives, 1):
+            retried += f"\n### Attempt {number}\n{build_transcript(patient, turns)}\n"
+        instruction += " Briefly compare the earlier attempts with what the student did instead."
+
+    return model_request(
+        FEEDBACK_CALL_TYPES.get(feedback_type, "full_feedback"),
+        [cached_block(feedback_prompt if feedback_prompt else "You are a medical education expert providing feedback on consultation skills.")],
+        [{
+            "role": "user",
+            "content": f"""
 ## Case: {consultation['title']}
 
 ## Learning Objectives
-{json.dumps(consultation.get('learning_objectives', []), indent=2)}
+{compiled.objectives_json}
 
 ## MAAS Focus
-{json.dumps(consultation.get('maas_focus', {}), indent=2)}
+{compiled.maas_focus_json}
 
-## Transcript
 {transcript}
-
+{retried}
 {instruction}
 """
-            }]
+        }],
+    )
+
+
+def generate_feedback(patient, consultation, messages, feedback_type="full", focus="Balanced", alternatives=None,
+                      progress=None):
+    """Generate feedback on the consultation based on focus setting."""
+    try:
+        return create_message(
+            feedback_request(patient, consultation, messages, feedback_type, focus, alternatives, progress),
+            FEEDBACK_CALL_TYPES.get(feedback_type, "full_feedback"),
+            case_tags(patient, consultation)
         )
-        return response.content[0].text
     except Exception as e:
-        return f"Error generating feedback: {str(e)}"
+        return GenerationError(f"Error generating feedback: {describe_error(e)}")
 
 
-def generate_summary(patient, consultation, messages):
-    """Generate a learning summary for the consultation."""
-    api_key = get_api_key()
-    if not api_key:
-        return "Error: ANTHROPIC_API_KEY not set."
+def stream_feedback(patient, consultation, messages, feedback_type="full", focus="Balanced", alternatives=None,
+                    progress=None):
+    """Stream feedback on the consultation token-by-token."""
+    return ResponseStream(
+        feedback_request(patient, consultation, messages, feedback_type, focus, alternatives, progress),
+        call_type=FEEDBACK_CALL_TYPES.get(feedback_type, "full_feedback"),
+        tags=case_tags(patient, consultation)
+    )
 
-    transcript = "\n".join([
-        f"{'Student' if m['role'] == 'user' else patient['patient']['name']}: {m['content']}"
-        for m in messages
-    ])
 
+def start_feedback_job(patient, consultation, messages, focus="Balanced", alternatives=None):
+    """Start the end-of-session feedback call on a background worker.
+
+    Returns None if no client is available; the feedback screen then falls
+    back to generating feedback in the foreground and reports the error.
+    """
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=1000,
-            system="You are a medical education expert. Provide a concise learning summary.",
-            messages=[{
-                "role": "user",
-                "content": f"""
+        client = get_client()
+    except MissingAPIKeyError:
+        return None
+    request = feedback_request(patient, consultation, list(messages), "full", focus, alternatives)
+    stream = ResponseStream(request, client, "full_feedback", case_tags(patient, consultation))
+    return StreamingJob(stream).start(get_background_executor())
+
+
+def cancel_feedback_job():
+    """Cancel this session's background feedback job, if any."""
+    if st.session_state.feedback_job is not None:
+        st.session_state.feedback_job.cancel()
+        st.session_state.feedback_job = None
+
+
+def visit_digest_request(patient, consultation, messages, earlier=None):
+    """Build the API request that condenses a finished visit for its follow-up (see patient_history)."""
+    return model_request(
+        "visit_digest",
+        "You keep a simulated patient's memory of their visits to the doctor accurate and brief.",
+        [{"role": "user", "content": digest_prompt(patient, consultation, build_transcript(patient, messages), earlier)}],
+    )
+
+
+def start_visit_digest(patient, consultation, messages):
+    """Condense this visit for the consultations that follow on from it, on a background worker.
+
+    Only cases with a follow-up get a digest. It is stored for this student
+    (see student_id) and replaces an earlier digest of the same case.
+    """
+    if not config.CARRY_FORWARD_ENABLED or not messages or not follow_ups(patient, consultation["consultation_id"]):
+        return
+    try:
+        client = get_client()
+    except MissingAPIKeyError:
+        return
+    key = (student_id(), patient["patient_id"], consultation["consultation_id"])
+    interview_id = st.session_state.interview_id
+    previous_visit(patient, consultation)
+    carried = st.session_state.get("carried_visit")
+    earlier = carried[2] if carried and carried[0] == interview_id else None  # Folded into this digest
+    request = visit_digest_request(patient, consultation, list(messages), earlier)
+    store = get_session_store()
+
+    def compute():
+        digest = parse_digest(create_message(request, "visit_digest", case_tags(patient, consultation), client))
+        if digest is not None:
+            store.save_visit_digest(*key, interview_id, digest)
+            store.flush()  # Committed before pending_digests lets go of it, so a follow-up finds one or the other
+        return digest
+
+    pending_digests.add(key, get_background_executor().submit(compute))
+
+
+def previous_visit(patient, consultation):
+    """System block with this student's own previous visit for a follow-up, or None.
+
+    None means the case file's authored previous visit is used: the case
+    isn't a follow-up, or this student hasn't done the consultation it
+    follows on from. Looked up once per interview; a digest still being
+    computed in this process is waited for briefly.
+    """
+    previous_id = consultation.get("links_to")
+    if not config.CARRY_FORWARD_ENABLED or previous_id is None or not consultation.get("for_follow_up"):
+        return None
+    cached = st.session_state.get("carried_visit")  # [interview_id, block, digest]
+    if cached and cached[0] == st.session_state.interview_id:
+        return cached[1]
+    key = (student_id(), patient["patient_id"], previous_id)
+    digest = pending_digests.wait(key, config.CARRY_FORWARD_WAIT_SECONDS)
+    if digest is None:
+        try:
+            digest = get_session_store().visit_digest(*key)
+        except Exception:
+            digest = None  # The authored account still works
+    block = None
+    if digest is not None:
+        title = next(
+            (c["title"] for c in patient["consultations"] if c["consultation_id"] == previous_id), "your last visit"
+        )
+        block = render_digest(digest, title)
+    st.session_state.carried_visit = [st.session_state.interview_id, block, digest]
+    return block
+
+
+def summary_request(patient, consultation, messages, progress=None):
+    """Build the API request for a learning summary."""
+    transcript = transcript_sections(patient, messages, progress)
+    compiled = get_compiled_case(patient, consultation)
+
+    return model_request(
+        "summary",
+        "You are a medical education expert. Provide a concise learning summary.",
+        [{
+            "role": "user",
+            "content": f"""
 ## Case: {consultation['title']}
 
 ## Learning Objectives
-{json.dumps(consultation.get('learning_objectives', []), indent=2)}
+{compiled.objectives_json}
 
-## Transcript
 {transcript}
 
 Provide a brief summary of:
@@ -358,11 +962,27 @@ Provide a brief summary of:
 
 Keep it encouraging and practical.
 """
-            }]
+        }],
+    )
+
+
+def generate_summary(patient, consultation, messages, progress=None):
+    """Generate a learning summary for the consultation."""
+    try:
+        return create_message(
+            summary_request(patient, consultation, messages, progress), "summary", case_tags(patient, consultation)
         )
-        return response.content[0].text
     except Exception as e:
-        return f"Error generating summary: {str(e)}"
+        return GenerationError(f"Error generating summary: {describe_error(e)}")
+
+
+def stream_summary(patient, consultation, messages, progress=None):
+    """Stream a learning summary token-by-token."""
+    return ResponseStream(
+        summary_request(patient, consultation, messages, progress),
+        call_type="summary",
+        tags=case_tags(patient, consultation)
+    )
 
 
 def download_transcript(patient, consultation, messages, feedback=None):
@@ -378,9 +998,9 @@ Date: {timestamp}
 TRANSCRIPT
 ----------
 """
-    for m in messages:
-        role = "Student" if m["role"] == "user" else patient["patient"]["name"]
-        content += f"\n{role}: {m['content']}\n"
+    content += "".join(
+        f"\n{'Student' if m['role'] == 'user' else patient['patient']['name']}: {m['content']}\n" for m in messages
+    )
 
     if feedback:
         content += f"""
@@ -399,8 +1019,21 @@ Patient Responses Adapted to Clinical Technique in Calibrated Encounters
     return content
 
 
-def handle_command(command, patient, consultation, messages):
-    """Handle special commands from the user."""
+def local_hint(patient, consultation, messages):
+    """Instant hint from the case's own facts, or None when the model should give it."""
+    if not config.LOCAL_HINTS_ENABLED:
+        return None
+    with instrumentation.record_call("advice_local", "local", case_tags(patient, consultation)):
+        text, confidence = get_compiled_case(patient, consultation).hints.suggest(messages)
+    return text if text and confidence >= config.LOCAL_HINT_MIN_CONFIDENCE else None
+
+
+def handle_command(command, patient, consultation, messages, stream=False):
+    """Handle special commands from the user.
+
+    With ``stream=True`` the model-backed commands return a ResponseStream
+    instead of the finished text.
+    """
     cmd = command.lower().strip()
 
     if cmd == "pause":
@@ -408,22 +1041,34 @@ def handle_command(command, patient, consultation, messages):
         return "paused", "Take your time. Type anything when you're ready to continue."
 
     elif cmd == "feedback":
-        feedback = generate_feedback(patient, consultation, messages, "interim")
+        progress = transcript_progress(patient, consultation, messages, mark=True)
+        if stream:
+            return "feedback", stream_feedback(patient, consultation, messages, "interim", progress=progress)
+        feedback = generate_feedback(patient, consultation, messages, "interim", progress=progress)
         return "feedback", feedback
 
     elif cmd == "advice":
-        advice = generate_feedback(patient, consultation, messages, "advice")
+        hint = local_hint(patient, consultation, messages)
+        if hint:
+            return "advice", hint
+        progress = transcript_progress(patient, consultation, messages)
+        if stream:
+            return "advice", stream_feedback(patient, consultation, messages, "advice", progress=progress)
+        advice = generate_feedback(patient, consultation, messages, "advice", progress=progress)
         return "advice", advice
 
     elif cmd == "summary":
-        summary = generate_summary(patient, consultation, messages)
+        progress = transcript_progress(patient, consultation, messages, mark=True)
+        if stream:
+            return "summary", stream_summary(patient, consultation, messages, progress)
+        summary = generate_summary(patient, consultation, messages, progress)
         return "summary", summary
 
     elif cmd == "again":
-        if st.session_state.last_exchange:
-            # Remove the last exchange
-            if len(st.session_state.messages) >= 2:
-                st.session_state.messages = st.session_state.messages[:-2]
+        if len(st.session_state.messages) >= 2:
+            # Step back one exchange; the old attempt stays in the tree as another branch
+            st.session_state.tree.rewind(2)
+            st.session_state.messages = st.session_state.tree.messages()
             return "again", "Let's try that again. What would you like to say?"
         return "again", "Nothing to redo yet. Keep going."
 
@@ -431,143 +1076,183 @@ def handle_command(command, patient, consultation, messages):
 
 
 # Main app
-def main():
-    st.title("MAAS Practice")
-    st.caption("Patient Responses Adapted to Clinical Technique in Calibrated Encounters")
-
-    # Load available patients
-    patients = load_patients()
-
-    if not patients:
-        st.error("No patients found. Please add patient files to data/patients/")
-        return
-
-    # Sidebar for patient/consultation selection and controls
-    with st.sidebar:
-        st.header("Session Controls")
-
-        if not st.session_state.session_active:
-            # Patient selection
-            patient_options = {p["patient"]["name"]: p["patient_id"] for p in patients.values()}
-            selected_name = st.selectbox(
-                "Select a patient:",
-                options=list(patient_options.keys())
+def render_session_summary(patient, consultation):
+    """The sidebar header and the active session's details; returns the message count placeholder, or None.
+
+    Drawn outside render_sidebar so chat_pane can update the message count
+    without a full rerun.
+    """
+    st.header("Session Controls")
+    if not st.session_state.session_active:
+        return None
+    st.markdown(f"**Patient:** {patient['patient']['name']}")
+    st.markdown(f"**Consultation:** {consultation['title']}")
+    st.markdown(f"**Focus:** {st.session_state.feedback_focus}")
+    return st.empty()  # Filled by every chat_pane run
+
+
+@st.fragment
+def render_sidebar(patients, patient, consultation):
+    """Case selection and session controls; reruns without the chat when only they change."""
+    if not st.session_state.session_active:
+        # Patient selection
+        patient_options = {p["name"]: p["patient_id"] for p in patients.values()}
+        selected_name = st.selectbox(
+            "Select a patient:",
+            options=list(patient_options.keys())
+        )
+        selected_id = patient_options[selected_name]
+        selected_patient = patients[selected_id]
+
+        # Consultation selection for this patient
+        consultations = selected_patient["consultations"]
+        if consultations:
+            consultation_options = {
+                f"{c['consultation_id']}. {c['title']}": i
+                for i, c in enumerate(consultations)
+            }
+            selected_consultation_title = st.selectbox(
+                "Select a consultation:",
+                options=list(consultation_options.keys())
             )
-            selected_id = patient_options[selected_name]
-            selected_patient = patients[selected_id]
-
-            # Consultation selection for this patient
-            consultations = selected_patient.get("consultations", [])
-            if consultations:
-                consultation_options = {
-                    f"{c['consultation_id']}. {c['title']}": i
-                    for i, c in enumerate(consultations)
-                }
-                selected_consultation_title = st.selectbox(
-                    "Select a consultation:",
-                    options=list(consultation_options.keys())
-                )
-                selected_consultation_idx = consultation_options[selected_consultation_title]
-                selected_consultation = consultations[selected_consultation_idx]
-
-                # Show consultation info
-                st.markdown(f"**Difficulty:** {selected_consultation.get('difficulty', 'N/A')}")
-                st.markdown(f"**Duration:** ~{selected_consultation.get('estimated_duration_minutes', '?')} min")
-                st.markdown(f"**Type:** {selected_consultation.get('type', 'N/A')}")
-
-                if selected_consultation.get('learning_objectives'):
-                    st.markdown("**Learning objectives:**")
-                    for obj in selected_consultation['learning_objectives']:
-                        st.markdown(f"- {obj}")
-
-                st.divider()
-                st.markdown("**Feedback focus:**")
-                feedback_focus = st.radio(
-                    "What do you want to focus on?",
-                    options=["Interview skills", "Balanced", "Problem-solving"],
-                    index=1,
-                    help="This shapes the feedback you receive at the end.",
-                    label_visibility="collapsed"
-                )
+            selected_consultation_idx = consultation_options[selected_consultation_title]
+            selected_consultation = consultations[selected_consultation_idx]
 
-                if st.button("Start Interview", type="primary"):
-                    st.session_state.patient = selected_patient
-                    st.session_state.consultation = selected_consultation
-                    st.session_state.messages = []
-                    st.session_state.session_active = True
-                    st.session_state.feedback_shown = False
-                    st.session_state.paused = False
-                    st.session_state.last_exchange = None
-                    st.session_state.user_feedback_given = False
-                    st.session_state.user_feedback_text = None
-                    st.session_state.feedback_focus = feedback_focus
-                    st.rerun()
+            # Show consultation info
+            st.markdown(f"**Difficulty:** {selected_consultation.get('difficulty', 'N/A')}")
+            st.markdown(f"**Duration:** ~{selected_consultation.get('estimated_duration_minutes', '?')} min")
+            st.markdown(f"**Type:** {selected_consultation.get('type', 'N/A')}")
 
-        else:
-            # Active session controls
-            st.markdown(f"**Patient:** {st.session_state.patient['patient']['name']}")
-            st.markdown(f"**Consultation:** {st.session_state.consultation['title']}")
-            st.markdown(f"**Focus:** {st.session_state.feedback_focus}")
-            st.markdown(f"**Messages:** {len(st.session_state.messages)}")
+            if selected_consultation.get('learning_objectives'):
+                st.markdown("**Learning objectives:**")
+                for obj in selected_consultation['learning_objectives']:
+                    st.markdown(f"- {obj}")
 
             st.divider()
-            st.markdown("**Commands:**")
-            st.markdown("- `pause` - take time to think")
-            st.markdown("- `feedback` - how am I doing?")
-            st.markdown("- `advice` - I'm stuck")
-            st.markdown("- `summary` - what did I learn?")
-            st.markdown("- `again` - try that again")
-
-            st.divider()
-
-            if st.button("End Interview"):
-                st.session_state.session_active = False
-                st.rerun()
+            st.markdown("**Feedback focus:**")
+            feedback_focus = st.radio(
+                "What do you want to focus on?",
+                options=["Interview skills", "Balanced", "Problem-solving"],
+                index=1,
+                help="This shapes the feedback you receive at the end.",
+                label_visibility="collapsed"
+            )
 
-            if st.button("Restart"):
-                st.session_state.messages = []
+            if st.button("Start Interview", type="primary"):
+                repository = get_case_repository()
+                patient = repository.patient(selected_id)
+                consultation = repository.consultation(selected_id, selected_consultation["consultation_id"])
+                if patient is None or consultation is None:
+                    st.error("This case could not be loaded. Please pick another one.")
+                    st.stop()
+                cancel_feedback_job()
+                st.session_state.patient_id = selected_id
+                st.session_state.consultation_id = consultation["consultation_id"]
+                new_conversation()
+                st.session_state.context = None
+                st.session_state.interview_id = uuid.uuid4().hex
+                st.session_state.session_active = True
                 st.session_state.feedback_shown = False
                 st.session_state.paused = False
-                st.session_state.last_exchange = None
+                st.session_state.user_feedback_given = False
+                st.session_state.user_feedback_text = None
+                st.session_state.feedback_focus = feedback_focus
                 st.rerun()
 
-            if st.button("Different Patient"):
-                st.session_state.patient = None
-                st.session_state.consultation = None
-                st.session_state.messages = []
-                st.session_state.session_active = False
-                st.session_state.feedback_shown = False
-                st.session_state.paused = False
-                st.session_state.user_feedback_given = False
+    else:
+        # Attempts kept by "again"; switching between them needs no model call
+        tree = st.session_state.tree
+        branches = tree.branches()
+        if len(branches) > 1:
+            labels = {branch_label(tree, number, node): node for number, node in enumerate(branches, 1)}
+            choice = st.selectbox(
+                "Attempt:",
+                options=list(labels),
+                index=branches.index(tree.head) if tree.head in branches else None,
+                help="Every attempt you redo with `again` is kept. Switch back to any of them here.",
+            )
+            if choice is not None and labels[choice] != tree.head:
+                switch_branch(labels[choice])
                 st.rerun()
 
-        # Feedback link - always visible at bottom of sidebar
         st.divider()
-        st.markdown("**Help us improve**")
-        st.markdown(f"[Share feedback]({FEEDBACK_URL})")
-
-    # Main content area
-    if st.session_state.session_active and st.session_state.patient:
-        patient = st.session_state.patient
-        consultation = st.session_state.consultation
-
-        # Show patient info
-        with st.expander("Patient Information", expanded=False):
-            st.markdown(f"""
-**Name:** {patient['patient']['name']}
-**Age:** {patient['patient']['age']}
-**Occupation:** {patient['patient']['occupation']}
-**Appearance:** {consultation['scenario']['appearance']}
-            """)
+        st.markdown("**Commands:**")
+        st.markdown("- `pause` - take time to think")
+        st.markdown("- `feedback` - how am I doing?")
+        st.markdown("- `advice` - I'm stuck")
+        st.markdown("- `summary` - what did I learn?")
+        st.markdown("- `again` - try that again")
 
         st.divider()
 
-        # Chat interface
-        for message in st.session_state.messages:
-            role = "user" if message["role"] == "user" else "assistant"
-            with st.chat_message(role):
-                st.write(message["content"])
+        if st.button("End Interview"):
+            st.session_state.session_active = False
+            save_transcript(ended=True)
+            # Start feedback now so it is ready once the survey is answered
+            cancel_feedback_job()
+            st.session_state.feedback_job = start_feedback_job(
+                patient,
+                consultation,
+                st.session_state.messages,
+                st.session_state.feedback_focus,
+                st.session_state.tree.alternatives()
+            )
+            start_visit_digest(patient, consultation, st.session_state.messages)
+            st.rerun()
+
+        if st.button("Restart"):
+            new_conversation()
+            st.session_state.context = None
+            st.session_state.interview_id = uuid.uuid4().hex
+            st.session_state.feedback_shown = False
+            st.session_state.paused = False
+            st.rerun()
+
+        if st.button("Different Patient"):
+            st.session_state.patient_id = None
+            st.session_state.consultation_id = None
+            new_conversation()
+            st.session_state.context = None
+            st.session_state.session_active = False
+            st.session_state.feedback_shown = False
+            st.session_state.paused = False
+            st.session_state.user_feedback_given = False
+            st.rerun()
+
+    if config.SHOW_CONNECTION_STATS:
+        conn = api_client.stats.snapshot()
+        st.caption(f"API connections: {conn['connections']} opened, {conn['reused']} of {conn['requests']} requests reused")
+
+    # Feedback link - always visible at bottom of sidebar
+    st.divider()
+    st.markdown("**Help us improve**")
+    st.markdown(f"[Share feedback]({FEEDBACK_URL})")
+
+
+def render_message(message):
+    """Draw one turn of the conversation."""
+    with st.chat_message("user" if message["role"] == "user" else "assistant"):
+        st.write(message["content"])
+
+
+@st.fragment
+def chat_pane(patient, consultation, message_count):
+    """The chat input and the turns added since the last full rerun.
+
+    Sending a message reruns only this fragment, so the history drawn by the
+    full run, the sidebar and the rest of the page aren't rebuilt. A fragment
+    run clears everything it drew before, including what it wrote to outside
+    containers, so it redraws the turns since the last full rerun; once there
+    are CHAT_PANE_MAX_TURNS of them, a full rerun moves them into the history.
+    Each message therefore redraws a bounded number of turns, however long
+    the consultation. ``message_count`` is the sidebar's placeholder (see
+    render_session_summary). Commands that change the conversation or the
+    screen rerun the whole app.
+    """
+    for message in st.session_state.messages[st.session_state.get("rendered_turns", 0):]:
+        render_message(message)
 
+    try:
         # Show system messages (feedback, advice, etc.)
         if "system_message" in st.session_state and st.session_state.system_message:
             st.info(st.session_state.system_message)
@@ -576,40 +1261,152 @@ def main():
         # Chat input
         if prompt := st.chat_input("Type what you would say to the patient..."):
             # Check for commands
-            cmd_type, cmd_response = handle_command(prompt, patient, consultation, st.session_state.messages)
+            cmd_type, cmd_response = handle_command(
+                prompt, patient, consultation, st.session_state.messages, stream=STREAM_RESPONSES
+            )
 
             if cmd_type:
                 if cmd_type == "again":
                     st.session_state.system_message = cmd_response
                     st.rerun()
+                elif isinstance(cmd_response, ResponseStream):
+                    with st.container(border=True):
+                        text = st.write_stream(cmd_response)
+                    if cmd_response.error:
+                        st.error(f"Error generating {cmd_type}: {cmd_response.error}")
+                    else:
+                        save_output(cmd_type, text)
+                elif isinstance(cmd_response, GenerationError):
+                    st.error(cmd_response)
                 else:
                     st.info(cmd_response)
                     if cmd_type == "paused":
                         st.session_state.paused = False
+                    else:
+                        save_output(cmd_type, cmd_response)
             else:
                 # Regular message - add to conversation
-                st.session_state.messages.append({"role": "user", "content": prompt})
+                add_turn("user", prompt)
                 with st.chat_message("user"):
                     st.write(prompt)
 
-                # Get patient response
-                system_prompt = build_system_prompt(patient, consultation)
+                # Get patient response (a common greeting may have a reply ready from the warm-up)
+                opener = warm_opener(patient, consultation, prompt) if len(st.session_state.messages) == 1 else None
+                if opener is None:
+                    system_prompt, context_messages = prepare_patient_turn(
+                        patient, consultation, st.session_state.messages
+                    )
                 with st.chat_message("assistant"):
-                    with st.spinner(f"{patient['patient']['name']} is thinking..."):
-                        response = get_patient_response(
-                            st.session_state.messages,
-                            system_prompt
+                    if opener is not None:
+                        response, error = opener, None
+                        st.write(response)
+                    elif STREAM_RESPONSES:
+                        stream = stream_patient_response(
+                            context_messages, system_prompt, case_tags(patient, consultation)
                         )
-                    st.write(response)
+                        response = st.write_stream(stream) or ""
+                        error = stream.error
+                    else:
+                        error = None
+                        with st.spinner(f"{patient['patient']['name']} is thinking..."):
+                            try:
+                                response = get_patient_response(
+                                    context_messages,
+                                    system_prompt,
+                                    case_tags(patient, consultation)
+                                )
+                            except Exception as e:
+                                response, error = "", describe_error(e)
+                        st.write(response)
+
+                if error:
+                    # Drop the unanswered turn so the student can simply resend it
+                    st.session_state.tree.discard_head()
+                    st.session_state.messages.pop()
+                    st.error(f"The reply was interrupted ({error}). Please send that again.")
+                else:
+                    # Store response and last exchange
+                    add_turn("assistant", response)
+                    get_elicitation(patient, consultation, st.session_state.messages)
+                    save_transcript()
+                    if len(st.session_state.messages) - st.session_state.rendered_turns >= CHAT_PANE_MAX_TURNS:
+                        st.rerun()
+    finally:
+        message_count.markdown(f"**Messages:** {len(st.session_state.messages)}")
+        # A fragment rerun doesn't reach the end of the script, so checkpoint here too
+        checkpoint_session()
+
+
+def main():
+    if config.ADMIN_PAGE_ENABLED and st.query_params.get("view") == "admin":
+        render_admin_page()
+        return
+
+    st.title("MAAS Practice")
+    st.caption("Patient Responses Adapted to Clinical Technique in Calibrated Encounters")
+
+    # Start the session store early so it also records the first call's metrics
+    get_session_store()
+    start_warm_start()
+    resume_session()
+    remember_browser()
+    if st.session_state.get("session_notice"):
+        st.info(st.session_state.pop("session_notice"))
+    if st.session_state.get("checkpoint_conflict"):
+        st.warning(
+            "This session was continued in another tab or window, so changes here are no longer saved. "
+            "Reload the page to carry on from the latest version."
+        )
+
+    # Load the case catalogue (full cases load when an interview starts)
+    patients = load_catalogue()
+
+    # This session's case, shared with every other session on it
+    patient, consultation = current_case()
+    if patient is None and st.session_state.patient_id is not None:
+        st.warning("The case for this session is no longer available. Please pick another one.")
+        st.session_state.patient_id = None
+        st.session_state.consultation_id = None
+        st.session_state.session_active = False
+
+    load_errors = get_case_repository().load_errors()
+    if load_errors:
+        with st.sidebar:
+            for file_name, message in load_errors.items():
+                st.warning(f"Skipped invalid case file {file_name}: {message}")
+
+    if not patients:
+        st.error("No patients found. Please add patient files to data/patients/")
+        return
+
+    # Sidebar for patient/consultation selection and controls (reruns on its own)
+    with st.sidebar:
+        message_count = render_session_summary(patient, consultation)
+        render_sidebar(patients, patient, consultation)
+
+    # Main content area
+    if st.session_state.session_active and patient:
 
-                # Store response and last exchange
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                st.session_state.last_exchange = (prompt, response)
+        # Show patient info
+        with st.expander("Patient Information", expanded=False):
+            st.markdown(f"""
+**Name:** {patient['patient']['name']}
+**Age:** {patient['patient']['age']}
+**Occupation:** {patient['patient']['occupation']}
+**Appearance:** {consultation['scenario']['appearance']}
+            """)
+
+        st.divider()
 
-    elif st.session_state.patient and not st.session_state.session_active:
+        # Chat history, drawn on full reruns only; new turns are drawn by chat_pane
+        for message in st.session_state.messages:
+            render_message(message)
+        st.session_state.rendered_turns = len(st.session_state.messages)
+
+        chat_pane(patient, consultation, message_count)
+
+    elif patient and not st.session_state.session_active:
         # Session ended - show feedback
-        patient = st.session_state.patient
-        consultation = st.session_state.consultation
 
         st.header("Interview Complete")
         st.markdown(f"**Patient:** {patient['patient']['name']}")
@@ -649,43 +1446,87 @@ def main():
             st.success("Thanks for your feedback!")
 
         # Generate and show feedback
-        if not st.session_state.feedback_shown:
-            with st.spinner("Generating feedback..."):
-                feedback = generate_feedback(patient, consultation, st.session_state.messages, "full", st.session_state.feedback_focus)
-                st.session_state.feedback = feedback
-                st.session_state.feedback_shown = True
-
         st.subheader("Feedback")
-        st.markdown(st.session_state.feedback)
+        if not st.session_state.feedback_shown:
+            job = st.session_state.feedback_job
+            if job is not None:
+                # Started in the background when the interview ended
+                if STREAM_RESPONSES and not job.done:
+                    st.write_stream(job.follow())
+                else:
+                    with st.spinner("Generating feedback..."):
+                        job.wait()
+                    if not job.error:
+                        st.markdown(job.text)
+                feedback = job.text
+                if job.error:
+                    feedback = GenerationError(f"Error generating feedback: {job.error}")
+                    st.error(feedback)
+                st.session_state.feedback_job = None
+            elif STREAM_RESPONSES:
+                stream = stream_feedback(
+                    patient, consultation, st.session_state.messages, "full", st.session_state.feedback_focus,
+                    st.session_state.tree.alternatives()
+                )
+                feedback = st.write_stream(stream) or ""
+                if stream.error:
+                    feedback = GenerationError(f"Error generating feedback: {stream.error}")
+                    st.error(feedback)
+            else:
+                with st.spinner("Generating feedback..."):
+                    feedback = generate_feedback(
+                        patient, consultation, st.session_state.messages, "full", st.session_state.feedback_focus,
+                        st.session_state.tree.alternatives()
+                    )
+                if isinstance(feedback, GenerationError):
+                    st.error(feedback)
+                else:
+                    st.markdown(feedback)
+            st.session_state.feedback = feedback
+            st.session_state.feedback_shown = True
+            if isinstance(feedback, GenerationError):
+                save_transcript(ended=True)
+            else:
+                save_transcript(ended=True, feedback=feedback)
+                save_output("full_feedback", feedback)
+        elif isinstance(st.session_state.feedback, GenerationError):
+            st.error(st.session_state.feedback)
+        else:
+            st.markdown(st.session_state.feedback)
 
         st.divider()
 
         # Transcript download
         st.subheader("Download Transcript")
-        transcript = download_transcript(
-            patient,
-            consultation,
-            st.session_state.messages,
-            st.session_state.feedback if st.session_state.feedback_shown else None
-        )
+        # Built when the button is clicked, so finished sessions don't each hold a copy
+        messages = st.session_state.messages
+        feedback = st.session_state.feedback if st.session_state.feedback_shown else None
+        if isinstance(feedback, GenerationError):
+            feedback = None
         st.download_button(
             label="Download Transcript",
-            data=transcript,
+            data=lambda: download_transcript(patient, consultation, messages, feedback),
             file_name=f"maas-practice-{patient['patient_id']}-{consultation['consultation_id']}-{datetime.now().strftime('%Y%m%d-%H%M')}.txt",
-            mime="text/plain"
+            mime="text/plain",
+            on_click="ignore"
         )
 
         # Show transcript
         with st.expander("View Transcript"):
-            for m in st.session_state.messages:
-                role = "Student" if m["role"] == "user" else patient["patient"]["name"]
-                st.markdown(f"**{role}:** {m['content']}")
+            # One element for the whole transcript rather than one per turn
+            st.markdown("\n\n".join(
+                f"**{'Student' if m['role'] == 'user' else patient['patient']['name']}:** {m['content']}"
+                for m in st.session_state.messages
+            ))
 
         # Options
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Try Again"):
-                st.session_state.messages = []
+                cancel_feedback_job()
+                new_conversation()
+                st.session_state.context = None
+                st.session_state.interview_id = uuid.uuid4().hex
                 st.session_state.session_active = True
                 st.session_state.feedback_shown = False
                 st.session_state.user_feedback_given = False
@@ -693,9 +1534,11 @@ def main():
                 st.rerun()
         with col2:
             if st.button("Different Patient"):
-                st.session_state.patient = None
-                st.session_state.consultation = None
-                st.session_state.messages = []
+                cancel_feedback_job()
+                st.session_state.patient_id = None
+                st.session_state.consultation_id = None
+                new_conversation()
+                st.session_state.context = None
                 st.session_state.session_active = False
                 st.session_state.feedback_shown = False
                 st.session_state.user_feedback_given = False
@@ -730,4 +1573,8 @@ Don't worry about being perfect. Real consultations aren't perfect either. What
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Also runs when st.rerun() or st.stop() end the script early
+        checkpoint_session()
@@ -0,0 +1,79 @@
+"""
+MAAS Practice - Background Jobs
+Runs a streamed model call on a worker thread and buffers its text
+"""
+
+import threading
+
+
+class StreamingJob:
+    """A streamed response produced in the background.
+
+    ``stream`` is any iterable of text chunks (such as app.ResponseStream);
+    if it has an ``error`` attribute it is checked once iteration ends.
+    The UI can read ``text`` when ``done``, or ``follow()`` the job to
+    render chunks as they arrive.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunks = []
+        self.error = None
+        self.done = False
+        self.cancelled = False
+        self._cond = threading.Condition()
+        self._iterator = None
+
+    def start(self, executor):
+        """Submit the job to an executor and return it."""
+        executor.submit(self._run)
+        return self
+
+    def _run(self):
+        try:
+            self._iterator = iter(self.stream)
+            for chunk in self._iterator:
+                if self.cancelled:
+                    break
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+            if self.error is None:
+                self.error = getattr(self.stream, "error", None)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            close = getattr(self._iterator, "close", None)
+            if close:
+                close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def cancel(self):
+        """Stop the job at the next chunk; its result will be ignored."""
+        self.cancelled = True
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes; return True if it did."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done or self.cancelled, timeout)
+
+    def follow(self):
+        """Yield buffered chunks, then new ones as they arrive, until done."""
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.chunks) > sent or self.done or self.cancelled)
+                pending = self.chunks[sent:]
+                finished = self.done or self.cancelled
+            sent += len(pending)
+            yield from pending
+            if finished and sent == len(self.chunks):
+                return
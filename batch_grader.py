@@ -0,0 +1,361 @@
+"""
+MAAS Practice - Batch Grader
+Grades stored sessions and downloaded transcripts offline, many at a time
+
+Each transcript gets the same end-of-session feedback request the app
+sends (``feedback_request`` in app.py, with the current feedback prompts),
+for the focus it was recorded with or for any focus given. Requests go out
+concurrently through the request scheduler, or as Message Batches.
+Transcripts whose requests are identical share one call. Results are
+appended to a JSON Lines file as they arrive, one per transcript, keyed by
+its id and a hash of the request; a rerun skips everything already graded
+there and picks up batches that were still running, so an interrupted run
+can simply be started again. Editing a feedback prompt changes the
+requests, so the same transcripts are graded afresh.
+
+    python batch_grader.py --sessions --output grades.jsonl
+    python batch_grader.py --files downloads/ --focus "Interview skills" "Problem-solving" --output grades.jsonl
+    python batch_grader.py --sessions --since 2026-09-01 --batch --output grades.jsonl
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import config
+from response_cache import request_key
+
+FOCUSES = ("Interview skills", "Balanced", "Problem-solving")
+CALL_TYPE = "full_feedback"
+
+
+class TranscriptFormatError(ValueError):
+    """Raised when a file isn't a transcript downloaded from the app."""
+
+
+def parse_transcript(text):
+    """(patient name, consultation title, messages) of a transcript from download_transcript."""
+    header, separator, body = text.partition("\nTRANSCRIPT\n----------\n")
+    if not separator:
+        raise TranscriptFormatError("no TRANSCRIPT section")
+    fields = {}
+    for row in header.splitlines():
+        name, _, value = row.partition(": ")
+        fields[name.strip()] = value.strip()
+    if not fields.get("Patient") or not fields.get("Consultation"):
+        raise TranscriptFormatError("no Patient or Consultation line")
+    body = body.split("\n\nFEEDBACK\n--------\n", 1)[0]
+    body = body.rsplit("\n---\nGenerated by MAAS Practice", 1)[0]
+
+    speakers = {"Student": "user", fields["Patient"]: "assistant"}
+    messages = []
+    for row in body.split("\n"):
+        speaker, _, content = row.partition(": ")
+        if speaker in speakers:
+            messages.append({"role": speakers[speaker], "content": content})
+        elif messages:
+            messages[-1]["content"] += "\n" + row  # A reply that runs over several lines
+    for message in messages:
+        message["content"] = message["content"].strip()
+    if not messages:
+        raise TranscriptFormatError("no turns")
+    return fields["Patient"], fields["Consultation"], messages
+
+
+def find_case(catalogue, name, title):
+    """(patient_id, consultation_id) for a patient name and consultation title, or None."""
+    for patient_id, entry in catalogue.items():
+        if entry["name"] != name:
+            continue
+        for consultation in entry["consultations"]:
+            if consultation["title"] == title:
+                return patient_id, consultation["consultation_id"]
+    return None
+
+
+def file_items(paths, catalogue, errors):
+    """Transcript items from .txt files and directories of them; unreadable files go to ``errors``."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob("*.txt")) if path.is_dir() else [path])
+    items = []
+    for path in files:
+        try:
+            name, title, messages = parse_transcript(path.read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError, TranscriptFormatError) as e:
+            errors.append(f"{path}: {e}")
+            continue
+        case = find_case(catalogue, name, title)
+        if case is None:
+            errors.append(f"{path}: no case {name!r} / {title!r} in data/patients")
+            continue
+        items.append({"id": f"file:{path}", "patient_id": case[0], "consultation_id": case[1],
+                      "focus": None, "messages": messages})
+    return items
+
+
+def session_items(store, include_unfinished=False, **filters):
+    """Transcript items from the session store (ended interviews only, unless asked)."""
+    return [
+        {"id": f"session:{row['interview_id']}", "patient_id": row["patient_id"],
+         "consultation_id": row["consultation_id"], "focus": row["focus"], "messages": row["messages"]}
+        for row in store.transcripts(**filters)
+        if row["messages"] and (include_unfinished or row["ended_at"])
+    ]
+
+
+def read_results(path):
+    """(graded, answers, pending) from an earlier run's output.
+
+    ``graded`` holds the (id, key) pairs already graded, ``answers`` the
+    feedback for each key graded so far, and ``pending`` maps each batch
+    that never reported back to the keys still waiting in it. A pair that
+    failed is graded again.
+    """
+    graded = set()
+    answers = {}  # key -> feedback
+    waiting = {}  # key -> batch id
+    if not Path(path).exists():
+        return graded, answers, {}
+    with open(path, encoding="utf-8") as f:
+        for row in f:
+            try:
+                record = json.loads(row)
+            except json.JSONDecodeError:
+                continue  # A line cut short by an interruption
+            if record.get("status") == "submitted":
+                waiting[record["key"]] = record["batch_id"]
+                continue
+            waiting.pop(record.get("key"), None)
+            if record.get("status") == "graded":
+                graded.add((record.get("id"), record["key"]))
+                answers[record["key"]] = record["feedback"]
+    pending = {}
+    for key, batch_id in waiting.items():
+        pending.setdefault(batch_id, set()).add(key)
+    return graded, answers, pending
+
+
+class ResultWriter:
+    """Appends one JSON line per result and flushes it, so nothing is lost on interruption."""
+
+    def __init__(self, path, total, out=sys.stderr):
+        self.file = open(path, "a", encoding="utf-8")
+        self.total = total
+        self.out = out
+        self.graded = 0
+        self.failed = 0
+        self._progress = False  # A progress line is open
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            if record["status"] == "graded":
+                self.graded += 1
+            elif record["status"] == "error":
+                self.failed += 1
+            else:
+                return
+            self.out.write(f"\r{self.graded + self.failed}/{self.total} done, {self.failed} failed")
+            self.out.flush()
+            self._progress = True
+
+    def note(self, text):
+        """Print a message on its own line, below any progress line."""
+        with self._lock:
+            self.out.write(("\n" if self._progress else "") + text + "\n")
+            self._progress = False
+
+    def close(self):
+        self.file.close()
+        if self._progress:
+            self.out.write("\n")
+
+
+def result_record(job, status, text=None, error=None):
+    item = job["item"]
+    return {
+        "key": job["key"],
+        "id": item["id"],
+        "patient_id": item["patient_id"],
+        "consultation_id": item["consultation_id"],
+        "focus": job["focus"],
+        "model": job["request"]["model"],
+        "status": status,
+        "feedback": text,
+        "error": error,
+        "graded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def group_by_key(jobs):
+    """{key: [jobs]}: transcripts with identical requests, which one call grades."""
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["key"], []).append(job)
+    return groups
+
+
+def grade_concurrently(app, groups, writer, workers):
+    """Send each distinct request through the app's scheduler and response cache, ``workers`` at a time."""
+    def grade(jobs):
+        item = jobs[0]["item"]
+        return app.create_message(jobs[0]["request"], CALL_TYPE, {
+            "patient_id": item["patient_id"], "consultation_id": item["consultation_id"]})
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="maas-grade") as executor:
+        futures = {executor.submit(grade, jobs): jobs for jobs in groups.values()}
+        try:
+            for future in as_completed(futures):
+                try:
+                    records = [result_record(job, "graded", text=future.result()) for job in futures[future]]
+                except Exception as e:
+                    records = [result_record(job, "error", error=app.describe_error(e)) for job in futures[future]]
+                for record in records:
+                    writer.write(record)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def collect_batch(client, batch_id, groups, writer, poll_seconds):
+    """Wait for a submitted batch to end and write its results, one per transcript in each group."""
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            break
+        time.sleep(poll_seconds)
+    seen = set()
+    for entry in client.messages.batches.results(batch_id):
+        jobs = groups.get(entry.custom_id)
+        if jobs is None:
+            continue  # Graded by a later run, or from a batch submitted with other settings
+        seen.add(entry.custom_id)
+        if entry.result.type == "succeeded":
+            records = [result_record(job, "graded", text=entry.result.message.content[0].text) for job in jobs]
+        else:
+            error = getattr(getattr(entry.result, "error", None), "error", None)
+            error = getattr(error, "message", None) or entry.result.type
+            records = [result_record(job, "error", error=error) for job in jobs]
+        for record in records:
+            writer.write(record)
+    for key in groups.keys() - seen:
+        for job in groups[key]:
+            writer.write(result_record(job, "error", error="missing from batch results"))
+
+
+def grade_in_batches(client, groups, pending, writer, batch_size, poll_seconds):
+    """Collect batches left running by an earlier run, then submit the rest as new batches (one request per key)."""
+    by_key = dict(groups)
+    for batch_id, keys in pending.items():
+        waiting = {key: by_key[key] for key in keys if key in by_key}
+        if waiting:
+            writer.note(f"Collecting batch {batch_id} ({len(waiting)} requests) from an earlier run...")
+            collect_batch(client, batch_id, waiting, writer, poll_seconds)
+            for key in waiting:
+                by_key.pop(key)
+    remaining = list(by_key.items())
+    for start in range(0, len(remaining), batch_size):
+        chunk = dict(remaining[start:start + batch_size])
+        batch = client.messages.batches.create(requests=[
+            # The per-call timeout is a client option, not part of the request
+            {"custom_id": key, "params": {k: v for k, v in jobs[0]["request"].items() if k != "timeout"}}
+            for key, jobs in chunk.items()
+        ])
+        for jobs in chunk.values():
+            for job in jobs:
+                writer.write(dict(result_record(job, "submitted"), batch_id=batch.id))
+        writer.note(f"Submitted batch {batch.id} ({len(chunk)} requests)")
+        collect_batch(client, batch.id, chunk, writer, poll_seconds)
+
+
+def build_jobs(app, items, focuses, errors):
+    """One feedback request per transcript and focus (None = the focus it was recorded with)."""
+    repository = app.get_case_repository()
+    jobs = []
+    for item in items:
+        patient = repository.patient(item["patient_id"])
+        consultation = repository.consultation(item["patient_id"], item["consultation_id"])
+        if patient is None or consultation is None:
+            errors.append(f"{item['id']}: case {item['patient_id']}/{item['consultation_id']} not found")
+            continue
+        for focus in focuses:
+            focus = focus or item["focus"] or "Balanced"
+            request = app.feedback_request(patient, consultation, item["messages"], "full", focus)
+            jobs.append({"key": request_key(request, CALL_TYPE), "item": item, "focus": focus, "request": request})
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade stored sessions or downloaded transcripts offline.")
+    source = parser.add_argument_group("transcripts")
+    source.add_argument("--sessions", action="store_true", help="Ended interviews in the session store")
+    source.add_argument("--files", nargs="+", default=[], help="Downloaded transcript files or directories")
+    source.add_argument("--patient", help="Only this patient_id (sessions)")
+    source.add_argument("--consultation", type=int, help="Only this consultation_id (sessions)")
+    source.add_argument("--since", help="Only interviews started on or after this date (sessions)")
+    source.add_argument("--until", help="Only interviews started before this date (sessions)")
+    source.add_argument("--include-unfinished", action="store_true", help="Also interviews that were never ended")
+    parser.add_argument("--focus", nargs="+", choices=FOCUSES,
+                        help="Grade for these focuses (default: the focus each session was recorded with)")
+    parser.add_argument("--output", required=True, help="JSON Lines file results are appended to")
+    parser.add_argument("--workers", type=int, default=config.BATCH_GRADING_WORKERS, help="Requests in flight at once")
+    parser.add_argument("--batch", action="store_true", help="Submit through the Message Batches API")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_GRADING_BATCH_SIZE, help="Requests per batch")
+    parser.add_argument("--poll-seconds", type=float, default=config.BATCH_GRADING_POLL_SECONDS,
+                        help="How often a running batch is checked")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be graded and stop")
+    args = parser.parse_args()
+    if not args.sessions and not args.files:
+        parser.error("give --sessions, --files or both")
+
+    import streamlit.logger
+
+    streamlit.logger.set_log_level("error")  # app.py is imported outside `streamlit run`
+    import app
+
+    errors = []
+    items = file_items(args.files, app.load_catalogue(), errors)
+    if args.sessions:
+        items += session_items(
+            app.get_session_store(), args.include_unfinished, patient_id=args.patient,
+            consultation_id=args.consultation, since=args.since, until=args.until,
+        )
+    jobs = build_jobs(app, items, args.focus or [None], errors)
+    graded, answers, pending = read_results(args.output)
+    todo = [job for job in jobs if (job["item"]["id"], job["key"]) not in graded]
+    # A request already graded for another transcript with the same turns and focus isn't sent again
+    reused = [job for job in todo if job["key"] in answers]
+    groups = group_by_key(job for job in todo if job["key"] not in answers)
+    for error in errors:
+        print(f"Skipped {error}", file=sys.stderr)
+    print(f"{len(items)} transcripts, {len(jobs)} requests: {len(jobs) - len(todo)} already graded, "
+          f"{len(todo)} to grade with {len(groups)} calls", file=sys.stderr)
+    if args.dry_run or not todo:
+        return
+
+    writer = ResultWriter(args.output, len(todo))
+    try:
+        for job in reused:
+            writer.write(result_record(job, "graded", text=answers[job["key"]]))
+        if args.batch:
+            grade_in_batches(app.get_client(), groups, pending, writer, args.batch_size, args.poll_seconds)
+        else:
+            grade_concurrently(app, groups, writer, args.workers)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to continue.", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        writer.close()
+    sys.exit(1 if writer.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+MAAS Practice - Fake Messages API
+Local stand-in for the Anthropic Messages API used by benchmarks and load tests
+
+Serves POST /v1/messages (blocking and streaming) with configurable
+latency and token rate, so the app can be measured without model time or
+cost, and the Message Batches endpoints the batch grader uses (a batch
+ends once its slowest request would have). Point the app at it with
+ANTHROPIC_BASE_URL=http://127.0.0.1:<port>.
+
+    python benchmarks/fake_anthropic.py --port 8787 --latency-ms 300 --tokens-per-second 80
+    python benchmarks/fake_anthropic.py --latency-ms 800 --latency-sigma 0.5   # long-tailed, like the real API
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "well I have been feeling it mostly in the mornings and it worries me "
+    "because my father had something similar and I do not really know what "
+    "to make of it so I thought I should come in and ask you about it"
+).split()
+
+
+class FakeSettings:
+    """Latency and output shape of the fake API."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, tokens_per_second=0.0,
+                 reply_tokens=60, error_rate=0.0, seed=None, latency_sigma=0.0):
+        self.latency_ms = latency_ms  # Time to first token (the median when latency_sigma is set)
+        self.jitter_ms = jitter_ms  # Uniform +/- jitter on time to first token
+        self.latency_sigma = latency_sigma  # Lognormal spread of time to first token; 0 = no long tail
+        self.tokens_per_second = tokens_per_second  # 0 = no delay between tokens
+        self.reply_tokens = reply_tokens  # Upper bound; max_tokens also applies
+        self.error_rate = error_rate  # Fraction of requests answered with 529 overloaded
+        self.random = random.Random(seed)
+
+
+def _estimate_tokens(value):
+    return len(json.dumps(value)) // 4 + 1
+
+
+def _cacheable_prefixes(body):
+    """Yield (hash, tokens) for each cache-marked prefix of the system prompt."""
+    system = body.get("system")
+    if not isinstance(system, list):
+        return
+    digest = hashlib.sha256(body.get("model", "").encode())
+    tokens = 0
+    for block in system:
+        text = block.get("text", "")
+        digest.update(text.encode())
+        tokens += len(text) // 4 + 1
+        if block.get("cache_control"):
+            yield digest.hexdigest(), tokens
+
+
+class FakeAnthropicServer:
+    """A threaded HTTP server implementing enough of /v1/messages for the app."""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = settings or FakeSettings()
+        self.requests = 0
+        self.cache = set()
+        self.batches = {}  # batch id -> (created, ready at, [(custom_id, result)])
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _usage(self, body):
+        """Usage block that mimics prompt caching for cache-marked system blocks."""
+        input_tokens = _estimate_tokens(body.get("system", "")) + _estimate_tokens(body.get("messages", []))
+        cache_read = cache_write = 0
+        with self._lock:
+            self.requests += 1
+            for key, tokens in _cacheable_prefixes(body):
+                if key in self.cache:
+                    cache_read = tokens
+                else:
+                    self.cache.add(key)
+                    cache_write = tokens - cache_read
+        return {
+            "input_tokens": max(input_tokens - cache_read - cache_write, 1),
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        }
+
+    def _reply_words(self, body):
+        count = min(self.settings.reply_tokens, body.get("max_tokens", self.settings.reply_tokens))
+        return [WORDS[i % len(WORDS)] for i in range(max(count, 1))]
+
+    def _message(self, body, words, usage):
+        return {
+            "id": f"msg_fake_{uuid.uuid4().hex[:12]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": " ".join(words)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": dict(usage, output_tokens=len(words)),
+        }
+
+    def create_batch(self, requests):
+        """Queue a message batch; each request "finishes" after its own simulated latency."""
+        results = []
+        slowest = 0.0
+        for request in requests:
+            body = request["params"]
+            if self.settings.error_rate and self.settings.random.random() < self.settings.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "Overloaded"}}}
+            else:
+                words = self._reply_words(body)
+                result = {"type": "succeeded", "message": self._message(body, words, self._usage(body))}
+                rate = self.settings.tokens_per_second
+                slowest = max(slowest, self._first_token_delay() + (len(words) / rate if rate else 0))
+            results.append((request["custom_id"], result))
+        batch_id = f"msgbatch_fake_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self.batches[batch_id] = (time.time(), time.time() + slowest, results)
+        return batch_id
+
+    def batch(self, batch_id, base_url):
+        """The MessageBatch object for ``batch_id``, or None."""
+        with self._lock:
+            entry = self.batches.get(batch_id)
+        if entry is None:
+            return None
+        created, ready_at, results = entry
+        ended = time.time() >= ready_at
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for _, result in results:
+            counts[result["type"] if ended else "processing"] += 1
+
+        def stamp(seconds):
+            return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "created_at": stamp(created),
+            "ended_at": stamp(ready_at) if ended else None,
+            "expires_at": stamp(created + 86400),
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _first_token_delay(self):
+        s = self.settings
+        delay = s.latency_ms
+        if s.latency_sigma:
+            delay *= s.random.lognormvariate(0, s.latency_sigma)
+        if s.jitter_ms:
+            delay += s.random.uniform(-s.jitter_ms, s.jitter_ms)
+        return max(delay, 0) / 1000
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self):
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")  # v1 messages batches <id> [results]
+                if len(parts) < 4 or parts[:3] != ["v1", "messages", "batches"]:
+                    self._not_found()
+                    return
+                batch = server.batch(parts[3], f"http://{self.headers.get('Host')}")
+                if batch is None:
+                    self._not_found()
+                elif len(parts) == 4:
+                    self._send_json(200, batch)
+                elif batch["processing_status"] != "ended":
+                    self._send_json(400, {"type": "error", "error": {
+                        "type": "invalid_request_error", "message": "Batch is still processing"}})
+                else:
+                    data = "".join(
+                        json.dumps({"custom_id": custom_id, "result": result}) + "\n"
+                        for custom_id, result in server.batches[parts[3]][2]
+                    ).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/binary")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.split("?")[0].rstrip("/") == "/v1/messages/batches":
+                    batch_id = server.create_batch(body.get("requests", []))
+                    self._send_json(200, server.batch(batch_id, f"http://{self.headers.get('Host')}"))
+                    return
+                if not self.path.startswith("/v1/messages"):
+                    self._not_found()
+                    return
+                if server.settings.error_rate and server.settings.random.random() < server.settings.error_rate:
+                    self._send_json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+                    return
+
+                usage = server._usage(body)
+                words = server._reply_words(body)
+                time.sleep(server._first_token_delay())
+                message_id = f"msg_fake_{uuid.uuid4().hex[:12]}"
+                if body.get("stream"):
+                    self._stream(body, message_id, words, usage)
+                    return
+
+                if server.settings.tokens_per_second:
+                    time.sleep(len(words) / server.settings.tokens_per_second)
+                self._send_json(200, dict(server._message(body, words, usage), id=message_id))
+
+            def _event(self, name, payload):
+                data = f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, body, message_id, words, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self._event("message_start", {"type": "message_start", "message": {
+                    "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+                    "content": [], "stop_reason": None, "stop_sequence": None,
+                    "usage": dict(usage, output_tokens=1),
+                }})
+                self._event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                    "content_block": {"type": "text", "text": ""}})
+                delay = 1 / server.settings.tokens_per_second if server.settings.tokens_per_second else 0
+                for i, word in enumerate(words):
+                    if delay:
+                        time.sleep(delay)
+                    text = word if i == 0 else f" {word}"
+                    self._event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                        "delta": {"type": "text_delta", "text": text}})
+                self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                self._event("message_delta", {"type": "message_delta",
+                                              "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                              "usage": {"output_tokens": len(words)}})
+                self._event("message_stop", {"type": "message_stop"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def add_settings_arguments(parser):
+    """Add the fake API's latency options to an argparse parser."""
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform jitter on time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.0,
+                        help="Lognormal spread of time to first token around --latency-ms (e.g. 0.5)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Output rate (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 529 overloaded errors")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def settings_from_args(args):
+    return FakeSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        latency_sigma=args.latency_sigma,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Anthropic Messages API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(settings_from_args(args), args.host, args.port)
+    print(f"Fake Anthropic API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
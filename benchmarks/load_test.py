@@ -0,0 +1,432 @@
+"""
+MAAS Practice - Load Test
+Many simulated students at once against real server processes
+
+Starts one or more ``streamlit run app.py`` processes against a local fake
+Messages API and drives headless students through them over Streamlit's
+own websocket protocol, the way a browser does: each one picks a case,
+starts the interview, works through a scripted consultation with the
+commands mixed in, ends it, skips the survey and waits for the feedback.
+Concurrency is ramped level by level, and for each level the run reports
+throughput, turn latency percentiles, the error rate and the server
+processes' CPU and resident memory. Several process counts can be compared
+in one run; students are spread over the processes round-robin, as a load
+balancer would.
+
+    python benchmarks/load_test.py --students 10 25 50 --processes 1 2
+    python benchmarks/load_test.py --students 200 --processes 4 --think-seconds 10 --output load.json
+    python benchmarks/load_test.py --url http://localhost:8501 --students 5   # an app that is already running
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+import websockets
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_anthropic import FakeAnthropicServer, add_settings_arguments, settings_from_args  # noqa: E402
+from run_benchmarks import COMMANDS, git_revision, percentile  # noqa: E402
+
+# Scripted student turns, every command mixed in
+SCRIPT = [
+    "Hello, I'm one of the medical students. What brings you in today?",
+    "Can you tell me more about that?",
+    "When did it first start?",
+    "pause",
+    "What makes it better or worse?",
+    "feedback",
+    "Have you noticed anything else going on at the same time?",
+    "again",
+    "Is there anything else you've noticed along with it?",
+    "What do you think might be causing it?",
+    "advice",
+    "Is there anything in particular that worries you about it?",
+    "What were you hoping we could do for you today?",
+    "summary",
+    "Thank you for telling me all of that.",
+]
+
+CHAT_PLACEHOLDER = "Type what you would say to the patient..."
+DONE = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+        ForwardMsg.FINISHED_WITH_COMPILE_ERROR}
+
+
+class StudentError(Exception):
+    pass
+
+
+class Student:
+    """One headless browser session working through a scripted consultation."""
+
+    def __init__(self, number, url, script, think_seconds, timeout, rng):
+        self.number = number
+        self.url = url.rstrip("/")
+        self.script = script
+        self.think_seconds = think_seconds
+        self.timeout = timeout
+        self.random = rng
+        self.widgets = {}  # label or placeholder -> latest element proto, its kind and fragment id
+        self.query_string = ""
+        self.selected = []  # Widget states of the chosen case
+        self.steps = []  # {"step", "ms", "error"}
+
+    async def run(self):
+        stream_url = self.url.replace("http", "ws", 1) + "/_stcore/stream"
+        try:
+            async with websockets.connect(stream_url, subprotocols=["streamlit"], max_size=None,
+                                          open_timeout=self.timeout) as self.ws:
+                await self.step("connect")
+                await self.pick_case()
+                await self.step("start", self.click("Start Interview"))
+                for line in self.script:
+                    await self.think()
+                    name = line.lower() if line.lower() in COMMANDS else "turn"
+                    await self.step(name, self.chat(line))
+                await self.think()
+                await self.step("end", self.click("End Interview"))
+                await self.step("final_feedback", self.click("Skip"))
+        except Exception as e:
+            # The session can't go on; record what broke it as one failed step
+            self.steps.append({"step": "session", "ms": None, "error": f"{type(e).__name__}: {e}"})
+        return self.steps
+
+    async def think(self):
+        if self.think_seconds:
+            await asyncio.sleep(self.random.expovariate(1 / self.think_seconds))
+
+    async def pick_case(self):
+        """Select patient ``number`` and one of their consultations, round-robin."""
+        patients = self.widget("Select a patient:").options
+        patient = patients[self.number % len(patients)]
+        await self.step("select", ([self.value("Select a patient:", patient)], self.fragment("Select a patient:")))
+        consultations = self.widget("Select a consultation:").options
+        consultation = consultations[(self.number // len(patients)) % len(consultations)]
+        self.selected = [self.value("Select a patient:", patient),
+                         self.value("Select a consultation:", consultation)]
+
+    def widget(self, name):
+        if name not in self.widgets:
+            raise StudentError(f"no {name!r} on the page")
+        return self.widgets[name][0]
+
+    def fragment(self, name):
+        self.widget(name)
+        return self.widgets[name][2]
+
+    def value(self, name, option):
+        state = WidgetState(id=self.widget(name).id)
+        state.string_value = option
+        return state
+
+    def click(self, label):
+        """(widget states, fragment id) of pressing a button."""
+        state = WidgetState(id=self.widget(label).id, trigger_value=True)
+        # The case selection is sent along with the button that starts it, as the browser does
+        states = self.selected if label == "Start Interview" else []
+        return [*states, state], self.fragment(label)
+
+    def chat(self, text):
+        """(widget states, fragment id) of sending a chat message."""
+        state = WidgetState(id=self.widget(CHAT_PLACEHOLDER).id)
+        state.chat_input_value.data = text
+        return [state], self.fragment(CHAT_PLACEHOLDER)
+
+    async def step(self, name, interaction=([], "")):
+        """Send one interaction and time it until the script run it causes has finished."""
+        states, fragment_id = interaction
+        start = time.perf_counter()
+        error = await self.rerun(states, fragment_id)
+        self.steps.append({"step": name, "ms": (time.perf_counter() - start) * 1000, "error": error})
+
+    async def rerun(self, states, fragment_id):
+        """Send a rerun_script request and read forward messages until the run is done; return an error or None."""
+        message = BackMsg()
+        message.rerun_script.query_string = self.query_string
+        message.rerun_script.page_script_hash = ""
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(states)
+        await self.ws.send(message.SerializeToString())
+        error = None
+        deadline = time.monotonic() + self.timeout
+        while True:
+            data = await asyncio.wait_for(self.ws.recv(), max(0.1, deadline - time.monotonic()))
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "page_info_changed":
+                self.query_string = forward.page_info_changed.query_string
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof("type")
+                proto = getattr(element, element_kind)
+                name = getattr(proto, "label", "") or getattr(proto, "placeholder", "")
+                if getattr(proto, "id", "") and name:
+                    self.widgets[name] = (proto, element_kind, forward.delta.fragment_id)
+                if element_kind == "exception":
+                    error = error or f"{proto.type}: {proto.message}"
+                elif element_kind == "alert" and proto.format == Alert.ERROR:
+                    error = error or proto.body[:200]
+            elif kind == "script_finished" and forward.script_finished in DONE:
+                return error
+
+
+async def run_students(urls, count, script, think_seconds, ramp_seconds, timeout, seed):
+    """Run ``count`` students at once, started evenly over ``ramp_seconds``; return every step."""
+    rng = random.Random(seed)
+
+    async def one(number):
+        await asyncio.sleep(ramp_seconds * number / max(count, 1))
+        student = Student(number, urls[number % len(urls)], script, think_seconds, timeout,
+                          random.Random(rng.random()))
+        return await student.run()
+
+    results = await asyncio.gather(*(one(number) for number in range(count)))
+    return [step for steps in results for step in steps]
+
+
+def _proc_times(pid):
+    """User + system CPU seconds of a process so far (Linux /proc), or None."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _proc_rss_mb(pid):
+    """Resident memory of a process in MB (Linux /proc), or None."""
+    try:
+        for row in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if row.startswith("VmRSS:"):
+                return int(row.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+async def sample_resources(pids, samples, interval=0.5):
+    """Append the processes' total RSS to ``samples`` until cancelled."""
+    while True:
+        values = [_proc_rss_mb(pid) for pid in pids]
+        if values and None not in values:
+            samples.append(sum(values))
+        await asyncio.sleep(interval)
+
+
+def summarize(steps, seconds, processes, cpu_seconds, rss_samples):
+    """Throughput, latency percentiles, error rate and resource use of one concurrency level."""
+    finished = [step for step in steps if step["step"] == "final_feedback" and not step["error"]]
+    turns = [step["ms"] for step in steps if step["step"] == "turn" and not step["error"]]
+    errors = [step for step in steps if step["error"]]
+    by_step = {}
+    for step in steps:
+        if step["ms"] is not None and not step["error"]:
+            by_step.setdefault(step["step"], []).append(step["ms"])
+    error_counts = {}
+    for step in errors:
+        error_counts[step["error"]] = error_counts.get(step["error"], 0) + 1
+
+    def ms(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        "seconds": round(seconds, 1),
+        "sessions_finished": len(finished),
+        "interactions": len(steps),
+        "throughput_per_second": round(len(steps) / seconds, 2) if seconds else None,
+        "turns_per_second": round(len(turns) / seconds, 2) if seconds else None,
+        "turn_p50_ms": ms(percentile(turns, 50)),
+        "turn_p95_ms": ms(percentile(turns, 95)),
+        "turn_p99_ms": ms(percentile(turns, 99)),
+        "error_rate": round(len(errors) / len(steps), 4) if steps else None,
+        "errors": dict(sorted(error_counts.items(), key=lambda item: -item[1])[:5]),
+        "cpu_percent": round(100 * cpu_seconds / seconds, 1) if cpu_seconds is not None and seconds else None,
+        "cpu_percent_per_process": (round(100 * cpu_seconds / seconds / processes, 1)
+                                    if cpu_seconds is not None and seconds and processes else None),
+        "rss_peak_mb": round(max(rss_samples), 1) if rss_samples else None,
+        "by_step": {
+            name: {"count": len(values), "p50_ms": round(statistics.median(values), 1),
+                   "p95_ms": ms(percentile(values, 95))}
+            for name, values in sorted(by_step.items())
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_healthy(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+def serve_fake_api(settings, port):
+    FakeAnthropicServer(settings, port=port).httpd.serve_forever()
+
+
+def start_servers(count, api_url, work_dir):
+    """Start ``count`` app server processes sharing one session database; return [(process, url)]."""
+    env = dict(os.environ)
+    env.update({
+        "ANTHROPIC_BASE_URL": api_url,
+        "ANTHROPIC_API_KEY": "fake-key",
+        "MAAS_SESSION_DB": str(Path(work_dir) / "maas.db"),  # Shared, as workers on one host share data/maas.db
+        "MAAS_RESPONSE_CACHE": "",  # Memory only, so every run starts cold
+        "MAAS_METRICS": "0",  # Keep the load test out of data/metrics
+        "MAAS_WORKER_PROCESSES": str(count),  # Rate limits, if set, are shared between the servers
+    })
+    # Measure the app, not the rate limiter (set them to test your API tier's limits)
+    env.setdefault("MAAS_REQUESTS_PER_MINUTE", "0")
+    env.setdefault("MAAS_TOKENS_PER_MINUTE", "0")
+    servers = []
+    for number in range(count):
+        port = free_port()
+        log = open(Path(work_dir) / f"server-{number}.log", "w")
+        process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", str(ROOT / "app.py"),
+             "--server.port", str(port), "--server.headless", "true",
+             "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        servers.append((process, f"http://127.0.0.1:{port}"))
+    for _, url in servers:
+        wait_healthy(url)
+    return servers
+
+
+def stop_servers(servers):
+    for process, _ in servers:
+        process.terminate()
+    for process, _ in servers:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_level(urls, pids, count, args, seed):
+    """One concurrency level: students plus resource sampling."""
+    cpu_before = [_proc_times(pid) for pid in pids]
+    samples = []
+    sampler = asyncio.create_task(sample_resources(pids, samples))
+    start = time.perf_counter()
+    steps = await run_students(urls, count, SCRIPT, args.think_seconds, args.ramp_seconds, args.timeout, seed)
+    seconds = time.perf_counter() - start
+    sampler.cancel()
+    cpu_after = [_proc_times(pid) for pid in pids]
+    cpu_seconds = None
+    if pids and None not in cpu_before + cpu_after:
+        cpu_seconds = sum(after - before for before, after in zip(cpu_before, cpu_after))
+    return summarize(steps, seconds, len(pids), cpu_seconds, samples)
+
+
+def print_table(runs, out=sys.stdout):
+    out.write(f"{'procs':>5} {'students':>8} {'done':>5} {'turn/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'errors':>7} {'cpu %':>7} {'rss MB':>8}\n")
+    for run in runs:
+        for level in run["levels"]:
+            def cell(key, width, fmt="{}"):
+                value = level[key]
+                return f"{'-' if value is None else fmt.format(value):>{width}}"
+            out.write(
+                f"{str(run['processes'] or '-'):>5} {level['students']:>8} {level['sessions_finished']:>5} "
+                f"{cell('turns_per_second', 7)} {cell('turn_p50_ms', 8, '{:.0f}')} {cell('turn_p95_ms', 8, '{:.0f}')} "
+                f"{cell('turn_p99_ms', 8, '{:.0f}')} {cell('error_rate', 7, '{:.1%}')} "
+                f"{cell('cpu_percent', 7)} {cell('rss_peak_mb', 8)}\n"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MAAS Practice with simulated students.")
+    parser.add_argument("--students", nargs="+", type=int, default=[5, 10, 25],
+                        help="Concurrency levels to ramp through, e.g. 10 50 100 200")
+    parser.add_argument("--processes", nargs="+", type=int, default=[1],
+                        help="Server process counts to compare, e.g. 1 2 4")
+    parser.add_argument("--url", help="Test an app that is already running here instead of starting servers")
+    parser.add_argument("--think-seconds", type=float, default=2.0,
+                        help="Mean pause between a student's messages (exponential; 0 = none)")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0,
+                        help="Students of a level start evenly spread over this long")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Longest wait for one interaction")
+    parser.add_argument("--output", help="Also write JSON results to this file")
+    add_settings_arguments(parser)
+    parser.set_defaults(latency_ms=800.0, latency_sigma=0.5, tokens_per_second=60.0)
+    args = parser.parse_args()
+
+    runs = []
+    api = None
+    settings = settings_from_args(args)
+    if not args.url:
+        api_port = free_port()
+        api = multiprocessing.Process(target=serve_fake_api, args=(settings, api_port), daemon=True)
+        api.start()
+    try:
+        for processes in ([None] if args.url else args.processes):
+            with tempfile.TemporaryDirectory(prefix="maas-load-") as work_dir:
+                servers = [] if args.url else start_servers(processes, f"http://127.0.0.1:{api_port}", work_dir)
+                urls = [args.url] if args.url else [url for _, url in servers]
+                pids = [process.pid for process, _ in servers]
+                run = {"processes": processes, "levels": []}
+                try:
+                    for count in args.students:
+                        print(f"{processes or args.url} process(es), {count} students...", file=sys.stderr)
+                        level = asyncio.run(run_level(urls, pids, count, args, seed=count))
+                        run["levels"].append({"students": count, **level})
+                finally:
+                    stop_servers(servers)
+                runs.append(run)
+    finally:
+        if api is not None:
+            api.terminate()
+
+    print_table(runs)
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "fake_api": {k: v for k, v in vars(settings).items() if k != "random"},
+            "think_seconds": args.think_seconds,
+            "ramp_seconds": args.ramp_seconds,
+            "script_lines": len(SCRIPT),
+        },
+        "runs": runs,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+MAAS Practice - Benchmarks
+Measures the app's own overhead against a local fake Messages API
+
+Every consultation in data/patients is driven through the real
+build_system_prompt, get_patient_response, generate_feedback,
+generate_summary and handle_command functions, and through main() with
+Streamlit's AppTest for a full scripted session (start, turns, commands,
+end, feedback). Model latency is whatever the fake API is told to add
+(nothing by default), so the numbers are the app's cost.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json   # compare with an earlier run
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_anthropic import FakeAnthropicServer, add_settings_arguments, settings_from_args  # noqa: E402
+
+# Scripted student turns; commands are mixed in the way students use them
+SCRIPT = [
+    "Hello, I'm one of the medical students. What brings you in today?",
+    "Can you tell me more about that?",
+    "When did it first start?",
+    "feedback",
+    "What makes it better or worse?",
+    "again",
+    "Is there anything that makes it better or worse?",
+    "Have you noticed anything else going on at the same time?",
+    "What do you think might be causing it?",
+    "advice",
+    "Is there anything in particular that worries you about it?",
+    "What were you hoping we could do for you today?",
+    "summary",
+    "How are things at home and at work at the moment?",
+    "Thank you for telling me all of that.",
+]
+
+# Shorter session for the memory benchmark, which runs hundreds of them
+MEMORY_SCRIPT = [SCRIPT[0], SCRIPT[1], SCRIPT[2], "summary", SCRIPT[4], SCRIPT[7]]
+
+COMMANDS = {"pause", "feedback", "advice", "summary", "again"}
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (result, elapsed milliseconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def describe(values):
+    """Summary statistics for a list of millisecond timings."""
+    if not values:
+        return {}
+    return {
+        "n": len(values),
+        "mean_ms": round(statistics.fmean(values), 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "max_ms": round(max(values), 3),
+    }
+
+
+def scripted_messages(turns):
+    """A plausible transcript of the first `turns` non-command script lines."""
+    lines = [line for line in SCRIPT if line not in COMMANDS][:turns]
+    messages = []
+    for i, line in enumerate(lines):
+        messages.append({"role": "user", "content": line})
+        messages.append({"role": "assistant", "content": f"Patient reply {i + 1}, a few sentences long as usual."})
+    return messages
+
+
+def bench_functions(app, patient, consultation, repeat):
+    """Time the prompt builders and model-call wrappers directly."""
+    from conversation_context import estimate_tokens
+
+    prompt = app.build_system_prompt(patient, consultation)
+    build_ms = [timed(app.build_system_prompt, patient, consultation)[1] for _ in range(repeat)]
+    blocks_ms = [timed(app.build_system_blocks, patient, consultation)[1] for _ in range(repeat)]
+
+    messages = scripted_messages(8)
+    history = messages + [{"role": "user", "content": "Anything else you'd like to tell me?"}]
+    calls = {
+        "patient_turn": lambda: app.get_patient_response(history, app.build_system_blocks(patient, consultation)),
+        "interim_feedback": lambda: app.generate_feedback(patient, consultation, messages, "interim"),
+        "advice": lambda: app.generate_feedback(patient, consultation, messages, "advice"),
+        "summary": lambda: app.generate_summary(patient, consultation, messages),
+        "full_feedback": lambda: app.generate_feedback(patient, consultation, messages, "full"),
+    }
+    for command in ("feedback", "advice", "summary"):
+        calls[f"command_{command}"] = (
+            lambda command=command: app.handle_command(command, patient, consultation, messages)
+        )
+
+    return {
+        "prompt": {
+            "chars": len(prompt),
+            "tokens_est": estimate_tokens(prompt),
+            "build": describe(build_ms),
+            "blocks_cached": describe(blocks_ms),
+        },
+        "calls": {name: describe([timed(call)[1] for _ in range(repeat)]) for name, call in calls.items()},
+    }
+
+
+def run_session(patient, consultation, script):
+    """Drive main() through one scripted consultation with AppTest.
+
+    Returns (per-turn rerun timings, AppTest instance).
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=60)
+    at.run()
+    at.sidebar.selectbox[0].select(patient["patient"]["name"]).run()
+    at.sidebar.selectbox[1].select(f"{consultation['consultation_id']}. {consultation['title']}").run()
+    start_button = next(b for b in at.sidebar.button if b.label == "Start Interview")
+    start_button.click().run()
+
+    turns = {"turn": [], "command": []}
+    for line in script:
+        _, ms = timed(at.chat_input[0].set_value(line).run)
+        turns["command" if line in COMMANDS else "turn"].append(ms)
+        if at.exception:
+            raise RuntimeError(f"{patient['patient_id']}/{consultation['consultation_id']}: {at.exception}")
+
+    end_button = next(b for b in at.sidebar.button if b.label == "End Interview")
+    _, turns["end"] = timed(end_button.click().run)
+    skip_button = next(b for b in at.button if b.label == "Skip")
+    _, turns["feedback_screen"] = timed(skip_button.click().run)
+    _, turns["ended_rerun"] = timed(at.run)
+    if at.exception:
+        raise RuntimeError(f"{patient['patient_id']}/{consultation['consultation_id']}: {at.exception}")
+    return turns, at
+
+
+def session_state_bytes(at):
+    """Pickled size of the session's own state (unpicklable values skipped)."""
+    state = at.session_state
+    items = state.items() if hasattr(state, "items") else state.filtered_state.items()
+    total = 0
+    for _, value in items:
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            pass
+    return total
+
+
+def bench_session(patient, consultation, script):
+    turns, at = run_session(patient, consultation, script)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    _, measured = run_session(patient, consultation, script)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    return {
+        "reruns": {
+            "turn": describe(turns["turn"]),
+            "command": describe(turns["command"]),
+            "end_ms": round(turns["end"], 3),
+            "feedback_screen_ms": round(turns["feedback_screen"], 3),
+            "ended_rerun_ms": round(turns["ended_rerun"], 3),
+            "turn_ms": [round(ms, 3) for ms in turns["turn"]],
+        },
+        "memory": {
+            "session_state_bytes": session_state_bytes(measured),
+            "tracemalloc_retained_bytes": retained,
+        },
+    }
+
+
+def state_values(at):
+    """The values a session keeps in st.session_state."""
+    state = at.session_state
+    items = state.items() if hasattr(state, "items") else state.filtered_state.items()
+    return [value for _, value in items]
+
+
+def unique_bytes(roots, seen):
+    """Size of the objects reachable from ``roots`` that aren't in ``seen`` (which is updated).
+
+    Functions, classes and modules are not followed, so shared code and
+    globals aren't counted; objects shared between sessions are counted once.
+    """
+    total = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def rss_mb():
+    """Resident memory of this process (Linux only, else None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def bench_memory(patient, consultation, counts, script):
+    """Memory per session with many finished sessions held at once.
+
+    Each session runs the script to the ended-session screen and only its
+    session state is kept, as the server keeps it for a connected student.
+    ``state_bytes_per_session`` counts what the sessions hold between them
+    (shared case objects once), divided by the number of sessions.
+    """
+    run_session(patient, consultation, script)  # Load modules and shared caches first
+    gc.collect()
+    rss_before = rss_mb()
+    seen = set()
+    sessions = []
+    total = 0
+    results = {}
+    for count in sorted(counts):
+        while len(sessions) < count:
+            _, at = run_session(patient, consultation, script)
+            sessions.append(state_values(at))
+            total += unique_bytes(sessions[-1], seen)
+            del at
+        gc.collect()
+        rss = rss_mb()
+        results[str(count)] = {
+            "sessions": count,
+            "state_bytes_per_session": total // count,
+            "rss_mb_per_100_sessions": round((rss - rss_before) * 100 / count, 1) if rss and rss_before else None,
+        }
+    return results
+
+
+def quiet_streamlit():
+    """Silence Streamlit's bare-mode warnings so the report stays readable."""
+    import streamlit.logger
+
+    streamlit.logger.set_log_level("error")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(value, prefix=""):
+    """Flatten nested dicts into {"a.b.c": number} for comparison."""
+    items = {}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        items[prefix] = value
+    return items
+
+
+def compare(baseline, current):
+    """Print metrics that moved between two benchmark results."""
+    def by_case(result):
+        return {f"{c['patient_id']}/{c['consultation_id']}": c for c in result["cases"]}
+
+    old_cases, new_cases = by_case(baseline), by_case(current)
+    print(f"{'metric':70} {'baseline':>12} {'current':>12} {'change':>8}")
+    for case_id in sorted(set(old_cases) & set(new_cases)):
+        old, new = flatten(old_cases[case_id]), flatten(new_cases[case_id])
+        for key in sorted(set(old) & set(new)):
+            if key in ("consultation_id",) or old[key] == new[key]:
+                continue
+            change = f"{(new[key] - old[key]) / old[key] * 100:+.0f}%" if old[key] else "new"
+            print(f"{case_id + ' ' + key:70} {old[key]:>12.1f} {new[key]:>12.1f} {change:>8}")
+    old_memory = flatten((baseline.get("memory") or {}).get("by_sessions", {}))
+    new_memory = flatten((current.get("memory") or {}).get("by_sessions", {}))
+    for key in sorted(set(old_memory) & set(new_memory)):
+        if old_memory[key] != new_memory[key]:
+            change = f"{(new_memory[key] - old_memory[key]) / old_memory[key] * 100:+.0f}%" if old_memory[key] else "new"
+            print(f"{'memory ' + key:70} {old_memory[key]:>12.1f} {new_memory[key]:>12.1f} {change:>8}")
+
+
+def response_cache_stats():
+    from response_cache import response_cache
+    return response_cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MAAS Practice against a fake Messages API.")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of each direct call")
+    parser.add_argument("--patients", nargs="*", help="Only these patient ids")
+    parser.add_argument("--skip-sessions", action="store_true", help="Skip the AppTest sessions")
+    parser.add_argument("--memory-sessions", nargs="*", type=int, default=[],
+                        help="Also measure memory with this many sessions open at once, e.g. 100 500")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    quiet_streamlit()
+    server = FakeAnthropicServer(settings_from_args(args)).start()
+    os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+    os.environ["ANTHROPIC_API_KEY"] = "fake-key"
+    # Measure the app, not the rate limiter (queueing is still exercised)
+    os.environ.setdefault("MAAS_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("MAAS_TOKENS_PER_MINUTE", "0")
+    # Replay-friendly: repeated identical turns are served from the response cache
+    os.environ.setdefault("MAAS_CACHE_PATIENT_TURNS", "1")
+    os.environ.setdefault("MAAS_RESPONSE_CACHE", "")  # Memory only, so every run starts cold
+    # Keep benchmark sessions and calls out of data/maas.db and data/metrics
+    work_dir = tempfile.mkdtemp(prefix="maas-bench-")
+    os.environ["MAAS_SESSION_DB"] = str(Path(work_dir) / "maas.db")
+    os.environ["MAAS_METRICS"] = "0"
+
+    import app
+
+    cases = []
+    try:
+        for patient_id, patient in sorted(app.load_patients().items()):
+            if args.patients and patient_id not in args.patients:
+                continue
+            for consultation in patient.get("consultations", []):
+                print(f"Benchmarking {patient_id} / {consultation['consultation_id']}...", file=sys.stderr)
+                case = {
+                    "patient_id": patient_id,
+                    "consultation_id": consultation["consultation_id"],
+                    "title": consultation["title"],
+                }
+                case.update(bench_functions(app, patient, consultation, args.repeat))
+                if not args.skip_sessions:
+                    case.update(bench_session(patient, consultation, SCRIPT))
+                cases.append(case)
+        memory = None
+        if args.memory_sessions:
+            patient_id = args.patients[0] if args.patients else sorted(app.load_patients())[0]
+            patient = app.load_patients()[patient_id]
+            consultation = patient["consultations"][0]
+            print(f"Measuring memory of {args.memory_sessions} open sessions...", file=sys.stderr)
+            memory = {
+                "patient_id": patient_id,
+                "consultation_id": consultation["consultation_id"],
+                "by_sessions": bench_memory(patient, consultation, args.memory_sessions, MEMORY_SCRIPT),
+            }
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "fake_api": {k: v for k, v in vars(server.settings).items() if k != "random"},
+            "api_requests": server.requests,
+            "response_cache": response_cache_stats(),
+            "script_lines": len(SCRIPT),
+        },
+        "cases": cases,
+    }
+    if memory:
+        result["memory"] = memory
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    elif not args.baseline:
+        print(output)
+
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text()), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+MAAS Practice - Case Catalogue
+Small on-disk index of the case library with just what the sidebar shows
+
+The index (data/catalogue.json by default) holds, per patient file, the
+file's name, mtime and size, the patient's name and id, and each
+consultation's id, title, type, difficulty, duration and learning
+objectives. Sidebar rendering reads only this index; a patient file is
+parsed again only when it has changed since the index was written.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from case_model import CaseValidationError, validate_patient
+
+INDEX_VERSION = 1
+
+
+def _signature(path):
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def catalogue_entry(patient, file_name, signature):
+    """Build the index entry for one validated patient dict."""
+    return {
+        "file": file_name,
+        "signature": signature,
+        "patient_id": patient["patient_id"],
+        "name": patient["patient"]["name"],
+        "consultations": [
+            {
+                "consultation_id": c["consultation_id"],
+                "title": c["title"],
+                "type": c.get("type"),
+                "difficulty": c.get("difficulty"),
+                "estimated_duration_minutes": c.get("estimated_duration_minutes"),
+                "learning_objectives": c.get("learning_objectives") or [],
+            }
+            for c in patient.get("consultations", [])
+        ],
+    }
+
+
+class CaseCatalogue:
+    """Index of data/patients, rebuilt incrementally when source files change.
+
+    Changed files are re-read and validated, so files that fail validation
+    are listed in ``errors`` and never appear in the catalogue.
+    """
+
+    def __init__(self, patients_dir, index_path, check_interval=2.0):
+        self.patients_dir = Path(patients_dir)
+        self.index_path = Path(index_path)
+        self.check_interval = check_interval
+        self.parsed = 0  # Patient files parsed by this instance
+        self._lock = threading.RLock()
+        self._files = {}  # file name -> entry
+        self._errors = {}  # file name -> {"signature", "message"}
+        self._by_patient = {}
+        self._last_scan = None
+        self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION:
+            return
+        self._files = index.get("files", {})
+        self._errors = index.get("errors", {})
+        self._reindex()
+
+    def _write_index(self):
+        index = {"version": INDEX_VERSION, "files": self._files, "errors": self._errors}
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, prefix=".catalogue-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _reindex(self):
+        self._by_patient = {entry["patient_id"]: entry for _, entry in sorted(self._files.items())}
+
+    def refresh(self, force=False):
+        """Bring the index up to date with data/patients (throttled)."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_scan is not None and now - self._last_scan < self.check_interval:
+                return
+            self._last_scan = now
+
+            paths = sorted(self.patients_dir.glob("*.json")) if self.patients_dir.exists() else []
+            names = {path.name for path in paths}
+            changed = False
+            for name in (set(self._files) | set(self._errors)) - names:
+                self._files.pop(name, None)
+                self._errors.pop(name, None)
+                changed = True
+
+            for path in paths:
+                signature = _signature(path)
+                if signature is None:
+                    continue
+                known = self._files.get(path.name) or self._errors.get(path.name)
+                if known and known["signature"] == signature:
+                    continue
+                changed = True
+                self.parsed += 1
+                try:
+                    with open(path, "r") as f:
+                        patient = json.load(f)
+                    validate_patient(patient, path.name)
+                except CaseValidationError as e:
+                    message = "; ".join(e.problems)
+                except (ValueError, OSError) as e:
+                    message = str(e)
+                else:
+                    self._files[path.name] = catalogue_entry(patient, path.name, signature)
+                    self._errors.pop(path.name, None)
+                    continue
+                self._files.pop(path.name, None)
+                self._errors[path.name] = {"signature": signature, "message": message}
+
+            if changed:
+                self._reindex()
+                self._write_index()
+
+    def patients(self):
+        """Return catalogue entries keyed by patient_id, in file name order."""
+        self.refresh()
+        return self._by_patient
+
+    def entry(self, patient_id):
+        """Return one patient's catalogue entry, or None."""
+        return self.patients().get(patient_id)
+
+    def path(self, patient_id):
+        """Return the source file of a patient, or None."""
+        entry = self.entry(patient_id)
+        return self.patients_dir / entry["file"] if entry else None
+
+    def errors(self):
+        """Return {file name: message} for rejected patient files."""
+        self.refresh()
+        return {name: error["message"] for name, error in self._errors.items()}
@@ -0,0 +1,383 @@
+"""
+MAAS Practice - Case Model
+Validates patient files and compiles each consultation into an immutable case
+
+Compiling renders every prompt section once, at load time, so building a
+system prompt during a consultation is plain string concatenation and a
+malformed case file is rejected before any student can start it.
+"""
+
+import json
+
+from hint_engine import index_case
+from prompt_compaction import items, labelled_items, line, section
+
+
+class CaseValidationError(ValueError):
+    """A patient file does not match the case schema."""
+
+    def __init__(self, source, problems):
+        self.source = source
+        self.problems = problems
+        super().__init__(f"{source}: " + "; ".join(problems))
+
+
+class OptionalKey:
+    """Schema marker for a key that may be missing (or null)."""
+
+    def __init__(self, spec):
+        self.spec = spec
+
+
+TEXT = (str, int, float)
+
+CONSULTATION_SCHEMA = {
+    "consultation_id": int,
+    "title": str,
+    "type": OptionalKey(str),
+    "difficulty": OptionalKey(str),
+    "estimated_duration_minutes": OptionalKey((int, float)),
+    "scenario": {
+        "time_context": TEXT,
+        "appearance": TEXT,
+        "emotional_state": TEXT,
+        "trust_level": TEXT,
+    },
+    "history_at_this_point": {
+        "current_medications": OptionalKey(list),
+    },
+    "presenting_problem": {
+        "stated_reason": TEXT,
+        "real_reason": TEXT,
+        "hidden_agenda": OptionalKey(TEXT),
+    },
+    "complaint": {
+        "chief_complaint": TEXT,
+        "heuristic_1_nature": object,
+        "heuristic_2_time": object,
+        "heuristic_3_modifiers": object,
+        "heuristic_4_accompanying": object,
+    },
+    "ideas_concerns_expectations": OptionalKey(dict),
+    "for_follow_up": OptionalKey({
+        "interval": OptionalKey(dict),
+        "results": OptionalKey(dict),
+    }),
+    "red_flags": {
+        "present": OptionalKey(list),
+        "absent": OptionalKey(list),
+    },
+    "simulation_guidance": {
+        "information_reveal": {
+            "freely_shared": list,
+            "if_asked_directly": list,
+            "if_asked_sensitively": list,
+            "will_not_share": list,
+        },
+        "emotional_moments": OptionalKey(list),
+        "guardrails": object,
+    },
+    "maas_focus": OptionalKey(dict),
+    "learning_objectives": OptionalKey(list),
+}
+
+PATIENT_SCHEMA = {
+    "patient_id": str,
+    "patient": {
+        "name": str,
+        "age": TEXT,
+        "gender": TEXT,
+        "occupation": TEXT,
+        "education_level": TEXT,
+        "personality": {
+            "baseline_style": TEXT,
+            "trust_building": TEXT,
+            "core_traits": object,
+        },
+    },
+    "background": {
+        "living_situation": TEXT,
+        "family": TEXT,
+        "support_system": TEXT,
+        "work_context": TEXT,
+    },
+    "baseline_medical_history": {
+        "past_medical": OptionalKey(list),
+        "allergies": OptionalKey(list),
+        "family_history": OptionalKey(list),
+        "social_history": dict,
+    },
+    "consultations": [CONSULTATION_SCHEMA],
+}
+
+
+def _type_name(spec):
+    if isinstance(spec, tuple):
+        return " or ".join(t.__name__ for t in spec)
+    return spec.__name__
+
+
+def _check(value, spec, path, problems):
+    """Append a message to problems for every mismatch between value and spec."""
+    if isinstance(spec, OptionalKey):
+        if value is not None:
+            _check(value, spec.spec, path, problems)
+    elif isinstance(spec, dict):
+        if not isinstance(value, dict):
+            problems.append(f"{path} should be an object")
+            return
+        for key, child in spec.items():
+            child_path = f"{path}.{key}" if path else key
+            if key not in value or value[key] is None:
+                if not isinstance(child, OptionalKey):
+                    problems.append(f"{child_path} is missing")
+                continue
+            _check(value[key], child, child_path, problems)
+    elif isinstance(spec, list):
+        if not isinstance(value, list):
+            problems.append(f"{path} should be a list")
+            return
+        for i, item in enumerate(value):
+            _check(item, spec[0], f"{path}[{i}]", problems)
+    elif spec is not object and not isinstance(value, spec):
+        problems.append(f"{path} should be {_type_name(spec)}, not {type(value).__name__}")
+
+
+def validate_patient(patient, source="patient file"):
+    """Raise CaseValidationError listing every schema problem in a patient dict."""
+    problems = []
+    _check(patient, PATIENT_SCHEMA, "", problems)
+    ids = [c.get("consultation_id") for c in patient.get("consultations", []) if isinstance(c, dict)]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1}, key=str)
+    if duplicates:
+        problems.append(f"duplicate consultation_id {duplicates}")
+    if problems:
+        raise CaseValidationError(source, problems)
+
+
+# Prompt sections. Each renders once per consultation at compile time, as
+# dense text with empty fields left out (see prompt_compaction).
+
+def _identity_section(patient):
+    p = patient['patient']
+    personality = p['personality']
+    return section(
+        "Patient Identity (Constant)",
+        line("Name", p['name']),
+        line("Age", f"{p['age']} years old"),
+        line("Gender", p['gender']),
+        line("Occupation", p['occupation']),
+        line("Education", p['education_level']),
+        line("Personality", {
+            "style": personality['baseline_style'],
+            "trust_building": personality['trust_building'],
+            "core_traits": personality['core_traits'],
+        }),
+    )
+
+
+def _background_section(patient):
+    bg = patient['background']
+    return section(
+        "Background",
+        line("Living situation", bg['living_situation']),
+        line("Family", bg['family']),
+        line("Support system", bg['support_system']),
+        line("Work context", bg['work_context']),
+    )
+
+
+def _medical_history_section(patient, consultation):
+    history = patient['baseline_medical_history']
+    social = history['social_history']
+    return section(
+        "Medical History at This Point",
+        line("Past medical", history.get('past_medical')),
+        line("Current medications", consultation['history_at_this_point'].get('current_medications')),
+        line("Allergies", history.get('allergies')),
+        line("Family history", history.get('family_history')),
+        line("Smoking", social.get('smoking')),
+        line("Alcohol", social.get('alcohol')),
+    )
+
+
+def _scenario_section(consultation):
+    scenario = consultation['scenario']
+    return section(
+        "This Consultation",
+        line("Setting", scenario['time_context']),
+        line("Appearance", scenario['appearance']),
+        line("Emotional state", scenario['emotional_state']),
+        line("Trust level", scenario['trust_level']),
+    )
+
+
+def _presenting_problem_section(consultation):
+    problem = consultation['presenting_problem']
+    return section(
+        "Presenting Problem",
+        line("Stated reason", problem['stated_reason']),
+        line("Real reason", problem['real_reason']),
+        line("Hidden agenda", problem.get('hidden_agenda')),
+    )
+
+
+def _ice_section(consultation):
+    ice = consultation.get('ideas_concerns_expectations') or {}
+    return section(
+        "Ideas, Concerns, Expectations",
+        line("Ideas (what patient thinks)", ice.get('ideas')),
+        line("Concerns (what patient fears)", ice.get('concerns')),
+        line("Expectations (what patient wants)", ice.get('expectations')),
+    )
+
+
+def _clinical_section(consultation):
+    complaint = consultation['complaint']
+    return section(
+        "Clinical Information",
+        line("Chief Complaint", complaint['chief_complaint']),
+        labelled_items("Heuristic 1 - Nature", complaint['heuristic_1_nature']),
+        labelled_items("Heuristic 2 - Time", complaint['heuristic_2_time']),
+        labelled_items("Heuristic 3 - Modifiers", complaint['heuristic_3_modifiers']),
+        labelled_items("Heuristic 4 - Accompanying", complaint['heuristic_4_accompanying']),
+    )
+
+
+def _follow_up_section(consultation, carried=False):
+    """Follow-up context; ``carried`` leaves out the authored account of the previous visit.
+
+    That account is replaced by the student's own visit (see patient_history).
+    """
+    fu = consultation.get("for_follow_up")
+    if not fu:
+        return ""
+    interval = fu.get('interval') or {}
+    results = fu.get('results') or {}
+    previous_visit = "" if carried else "".join((
+        line("Previous consultation", fu.get('previous_consultation_summary')),
+        labelled_items("What was recommended", fu.get('what_was_recommended')),
+        labelled_items("What patient remembers", fu.get('what_patient_remembers')),
+        labelled_items("What patient forgot", fu.get('what_patient_forgot')),
+    ))
+    return section(
+        "Follow-Up Context",
+        previous_visit,
+        line("Interval since last visit", interval.get('duration')),
+        line("Symptom evolution", interval.get('symptom_evolution')),
+        line("Compliance", (interval.get('compliance') or {}).get('details')),
+        line("Patient experience during interval", interval.get('patient_experience')),
+        labelled_items("Test results to discuss", results.get('tests')),
+        line("How to explain results", results.get('how_to_explain')),
+    )
+
+
+def _red_flags_section(consultation):
+    flags = consultation['red_flags']
+    return section(
+        "Red Flags",
+        line("Present", flags.get('present')),
+        line("Absent", flags.get('absent')),
+        line("Notes", flags.get('notes')),
+    )
+
+
+def _reveal_rules_section(consultation):
+    guidance = consultation['simulation_guidance']
+    reveal = guidance['information_reveal']
+    return section(
+        "Information Reveal Rules",
+        labelled_items("Freely shared (volunteer without prompting)", reveal['freely_shared']),
+        labelled_items("If asked directly", reveal['if_asked_directly']),
+        labelled_items("If asked sensitively (requires trust)", reveal['if_asked_sensitively']),
+        labelled_items("Will not share (protect until significant rapport)", reveal['will_not_share']),
+        labelled_items("Emotional moments (topics that trigger emotion)", guidance.get('emotional_moments')),
+    )
+
+
+def _guardrails_section(consultation):
+    return section("Guardrails", items(consultation['simulation_guidance']['guardrails']))
+
+
+def _closing_section(patient):
+    return f"""---
+
+You are now {patient['patient']['name']}. Wait for the student to speak first.
+"""
+
+
+class CompiledCase:
+    """One consultation of one patient, validated and pre-rendered.
+
+    Instances are immutable and shared by every session that runs the case.
+    """
+
+    __slots__ = (
+        "patient_id", "consultation_id", "patient_name", "title", "type", "difficulty",
+        "duration_minutes", "learning_objectives", "sections", "case_prompt", "case_prompt_carried",
+        "objectives_json", "maas_focus_json", "hints", "follow_up",
+    )
+
+    def __init__(self, patient, consultation):
+        values = {
+            "patient_id": patient["patient_id"],
+            "consultation_id": consultation["consultation_id"],
+            "patient_name": patient["patient"]["name"],
+            "title": consultation["title"],
+            "type": consultation.get("type"),
+            "difficulty": consultation.get("difficulty"),
+            "duration_minutes": consultation.get("estimated_duration_minutes"),
+            "learning_objectives": tuple(consultation.get("learning_objectives") or ()),
+            "sections": (
+                ("identity", _identity_section(patient)),
+                ("background", _background_section(patient)),
+                ("medical_history", _medical_history_section(patient, consultation)),
+                ("scenario", _scenario_section(consultation)),
+                ("presenting_problem", _presenting_problem_section(consultation)),
+                ("ice", _ice_section(consultation)),
+                ("clinical", _clinical_section(consultation)),
+                ("follow_up", _follow_up_section(consultation)),
+                ("red_flags", _red_flags_section(consultation)),
+                ("reveal_rules", _reveal_rules_section(consultation)),
+                ("guardrails", _guardrails_section(consultation)),
+                ("closing", _closing_section(patient)),
+            ),
+            "objectives_json": json.dumps(consultation.get("learning_objectives", []), indent=2),
+            "maas_focus_json": json.dumps(consultation.get("maas_focus", {}), indent=2),
+            "hints": index_case(patient, consultation),
+            "follow_up": bool(consultation.get("for_follow_up")),
+        }
+        values["case_prompt"] = "".join(text for _, text in values["sections"])
+        # The same prompt for a follow-up that carries the student's own previous visit
+        carried = _follow_up_section(consultation, carried=True)
+        values["case_prompt_carried"] = "".join(
+            carried if name == "follow_up" else text for name, text in values["sections"]
+        )
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"<CompiledCase {self.patient_id}/{self.consultation_id}: {self.title}>"
+
+
+def compile_case(patient, consultation):
+    """Compile one consultation (the patient is assumed to be validated)."""
+    return CompiledCase(patient, consultation)
+
+
+def compile_patient(patient, source="patient file"):
+    """Validate a patient dict and compile all its consultations.
+
+    Returns {consultation_id: CompiledCase}; raises CaseValidationError.
+    """
+    validate_patient(patient, source)
+    try:
+        return {c["consultation_id"]: compile_case(patient, c) for c in patient["consultations"]}
+    except (KeyError, TypeError, AttributeError) as e:
+        raise CaseValidationError(source, [f"could not render prompt: {e!r}"]) from e
@@ -0,0 +1,141 @@
+"""
+MAAS Practice - Case Repository
+Loads patient cases and prompts on demand and reloads only files that changed
+"""
+
+import json
+import threading
+from pathlib import Path
+
+from case_catalogue import CaseCatalogue
+from case_model import CaseValidationError, compile_patient
+
+
+def _signature(path):
+    """Return (mtime_ns, size) for a file, or None if it can't be read."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class CaseRepository:
+    """Cached, mtime-invalidated view of data/patients and data/prompts.
+
+    What patients and consultations exist comes from the lightweight
+    CaseCatalogue index, so listing cases never parses a patient file. A
+    full patient file is parsed, validated and compiled (see case_model)
+    only when one of its consultations is requested, and again only when
+    its modification time or size changes. Files that fail are left out
+    and reported by ``load_errors()``.
+    """
+
+    def __init__(self, patients_dir, prompts_dir, index_path=None, check_interval=2.0):
+        self.patients_dir = Path(patients_dir)
+        self.prompts_dir = Path(prompts_dir)
+        self.catalogue = CaseCatalogue(
+            self.patients_dir,
+            index_path or self.patients_dir.parent / "catalogue.json",
+            check_interval=check_interval,
+        )
+        self._lock = threading.RLock()
+        self._files = {}  # path -> (signature, patient dict, compiled cases)
+        self._errors = {}  # path -> (signature, message)
+        self._prompts = {}  # name -> (signature, text)
+        self.reloads = 0
+
+    def refresh(self, force=False):
+        """Rescan the patients folder (throttled unless forced)."""
+        self.catalogue.refresh(force)
+
+    def _load(self, path):
+        """Return (patient, compiled cases) for a file, re-reading it only if it changed."""
+        signature = _signature(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if signature is None or (cached and cached[0] == signature):
+                return (cached[1], cached[2]) if cached else (None, {})
+            error = self._errors.get(path)
+            if error and error[0] == signature:
+                return None, {}
+            self.reloads += 1
+            try:
+                with open(path, "r") as f:
+                    patient = json.load(f)
+                compiled = compile_patient(patient, path.name)
+            except CaseValidationError as e:
+                message = "; ".join(e.problems)
+            except (json.JSONDecodeError, OSError) as e:
+                message = str(e)
+            else:
+                self._errors.pop(path, None)
+                self._files[path] = (signature, patient, compiled)
+                return patient, compiled
+            self._files.pop(path, None)
+            self._errors[path] = (signature, message)
+            return None, {}
+
+    def catalogue_entries(self):
+        """Return sidebar metadata for every patient, keyed by patient_id (no file parsing)."""
+        return self.catalogue.patients()
+
+    def patient(self, patient_id):
+        """Return one full patient dict by id, or None."""
+        path = self.catalogue.path(patient_id)
+        return self._load(path)[0] if path else None
+
+    def patients(self):
+        """Return every full patient dict keyed by patient_id (parses all files)."""
+        patients = {}
+        for patient_id in self.catalogue_entries():
+            patient = self.patient(patient_id)
+            if patient is not None:
+                patients[patient_id] = patient
+        return patients
+
+    def consultation(self, patient_id, consultation_id):
+        """Return one consultation by (patient_id, consultation_id), or None."""
+        patient = self.patient(patient_id)
+        for consultation in (patient or {}).get("consultations", []):
+            if consultation["consultation_id"] == consultation_id:
+                return consultation
+        return None
+
+    def compiled(self, patient_id, consultation_id):
+        """Return the CompiledCase for (patient_id, consultation_id), or None."""
+        path = self.catalogue.path(patient_id)
+        return self._load(path)[1].get(consultation_id) if path else None
+
+    def patient_signature(self, patient_id):
+        """Return the patient file's (mtime_ns, size), or None if it isn't in data/patients."""
+        path = self.catalogue.path(patient_id)
+        return _signature(path) if path else None
+
+    def load_errors(self):
+        """Return {file name: message} for patient files that were rejected."""
+        errors = self.catalogue.errors()
+        with self._lock:
+            for path, (_, message) in self._errors.items():
+                errors.setdefault(path.name, message)
+        return errors
+
+    def prompt(self, prompt_name):
+        """Return a prompt's text ("" if missing), re-reading it only when it changed."""
+        path = self.prompts_dir / f"{prompt_name}.txt"
+        signature = _signature(path)
+        with self._lock:
+            cached = self._prompts.get(prompt_name)
+            if cached and cached[0] == signature:
+                return cached[1]
+            text = ""
+            if signature is not None:
+                with open(path, "r") as f:
+                    text = f.read()
+            self._prompts[prompt_name] = (signature, text)
+            return text
+
+    def prompt_mtime(self, prompt_name):
+        """Return a prompt file's modification time in nanoseconds (0 if missing)."""
+        signature = _signature(self.prompts_dir / f"{prompt_name}.txt")
+        return signature[0] if signature else 0
@@ -15,3 +15,153 @@ APP_SUBTITLE = "Patient Responses Adapted to Clinical Technique in Calibrated En
 
 # Session Settings
 MAX_TURNS = 50  # Maximum conversation turns before auto-end
+
+# API Client Settings (one pooled client is shared by every session)
+API_MAX_CONNECTIONS = int(os.environ.get("MAAS_API_MAX_CONNECTIONS", 50))
+API_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("MAAS_API_MAX_KEEPALIVE", 20))
+API_KEEPALIVE_EXPIRY = 60.0  # Seconds an idle connection stays open
+API_TIMEOUT = 60.0  # Seconds per request
+API_CONNECT_TIMEOUT = 5.0
+API_MAX_RETRIES = 0  # Retries are done by the request scheduler, which backs off without holding a slot
+SHOW_CONNECTION_STATS = os.environ.get("MAAS_SHOW_CONNECTION_STATS") == "1"
+
+# Request Scheduler (every model call in this process waits its turn here)
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("MAAS_MAX_CONCURRENT_CALLS", 16))
+SCHEDULER_WORKER_PROCESSES = max(1, int(os.environ.get("MAAS_WORKER_PROCESSES", 1)))  # Server processes sharing the API key
+
+
+def _process_share(limit):
+    """This process's share of a per-minute limit of the whole API key (0 stays 0, no limit)."""
+    return max(1, limit // SCHEDULER_WORKER_PROCESSES) if limit > 0 else 0
+
+
+# The API key's limits, split evenly between SCHEDULER_WORKER_PROCESSES
+SCHEDULER_REQUESTS_PER_MINUTE = _process_share(int(os.environ.get("MAAS_REQUESTS_PER_MINUTE", 50)))  # 0 = no limit
+SCHEDULER_TOKENS_PER_MINUTE = _process_share(int(os.environ.get("MAAS_TOKENS_PER_MINUTE", 30000)))  # Uncached prompt tokens, 0 = no limit
+SCHEDULER_PROMPT_CACHE_SECONDS = 300  # How long a cached system prompt prefix is expected to stay in the prompt cache
+SCHEDULER_PROMPT_CACHE_MIN_TOKENS = 1024  # Shorter prefixes aren't cached by the provider
+SCHEDULER_MAX_RETRIES = 4
+SCHEDULER_BACKOFF_BASE = 0.5  # Seconds; doubled per retry, with full jitter
+SCHEDULER_BACKOFF_MAX = 20.0
+SCHEDULER_PRIORITIES = {  # Lower runs first
+    "patient_turn": 0,
+    "advice": 1,
+    "interim_feedback": 1,
+    "summary": 2,
+    "full_feedback": 2,
+    "context_summary": 3,
+    "visit_digest": 3,
+    "warm_start": 4,
+}
+
+# Response Cache (identical requests are answered from cache)
+RESPONSE_CACHE_CALL_TYPES = {"summary", "interim_feedback", "advice", "full_feedback"}
+if os.environ.get("MAAS_CACHE_PATIENT_TURNS") == "1":  # For demos and benchmarks; replies become repeatable
+    RESPONSE_CACHE_CALL_TYPES.add("patient_turn")
+RESPONSE_CACHE_MEMORY_ENTRIES = 512
+RESPONSE_CACHE_DISK_PATH = os.environ.get(
+    "MAAS_RESPONSE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "response_cache.db")
+) or None  # Set MAAS_RESPONSE_CACHE= (empty) for memory only
+RESPONSE_CACHE_DISK_ENTRIES = 10000
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Prompt Budget (estimated tokens of each consultation's patient simulation system prompt)
+PROMPT_TOKEN_BUDGET = 3000  # Check with: python prompt_compaction.py
+PROMPT_TOKEN_BUDGETS = {  # Per-case overrides, keyed "patient_id/consultation_id"
+    "maria/3": 3800,  # Mother and son in one consultation
+}
+PROMPT_BASE_SKIP_SECTIONS = (  # Base prompt sections the rendered case already covers
+    "Loading a Case",  # The case is already extracted into sections
+    "Starting the Simulation",  # The case's closing line says to wait for the student
+)
+
+# Feedback Prompts (long consultations send an elicitation digest plus recent turns)
+FEEDBACK_DIGEST_AFTER_EXCHANGES = 12  # Shorter transcripts are sent whole
+FEEDBACK_RECENT_EXCHANGES = 4  # Always sent verbatim alongside the digest
+
+# Warm Start (compile every case and pre-generate opening replies when the server starts)
+WARM_START_ENABLED = os.environ.get("MAAS_WARM_START") == "1"
+WARM_START_GREETINGS = [  # Matched ignoring case, punctuation and the patient's name
+    "Hello",
+    "Hi",
+    "Good morning",
+    "Good afternoon",
+    "Hello, how are you?",
+    "Hello, what brings you in today?",
+]
+WARM_START_OPENERS_PER_GREETING = 2  # Replies kept per greeting; 0 = only compile and prime the prompt cache
+WARM_START_WORKERS = 4  # Cases warmed at once (calls still wait their turn in the scheduler)
+
+# Local Hints ("advice" answered from the case's reveal rules without a model call)
+LOCAL_HINTS_ENABLED = True
+LOCAL_HINT_MIN_CONFIDENCE = 0.6  # Below this the model gives the hint instead
+
+# Case Library
+CASE_RELOAD_CHECK_SECONDS = 2.0  # How often data/patients is checked for changes
+
+# Background Work
+BACKGROUND_WORKERS = 8  # Threads for background model calls (summaries, feedback)
+
+# Carry-Forward (a follow-up consultation remembers what happened in the student's own earlier visit)
+CARRY_FORWARD_ENABLED = True
+CARRY_FORWARD_MAX_ITEMS = 4  # Items kept per digest field, so the digest stays the same size
+CARRY_FORWARD_ITEM_CHARS = 160
+CARRY_FORWARD_WAIT_SECONDS = 15.0  # Longest a follow-up waits for the previous visit's digest to finish
+
+# Batch Grading (python batch_grader.py)
+BATCH_GRADING_WORKERS = 8  # Feedback requests in flight at once (the scheduler's limits still apply)
+BATCH_GRADING_BATCH_SIZE = 1000  # Requests per Message Batch with --batch
+BATCH_GRADING_POLL_SECONDS = 30.0  # How often a running batch is checked
+
+# Conversation Context (what is sent to the model, not what the UI shows)
+CONTEXT_KEEP_EXCHANGES = 8  # Recent exchanges always sent verbatim
+CONTEXT_FOLD_BATCH = 4  # Older exchanges folded into the summary per update
+CONTEXT_TOKEN_BUDGET = 6000  # Estimated tokens of verbatim history before folding early
+CONTEXT_SUMMARY_MAX_TOKENS = 400
+
+# Model Routing (per call type; keys a route leaves out come from DEFAULT_ROUTE)
+FAST_MODEL = "claude-haiku-4-5-20251001"  # For quick commands that should come back in a second or two
+DEFAULT_ROUTE = {
+    "model": MODEL,
+    "max_tokens": MAX_TOKENS,
+    "temperature": None,  # None = API default
+    "timeout": API_TIMEOUT,  # Seconds
+    "fallback": FAST_MODEL,  # Used when the model is overloaded, times out or is retired (None = no fallback)
+}
+MODEL_ROUTES = {
+    "patient_turn": {},
+    "interim_feedback": {"model": FAST_MODEL, "max_tokens": 500, "timeout": 20.0, "fallback": MODEL},
+    "advice": {"model": FAST_MODEL, "max_tokens": 500, "timeout": 20.0, "fallback": MODEL},
+    "summary": {"max_tokens": 1000},
+    "full_feedback": {"max_tokens": 1500, "timeout": 120.0},
+    "context_summary": {"model": FAST_MODEL, "max_tokens": CONTEXT_SUMMARY_MAX_TOKENS, "fallback": MODEL},
+    "visit_digest": {"model": FAST_MODEL, "max_tokens": 400, "fallback": MODEL},
+}
+
+# Metrics (one JSON line per model call)
+METRICS_ENABLED = os.environ.get("MAAS_METRICS", "1") != "0"
+METRICS_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "metrics", "calls.jsonl")
+METRICS_LOG_MAX_BYTES = 10 * 1024 * 1024
+METRICS_LOG_BACKUPS = 5
+ADMIN_PAGE_ENABLED = os.environ.get("MAAS_ADMIN") == "1"  # Open with ?view=admin
+
+# USD per million tokens, used for cost estimates
+MODEL_PRICING = {
+    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
+    "claude-haiku-4-5-20251001": {"input": 1.00, "output": 5.00, "cache_read": 0.10, "cache_write": 1.25},
+    "claude-3-5-haiku-20241022": {"input": 0.80, "output": 4.00, "cache_read": 0.08, "cache_write": 1.00},  # Retired; for older records
+}
+
+# Session Store (SQLite, WAL mode)
+SESSION_DB_PATH = os.environ.get(
+    "MAAS_SESSION_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "maas.db")
+)
+SESSION_DB_BATCH_SIZE = 100  # Writes committed per transaction at most
+SESSION_DB_FLUSH_SECONDS = 0.5  # Longest a write waits to join a batch
+
+# Session Backend (checkpoints each session so any worker can resume it)
+SESSION_BACKEND = os.environ.get("MAAS_SESSION_BACKEND", "sqlite")  # "sqlite", "redis" or "none"
+SESSION_REDIS_URL = os.environ.get("MAAS_REDIS_URL", "redis://localhost:6379/0")  # memory:// for a local stand-in
+SESSION_STATE_TTL_SECONDS = 24 * 60 * 60  # Idle sessions are forgotten after this long
+BROWSER_COOKIE_NAME = "maas_browser"  # Random id that ties a session link to the browser that started it
+BROWSER_COOKIE_DAYS = 365
@@ -0,0 +1,90 @@
+"""
+MAAS Practice - Conversation Context
+Keeps recent exchanges verbatim and folds older turns into a running summary
+"""
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+class ConversationContext:
+    """Bounded model context for one consultation.
+
+    The UI and transcript keep the full message list; only what is sent to
+    the model is bounded. The last ``keep_exchanges`` exchanges are sent
+    verbatim (fewer if they exceed ``token_budget``, but never fewer than
+    ``min_exchanges``). Older turns are folded into ``summary`` by
+    ``summarize(previous_summary, messages)``, run on ``executor`` in batches
+    of ``fold_batch`` exchanges so the summary is extended incrementally
+    rather than recomputed every turn. Until a fold finishes, the unfolded
+    turns are simply sent verbatim.
+    """
+
+    def __init__(self, summarize, executor, keep_exchanges=8, fold_batch=4,
+                 token_budget=6000, min_exchanges=2):
+        self.summarize = summarize
+        self.executor = executor
+        self.keep_exchanges = keep_exchanges
+        self.fold_batch = fold_batch
+        self.token_budget = token_budget
+        self.min_exchanges = min_exchanges
+        self.summary = None
+        self.summarized_upto = 0  # Number of messages folded into the summary
+        self._pending = None  # (future, upto)
+
+    def reset(self):
+        """Forget the summary, e.g. when the conversation is rewound."""
+        if self._pending:
+            self._pending[0].cancel()
+        self.summary = None
+        self.summarized_upto = 0
+        self._pending = None
+
+    def restore(self, summary, summarized_upto):
+        """Resume from a summary saved by another process."""
+        self.reset()
+        self.summary = summary
+        self.summarized_upto = summarized_upto if summary else 0
+
+    def _collect(self, messages):
+        """Apply a finished background fold, if any."""
+        if not self._pending or not self._pending[0].done():
+            return
+        future, upto = self._pending
+        self._pending = None
+        if future.cancelled() or future.exception() or upto > len(messages):
+            return
+        self.summary = future.result()
+        self.summarized_upto = upto
+
+    def _window_start(self, messages):
+        """Index of the first message to send verbatim (always a user turn)."""
+        last_user = len(messages) - 1 if len(messages) % 2 else len(messages) - 2
+        start = max(0, last_user - 2 * self.keep_exchanges)
+        floor = max(0, last_user - 2 * self.min_exchanges)
+        while start < floor and _message_tokens(messages[start:]) > self.token_budget:
+            start += 2
+        return start
+
+    def prepare(self, messages):
+        """Return (summary, messages to send) for the next model call."""
+        if len(messages) < self.summarized_upto:
+            self.reset()
+        self._collect(messages)
+
+        target = self._window_start(messages)
+        unfolded = target - self.summarized_upto
+        over_budget = _message_tokens(messages[self.summarized_upto:]) > self.token_budget
+        if self._pending is None and unfolded > 0 and (unfolded >= 2 * self.fold_batch or over_budget):
+            future = self.executor.submit(
+                self.summarize, self.summary, list(messages[self.summarized_upto:target])
+            )
+            self._pending = (future, target)
+
+        return self.summary, messages[self.summarized_upto:]
@@ -0,0 +1,110 @@
+"""
+MAAS Practice - Conversation Tree
+The transcript as a tree of turns, so "again" keeps every earlier attempt
+
+Each turn is stored once, as a node pointing at its parent. The active
+branch is the path from the root to ``head``; "again" just moves ``head``
+back and the next turn starts a sibling branch. Branches share their common
+prefix, so memory grows with new turns only, and switching back to an
+earlier attempt needs no model call.
+"""
+
+
+class ConversationTree:
+    """Turns with parent links; the active branch ends at ``head`` (None when empty)."""
+
+    def __init__(self):
+        self.turns = []  # node id -> {"role", "content"}, the same dicts the message lists share
+        self.parents = []  # node id -> parent node id (None for the first turn)
+        self.head = None
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, role, content):
+        """Add a turn after ``head`` and make it the new head; returns the message dict."""
+        message = {"role": role, "content": content}
+        self.turns.append(message)
+        self.parents.append(self.head)
+        self.head = len(self.turns) - 1
+        return message
+
+    def path(self, node=None):
+        """Node ids from the first turn to ``node`` (default: head)."""
+        node = self.head if node is None else node
+        ids = []
+        while node is not None:
+            ids.append(node)
+            node = self.parents[node]
+        ids.reverse()
+        return ids
+
+    def messages(self, node=None):
+        """The branch ending at ``node`` as a message list (the dicts are shared, not copied)."""
+        return [self.turns[i] for i in self.path(node)]
+
+    def rewind(self, count):
+        """Move head back ``count`` turns, keeping them as an alternative branch."""
+        for _ in range(count):
+            if self.head is None:
+                break
+            self.head = self.parents[self.head]
+
+    def discard_head(self):
+        """Drop the head turn, e.g. a student message whose reply failed."""
+        if self.head is None:
+            return
+        node = self.head
+        self.head = self.parents[node]
+        if node == len(self.turns) - 1:  # Only the newest turn can be removed outright
+            self.turns.pop()
+            self.parents.pop()
+
+    def leaves(self):
+        """Node ids of every branch end."""
+        has_children = set(p for p in self.parents if p is not None)
+        return [i for i in range(len(self.turns)) if i not in has_children]
+
+    def branches(self):
+        """Branch ends in creation order, plus head if it was rewound to the middle of one."""
+        ends = self.leaves()
+        if self.head is not None and self.head not in ends:
+            ends.append(self.head)
+        return ends
+
+    def switch(self, node):
+        """Make the branch ending at ``node`` the active one."""
+        if node is not None and not 0 <= node < len(self.turns):
+            raise IndexError(f"No turn {node}")
+        self.head = node
+
+    def common_prefix(self, a, b):
+        """Number of turns the branches ending at ``a`` and ``b`` share."""
+        shared = 0
+        for x, y in zip(self.path(a), self.path(b)):
+            if x != y:
+                break
+            shared += 1
+        return shared
+
+    def alternatives(self):
+        """The turns of every other branch after the point where it left the active one."""
+        alternatives = []
+        for end in self.branches():
+            if end != self.head:
+                turns = self.messages(end)[self.common_prefix(end, self.head):]
+                if turns:
+                    alternatives.append(turns)
+        return alternatives
+
+    def to_dict(self):
+        """JSON-serialisable form for session checkpoints."""
+        return {"turns": self.turns, "parents": self.parents, "head": self.head}
+
+    @classmethod
+    def from_dict(cls, data):
+        tree = cls()
+        tree.turns = [{"role": t["role"], "content": t["content"]} for t in data.get("turns", [])]
+        tree.parents = list(data.get("parents", []))
+        tree.head = data.get("head")
+        return tree
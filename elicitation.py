@@ -0,0 +1,81 @@
+"""
+MAAS Practice - Elicitation Tracker
+Running record of what the student has asked about and what the patient has revealed
+
+The tracker reads each new turn once and records, per area (the four
+heuristics, red flags, ideas/concerns/expectations and the sensitive reveal
+items), the exchange at which the student first asked about it and the
+exchange at which each case fact first surfaced. Feedback and summary calls
+send this compact digest plus the latest turns instead of re-sending the
+whole transcript.
+"""
+
+from hint_engine import AREA_ORDER, keywords
+
+AREA_TITLES = {
+    "nature": "Heuristic 1 - Nature",
+    "time": "Heuristic 2 - Time",
+    "modifiers": "Heuristic 3 - Modifiers",
+    "accompanying": "Heuristic 4 - Accompanying",
+    "red_flags": "Red flags",
+    "ideas": "Ideas",
+    "concerns": "Concerns",
+    "expectations": "Expectations",
+    "sensitive": "Revealed only when asked sensitively",
+}
+
+
+class ElicitationTracker:
+    """Incremental coverage of one consultation's facts (see hint_engine.CaseHints)."""
+
+    def __init__(self, hints):
+        self.hints = hints
+        self.reset()
+
+    def reset(self):
+        self.processed = 0  # Messages read so far
+        self._last = None  # The last message read, to notice rewinds and branch switches
+        self._asked = set()
+        self._replied = set()
+        self.asked_at = {}  # area -> exchange number
+        self.surfaced_at = {}  # fact index -> exchange number
+
+    def update(self, messages):
+        """Read the turns added since the last update (starting over if the branch changed)."""
+        if self.processed > len(messages) or (self.processed and messages[self.processed - 1] is not self._last):
+            self.reset()
+        for index in range(self.processed, len(messages)):
+            message = messages[index]
+            exchange = index // 2 + 1
+            words = keywords(message["content"])
+            if message["role"] == "user":
+                self._asked |= words
+                for area, cues in self.hints.cues.items():
+                    if area not in self.asked_at and cues & words:
+                        self.asked_at[area] = exchange
+            else:
+                self._replied |= words
+            seen = self._asked | self._replied
+            for i, fact in enumerate(self.hints.facts):
+                if i not in self.surfaced_at and fact.keywords & words and fact.surfaced(seen):
+                    self.surfaced_at[i] = exchange
+        self.processed = len(messages)
+        self._last = messages[-1] if messages else None
+        return self
+
+    def digest(self):
+        """Markdown summary of coverage by area, with the exchange each item first came up."""
+        lines = []
+        for area in AREA_ORDER:
+            facts = [(i, fact) for i, fact in enumerate(self.hints.facts) if fact.area == area]
+            if not facts:
+                continue
+            asked = f"asked at exchange {self.asked_at[area]}" if area in self.asked_at else "not asked"
+            revealed = [f"{fact.text} ({self.surfaced_at[i]})" for i, fact in facts if i in self.surfaced_at]
+            missing = [fact.text for i, fact in facts if i not in self.surfaced_at]
+            lines.append(f"**{AREA_TITLES[area]}:** {asked}; {len(revealed)}/{len(facts)} elicited")
+            if revealed:
+                lines.append("- Elicited (exchange): " + "; ".join(revealed))
+            if missing:
+                lines.append("- Not yet elicited: " + "; ".join(missing))
+        return "\n".join(lines)
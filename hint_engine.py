@@ -0,0 +1,176 @@
+"""
+MAAS Practice - Hint Engine
+Instant, local hints for the "advice" command from the case's own facts
+
+Each consultation already lists what a student should uncover: the four
+complaint heuristics, ideas/concerns/expectations, red flags and the
+information reveal rules. ``index_case`` turns those into keyword-indexed
+facts once, when the case is compiled. ``suggest`` then checks which areas
+the student has asked about and which facts the patient has already
+revealed, and hints at the first area still unexplored. When every area has
+been covered (or the case is a follow-up, where the script matters less)
+confidence is low and the caller should ask the model instead.
+"""
+
+import re
+
+STOPWORDS = {
+    "a", "about", "after", "all", "also", "am", "an", "and", "any", "are", "as", "at", "be", "been", "but", "by",
+    "can", "could", "did", "do", "does", "for", "from", "had", "has", "have", "he", "her", "him", "his", "i", "if",
+    "in", "into", "is", "it", "its", "just", "me", "my", "no", "not", "of", "on", "or", "our", "she", "so", "than",
+    "that", "the", "their", "them", "then", "there", "they", "this", "to", "too", "up", "us", "very", "was", "we",
+    "were", "what", "which", "who", "will", "with", "would", "you", "your",
+}
+
+# Words in the student's turns that show an area has been asked about
+AREA_CUE_WORDS = {
+    "nature": "describe feel feeling like where located spread radiate severe scale bad sharp dull kind type exactly",
+    "time": "when start started began begin long since first sudden often days weeks months come changed getting",
+    "modifiers": "better worse help helps trigger triggers ease relieve aggravate tried medication painkillers tablets",
+    "accompanying": "else other symptoms along noticed fever weight sleep appetite",
+    "red_flags": "",  # Filled from each case's red flag items
+    "ideas": "think thought idea cause causing explanation might reckon",
+    "concerns": "worry worried worries concern concerned afraid fear scared anxious nervous",
+    "expectations": "hope hoping expect expecting want wanted wish looking",
+    "sensitive": "home family coping affect affecting life support feeling mood stress",
+}
+
+AREA_ORDER = (
+    "nature", "time", "modifiers", "accompanying", "red_flags", "ideas", "concerns", "expectations", "sensitive",
+)
+
+HINTS = {
+    "opening": "Start with an open question and let {name} tell the story in their own words before you narrow down.",
+    "nature": "Ask {name} to describe the main problem in more detail: what it feels like, exactly where it is, "
+              "whether it spreads, and how bad it gets.",
+    "time": "You haven't built a timeline yet. When did it start, how did it begin, and how has it changed since?",
+    "modifiers": "Explore what makes it better or worse, and what {name} has already tried.",
+    "accompanying": "Ask whether anything else has come along with it: other symptoms {name} may not connect "
+                    "with the main problem.",
+    "red_flags": "Before you move on, screen for red flags, for example {examples}.",
+    "ideas": "You haven't asked what {name} thinks is going on. Their own explanation often shapes what they "
+             "need from you.",
+    "concerns": "Ask what worries {name} most about this. There may be a specific fear behind the visit.",
+    "expectations": "Find out what {name} was hoping you could do for them today.",
+    "sensitive": "Some of what matters most hasn't come out yet. Build rapport, then gently ask how this is "
+                 "affecting {name}'s life and the people around them.",
+}
+
+
+def keywords(text):
+    """Content words of a text, crudely stemmed so "worried" matches "worries"."""
+    words = set()
+    for word in re.findall(r"[a-z]+", str(text).lower()):
+        if word in STOPWORDS or len(word) < 3:
+            continue
+        stripped = True
+        while stripped:
+            stripped = False
+            for suffix in ("ation", "ing", "ies", "ied", "ed", "es", "s", "y", "i", "e"):
+                if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                    word = word[: -len(suffix)]
+                    stripped = True
+                    break
+        words.add(word)
+    return words
+
+
+def _flatten(value):
+    """Leaf strings of a nested case value (booleans and nulls skipped)."""
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _flatten(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _flatten(item)
+    elif isinstance(value, str):
+        yield value
+
+
+class Fact:
+    """One thing the patient can reveal, with its area and keywords."""
+
+    __slots__ = ("area", "text", "keywords")
+
+    def __init__(self, area, text):
+        self.area = area
+        self.text = text
+        self.keywords = frozenset(keywords(text))
+
+    def surfaced(self, words):
+        """True when most of this fact's keywords appear in ``words``."""
+        if not self.keywords:
+            return False
+        return len(self.keywords & words) * 2 >= len(self.keywords)
+
+
+class CaseHints:
+    """Keyword index of one consultation's facts (built once per compiled case)."""
+
+    def __init__(self, patient, consultation):
+        complaint = consultation.get("complaint") or {}
+        ice = consultation.get("ideas_concerns_expectations") or {}
+        red_flags = consultation.get("red_flags") or {}
+        reveal = (consultation.get("simulation_guidance") or {}).get("information_reveal") or {}
+
+        name = patient["patient"]["name"]
+        self.name = name if name.split()[0].endswith(".") else name.split()[0]  # "Mr. Lee", "Maria"
+        self.follow_up = bool(consultation.get("for_follow_up"))
+
+        sources = {
+            "nature": complaint.get("heuristic_1_nature"),
+            "time": complaint.get("heuristic_2_time"),
+            "modifiers": complaint.get("heuristic_3_modifiers"),
+            "accompanying": complaint.get("heuristic_4_accompanying"),
+            "red_flags": (red_flags.get("present") or []) + (red_flags.get("absent") or []),
+            "ideas": ice.get("ideas"),
+            "concerns": ice.get("concerns"),
+            "expectations": ice.get("expectations"),
+            "sensitive": reveal.get("if_asked_sensitively"),
+        }
+        self.facts = tuple(
+            Fact(area, text) for area, value in sources.items() for text in _flatten(value)
+        )
+        self.red_flag_examples = [
+            re.sub(r"^no\s+|\s*\(.*?\)", "", text, flags=re.IGNORECASE).lower()
+            for text in sources["red_flags"] if isinstance(text, str) and not text.lower().startswith("age")
+        ][:3]
+        self.cues = {area: keywords(words) for area, words in AREA_CUE_WORDS.items()}
+        generic = keywords(f"{complaint.get('chief_complaint', '')} pain age under over symptoms problems")
+        for fact in self.facts:
+            if fact.area == "red_flags":
+                self.cues["red_flags"] |= fact.keywords - generic
+
+    def coverage(self, messages):
+        """{area: (asked about, share of its facts surfaced)} for a transcript."""
+        asked = set()
+        replied = set()
+        for message in messages:
+            (asked if message["role"] == "user" else replied).update(keywords(message["content"]))
+        coverage = {}
+        for area in AREA_ORDER:
+            facts = [fact for fact in self.facts if fact.area == area]
+            if not facts:
+                continue
+            surfaced = sum(1 for fact in facts if fact.surfaced(replied | asked))
+            coverage[area] = (bool(self.cues[area] & asked), surfaced / len(facts))
+        return coverage
+
+    def suggest(self, messages):
+        """Return (hint text, confidence 0-1) for the next thing to explore."""
+        if not any(message["role"] == "user" for message in messages):
+            return self._hint("opening"), 0.9
+        scale = 0.5 if self.follow_up else 1.0
+        for area, (asked, surfaced) in self.coverage(messages).items():
+            if not asked and surfaced < 0.5:
+                return self._hint(area), round(0.9 * scale, 2)
+        return None, 0.0
+
+    def _hint(self, area):
+        examples = ", ".join(self.red_flag_examples) or "symptoms that would change your management"
+        return HINTS[area].format(name=self.name, examples=examples)
+
+
+def index_case(patient, consultation):
+    """Build the hint index for one consultation."""
+    return CaseHints(patient, consultation)
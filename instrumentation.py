@@ -0,0 +1,225 @@
+"""
+MAAS Practice - Instrumentation
+Per-call latency, token usage and cost records for every model call
+"""
+
+import contextvars
+import json
+import logging
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import config
+
+_current = contextvars.ContextVar("maas_current_call", default=None)
+_sinks = []
+_sinks_lock = threading.Lock()
+_logger = None
+
+
+def _jsonl_logger():
+    """Return the logger that writes records to the rotating JSONL file."""
+    global _logger
+    with _sinks_lock:
+        if _logger is None:
+            path = Path(config.METRICS_LOG_PATH)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=config.METRICS_LOG_MAX_BYTES, backupCount=config.METRICS_LOG_BACKUPS
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("maas.metrics")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+    return _logger
+
+
+def add_sink(sink):
+    """Register a callable that receives every finished record (a dict)."""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def emit(record):
+    """Write a record to the JSONL log and every registered sink."""
+    if not config.METRICS_ENABLED:
+        return
+    try:
+        _jsonl_logger().info(json.dumps(record))
+    except Exception:
+        pass  # Metrics must never break a consultation
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception:
+            pass
+
+
+def estimate_cost(model, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens):
+    """Estimated USD cost of a call from config.MODEL_PRICING (None if unknown)."""
+    price = config.MODEL_PRICING.get(model)
+    if not price:
+        return None
+    return (
+        input_tokens * price["input"]
+        + output_tokens * price["output"]
+        + cache_read_tokens * price["cache_read"]
+        + cache_write_tokens * price["cache_write"]
+    ) / 1_000_000
+
+
+class CallRecorder:
+    """Collects the measurements for one model call."""
+
+    def __init__(self, call_type, model, tags=None, stream=False):
+        self.record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "call_type": call_type,
+            "model": model,
+            "stream": stream,
+            "patient_id": None,
+            "consultation_id": None,
+            "wall_ms": None,
+            "ttft_ms": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+            "retries": 0,
+            "error": None,
+            "cost_usd": None,
+        }
+        self.record.update(tags or {})
+        self.attempts = 0
+        self.skipped = False
+        self._start = time.perf_counter()
+
+    def _elapsed_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def first_token(self):
+        """Mark the arrival of the first streamed token (later calls are ignored)."""
+        if self.record["ttft_ms"] is None:
+            self.record["ttft_ms"] = self._elapsed_ms()
+
+    def set_usage(self, usage, model=None):
+        """Copy token counts from an API ``usage`` object."""
+        if model:
+            self.record["model"] = model
+        if usage is None:
+            return
+        self.record["input_tokens"] = getattr(usage, "input_tokens", 0) or 0
+        self.record["output_tokens"] = getattr(usage, "output_tokens", 0) or 0
+        self.record["cache_read_tokens"] = getattr(usage, "cache_read_input_tokens", 0) or 0
+        self.record["cache_write_tokens"] = getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+    def fail(self, error):
+        """Record the class of the error that ended the call."""
+        if self.record["error"] is None:
+            self.record["error"] = "Cancelled" if isinstance(error, GeneratorExit) else type(error).__name__
+
+    def skip(self):
+        """Emit no record for this call (e.g. a local lookup that found nothing to serve)."""
+        self.skipped = True
+
+    def finish(self):
+        if self.skipped:
+            return
+        r = self.record
+        r["wall_ms"] = self._elapsed_ms()
+        if r["ttft_ms"] is None and r["error"] is None:
+            r["ttft_ms"] = r["wall_ms"]  # Blocking calls: the whole reply arrives at once
+        r["retries"] = max(self.attempts - 1, 0)
+        r["cost_usd"] = estimate_cost(
+            r["model"], r["input_tokens"], r["output_tokens"], r["cache_read_tokens"], r["cache_write_tokens"]
+        )
+        emit(r)
+
+
+@contextmanager
+def record_call(call_type, model, tags=None, stream=False):
+    """Measure one model call; the record is emitted when the block exits.
+
+    Errors are recorded and re-raised, so callers keep their own handling.
+    """
+    recorder = CallRecorder(call_type, model, tags, stream)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    except BaseException as e:
+        recorder.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        recorder.finish()
+
+
+def count_attempt():
+    """Count an HTTP attempt against the call in progress (for retry counts)."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.attempts += 1
+
+
+def load_records(path=None):
+    """Read records from the JSONL log and its rotated backups, oldest first."""
+    path = Path(path or config.METRICS_LOG_PATH)
+    files = [path.with_name(f"{path.name}.{i}") for i in range(config.METRICS_LOG_BACKUPS, 0, -1)] + [path]
+    records = []
+    for file in files:
+        if not file.exists():
+            continue
+        with open(file, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(records, key_fields):
+    """Aggregate records into rows of latency, tokens and cost per key.
+
+    ``key_fields`` is a tuple of record fields to group by, such as
+    ("patient_id", "consultation_id") or ("call_type",).
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(record.get(field) for field in key_fields), []).append(record)
+
+    rows = []
+    for key, group in sorted(groups.items(), key=lambda item: str(item[0])):
+        wall = [r["wall_ms"] for r in group if r.get("wall_ms") is not None]
+        ttft = [r["ttft_ms"] for r in group if r.get("ttft_ms") is not None]
+        costs = [r["cost_usd"] for r in group if r.get("cost_usd") is not None]
+        input_tokens = sum(r.get("input_tokens", 0) for r in group)
+        cache_read = sum(r.get("cache_read_tokens", 0) for r in group)
+        prompt_tokens = input_tokens + cache_read + sum(r.get("cache_write_tokens", 0) for r in group)
+        row = dict(zip(key_fields, key))
+        row.update({
+            "calls": len(group),
+            "errors": sum(1 for r in group if r.get("error")),
+            "p50_ms": round(statistics.median(wall)) if wall else None,
+            "p95_ms": round(_percentile(wall, 95)) if wall else None,
+            "p50_ttft_ms": round(statistics.median(ttft)) if ttft else None,
+            "input_tokens": input_tokens,
+            "output_tokens": sum(r.get("output_tokens", 0) for r in group),
+            "cache_hit_rate": round(cache_read / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "cost_usd": round(sum(costs), 4),
+        })
+        rows.append(row)
+    return rows
@@ -0,0 +1,130 @@
+"""
+MAAS Practice - Patient History
+What a patient carries from a student's earlier consultation into the follow-up
+
+When a consultation that has a follow-up ends, one background call
+condenses the student's actual visit into a small digest: what the patient
+was told is wrong, tests and treatments, the plan, and what the patient
+remembers and is still unsure about. It is stored per student and case:
+the signed-in account when the app uses st.login, otherwise the browser's
+cookie, never the session link. The follow-up consultation sends that
+digest, instead of the case file's authored account of the previous visit,
+as its own system block. Each field keeps a few short items, and a digest of a
+later visit folds in the earlier one, so carrying history forward costs the
+same however many visits came before.
+"""
+
+import json
+import re
+import threading
+
+import config
+from prompt_compaction import line, section
+
+# (key, label in the follow-up prompt, what the digest call is asked for)
+DIGEST_FIELDS = (
+    ("diagnosis", "Diagnosis or explanation given", "what the doctor said is wrong, or might be"),
+    ("tests", "Tests and examinations", "tests or examinations done or ordered"),
+    ("treatments", "Treatments and advice", "medication, treatment or lifestyle advice started or changed"),
+    ("plan", "Agreed plan", "what happens next, including when to come back"),
+    ("remembers", "What you remember", "what {name} will remember most, in their own words"),
+    ("unresolved", "Still unsure or worried about", "questions or worries {name} left with"),
+)
+
+
+def follow_ups(patient, consultation_id):
+    """Ids of the consultations that follow on from ``consultation_id`` (their ``links_to``)."""
+    return [
+        c["consultation_id"] for c in patient.get("consultations", [])
+        if c.get("links_to") == consultation_id and c.get("for_follow_up")
+    ]
+
+
+def digest_prompt(patient, consultation, transcript, earlier=None):
+    """The user message asking for one visit's digest (``earlier`` is the digest this visit followed on from)."""
+    name = patient["patient"]["name"]
+    keys = "\n".join(f'"{key}": {ask.format(name=name)}' for key, _, ask in DIGEST_FIELDS)
+    before = f"## Earlier Visits\n{render_fields(earlier)}\n" if earlier else ""
+    return f"""## Case: {consultation['title']}
+
+{before}## Transcript of This Visit
+{transcript}
+
+From {name}'s point of view, record what happened as JSON with these keys, each a list of at most {config.CARRY_FORWARD_MAX_ITEMS} short items (under 15 words each), or [] when nothing applies:
+{keys}
+Only record what the student actually said or did. Keep anything from earlier visits that still applies. Reply with the JSON only."""
+
+
+def parse_digest(text):
+    """The digest in a model reply, cut to a fixed size, or None if there isn't one."""
+    match = re.search(r"\{.*\}", str(text), re.DOTALL)
+    try:
+        data = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    digest = {}
+    for key, _, _ in DIGEST_FIELDS:
+        value = data.get(key) or []
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            continue
+        digest[key] = [
+            str(item).strip()[:config.CARRY_FORWARD_ITEM_CHARS]
+            for item in value if str(item).strip()
+        ][:config.CARRY_FORWARD_MAX_ITEMS]
+    return digest
+
+
+def render_fields(digest):
+    """The digest's fields as "**Label:** item; item" lines."""
+    return "".join(line(label, digest.get(key)) for key, label, _ in DIGEST_FIELDS)
+
+
+def render_digest(digest, previous_title):
+    """The follow-up's system block for a digest of the visit titled ``previous_title``."""
+    return section(
+        "Your Previous Visit With This Doctor",
+        f"What actually happened at your last visit ({previous_title}). This replaces any other account of "
+        "that visit: only mention diagnoses, tests, treatments and advice listed here. If the interval "
+        "details mention a treatment that is not listed here, you never started it.\n",
+        render_fields(digest) or "Nothing was explained, decided or started.\n",
+    )
+
+
+class PendingDigests:
+    """Digests being computed in this process, so a follow-up started right away can wait for one.
+
+    A digest's job commits it to the session store before finishing, so a
+    follow-up that finds no job here finds the digest in the store.
+    """
+
+    def __init__(self):
+        self._futures = {}  # (student_id, patient_id, consultation_id) -> Future
+        self._lock = threading.Lock()
+
+    def add(self, key, future):
+        with self._lock:
+            self._futures[key] = future
+        future.add_done_callback(lambda done: self._discard(key, done))
+
+    def _discard(self, key, future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def wait(self, key, timeout):
+        """The digest being computed for ``key`` once it is done, or None (none running, failed or too slow)."""
+        with self._lock:
+            future = self._futures.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return None
+
+
+pending_digests = PendingDigests()
@@ -0,0 +1,198 @@
+"""
+MAAS Practice - Prompt Compaction
+Renders case data as dense text for the patient simulation prompt
+
+The system prompt is resent on every patient turn, so its size is paid on
+every call. Case sections are written as short labelled lines instead of
+indented JSON, empty and "N/A" fields are left out, case list items the
+base prompt already says are dropped, and base prompt
+sections about the other kind of consultation (initial or follow-up) are
+skipped.
+
+    python prompt_compaction.py                # every consultation against its token budget
+    python prompt_compaction.py --exact        # count with the API instead of estimating
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+import config
+from conversation_context import estimate_tokens
+
+EMPTY_TEXT = {"", "n/a", "na", "none", "null", "-", "unknown"}
+
+
+def is_empty(value):
+    """True for None, blank or "N/A" text, and lists or objects holding nothing else."""
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in EMPTY_TEXT
+    if isinstance(value, dict):
+        return all(is_empty(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(is_empty(v) for v in value)
+    return False
+
+
+def label(key):
+    """Readable form of a case key, e.g. "Heuristic 1 nature"."""
+    return str(key).replace("_", " ").strip().capitalize()
+
+
+def render(value, nested=False):
+    """One line of text for a case value: lists joined with "; ", objects as "key: value" pairs."""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, dict):
+        pairs = [f"{label(k).lower()}: {render(v, True)}" for k, v in value.items() if not is_empty(v)]
+        return f"({', '.join(pairs)})" if nested else "; ".join(pairs)
+    if isinstance(value, (list, tuple)):
+        separator = ", " if nested else "; "
+        return separator.join(render(v, True) for v in value if not is_empty(v))
+    return str(value).strip()
+
+
+def line(name, value):
+    """A "**Name:** text" line, or "" when the value is empty."""
+    return "" if is_empty(value) else f"**{name}:** {render(value)}\n"
+
+
+def items(value):
+    """One "- " line per list item or object field, or "" when empty."""
+    if isinstance(value, dict):
+        return "".join(f"- {label(k)}: {render(v)}\n" for k, v in value.items() if not is_empty(v))
+    if isinstance(value, (list, tuple)):
+        return "".join(f"- {render(v)}\n" for v in value if not is_empty(v))
+    return "" if is_empty(value) else f"- {render(value)}\n"
+
+
+def labelled_items(name, value):
+    """A "**Name:**" line followed by its items, or "" when empty."""
+    body = items(value)
+    return f"**{name}:**\n{body}" if body else ""
+
+
+def section(title, *parts):
+    """A "## Title" section of the non-empty parts, or "" when all are empty."""
+    body = "".join(parts).strip("\n")
+    return f"## {title}\n{body}\n\n" if body else ""
+
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def dedupe_lines(text, reference=""):
+    """Drop "- " items of ``text`` already said in ``reference``.
+
+    Repeats within ``text`` are kept: the same item under two case sections
+    (say, a secret that is also an emotional moment) means something in each.
+    """
+    seen = {_normalize(row.strip().lstrip("-*").strip()) for row in reference.splitlines()}
+    seen.discard("")
+    kept = []
+    for row in text.split("\n"):
+        if row.startswith("- ") and _normalize(row[2:]) in seen:
+            continue
+        kept.append(row)
+    return "\n".join(kept)
+
+
+def base_prompt(text, follow_up, skip=()):
+    """The base prompt without sections written for the other kind of consultation.
+
+    Sections are "## " headings up to the next heading or "---" rule; a
+    heading naming "Follow-Up" is for follow-up visits only and one naming
+    "(Initial" for first visits only. Sections titled in ``skip`` are left
+    out as well.
+    """
+    kept = []
+    skipping = False
+    for row in text.split("\n"):
+        if row.startswith("## "):
+            skipping = (
+                ("Follow-Up" in row and not follow_up)
+                or ("(Initial" in row and follow_up)
+                or row[3:].strip() in skip
+            )
+        elif row.startswith("---") and skipping:
+            skipping = False
+            continue  # The skipped section's closing rule
+        if not skipping:
+            kept.append(row)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(kept))
+
+
+def system_prompt_parts(base_text, compiled, carried=False):
+    """(base prompt, case prompt) for a CompiledCase, compacted against each other.
+
+    ``carried`` uses the case prompt without the authored previous visit (see patient_history).
+    """
+    base = base_prompt(base_text, compiled.follow_up, config.PROMPT_BASE_SKIP_SECTIONS)
+    return base, dedupe_lines(compiled.case_prompt_carried if carried else compiled.case_prompt, base)
+
+
+def token_budget(patient_id, consultation_id):
+    """Token budget of one consultation's system prompt (config.PROMPT_TOKEN_BUDGETS, else the default)."""
+    return config.PROMPT_TOKEN_BUDGETS.get(f"{patient_id}/{consultation_id}", config.PROMPT_TOKEN_BUDGET)
+
+
+def _count_exact(client, base, case):
+    """Input tokens of the prompt as counted by the API (one short student turn included)."""
+    result = client.messages.count_tokens(
+        model=config.MODEL,
+        system=[{"type": "text", "text": base}, {"type": "text", "text": case}],
+        messages=[{"role": "user", "content": "Hello"}],
+    )
+    return result.input_tokens
+
+
+def report(repository, exact=False, out=sys.stdout):
+    """Print each consultation's system prompt size against its budget; return the number over budget."""
+    client = None
+    if exact:
+        import anthropic
+        client = anthropic.Anthropic()
+    base_text = repository.prompt("patient-simulation")
+    over = 0
+    out.write(f"{'case':10} {'title':44} {'base':>6} {'case':>6} {'total':>6} {'budget':>7}\n")
+    for patient_id, entry in sorted(repository.catalogue_entries().items()):
+        for consultation in entry["consultations"]:
+            consultation_id = consultation["consultation_id"]
+            compiled = repository.compiled(patient_id, consultation_id)
+            if compiled is None:
+                out.write(f"{patient_id}/{consultation_id}: could not be loaded\n")
+                continue
+            base, case = system_prompt_parts(base_text, compiled)
+            base_tokens, case_tokens = estimate_tokens(base), estimate_tokens(case)
+            total = _count_exact(client, base, case) if exact else base_tokens + case_tokens
+            budget = token_budget(patient_id, consultation_id)
+            flag = ""
+            if total > budget:
+                over += 1
+                flag = "  OVER"
+            out.write(
+                f"{patient_id + '/' + str(consultation_id):10} {compiled.title[:44]:44} "
+                f"{base_tokens:>6} {case_tokens:>6} {total:>6} {budget:>7}{flag}\n"
+            )
+    if not exact:
+        out.write("(estimated at four characters per token; --exact counts with the API)\n")
+    return over
+
+
+def main():
+    from case_repository import CaseRepository
+
+    parser = argparse.ArgumentParser(description="Report each consultation's system prompt size against its budget.")
+    parser.add_argument("--exact", action="store_true", help="Count tokens with the API (needs ANTHROPIC_API_KEY)")
+    args = parser.parse_args()
+    data_dir = Path(__file__).parent / "data"
+    over = report(CaseRepository(data_dir / "patients", data_dir / "prompts"), exact=args.exact)
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
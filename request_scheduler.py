@@ -0,0 +1,279 @@
+"""
+MAAS Practice - Request Scheduler
+Rate limits, prioritises and retries every model call made by this process
+
+Calls wait their turn in one priority queue: live patient turns first, then
+interim feedback and advice, then summaries and end-of-session feedback,
+then background context summaries. A call is admitted when fewer than
+``max_concurrency`` calls are in flight and the requests-per-minute and
+tokens-per-minute buckets can cover it. Transient failures (rate limits,
+overload, timeouts) are retried with jittered exponential backoff, with the
+slot released while waiting so other calls can proceed.
+
+The token bucket is charged the way the provider's input-token limit
+counts: messages and system blocks in full, except a cache-marked system
+prefix this process sent within the cache lifetime, which is read from the
+prompt cache and doesn't count.
+"""
+
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import anthropic
+
+import config
+from conversation_context import estimate_tokens
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute up to one minute's worth.
+
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` units are available (0 if they are now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # A call larger than the bucket waits for a full bucket
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount, now):
+        if self.rate:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+
+class PromptCacheTracker:
+    """Cache-marked system prefixes sent recently, so cache reads aren't charged to the token bucket.
+
+    A prefix is keyed by the model and every system block up to a block with
+    ``cache_control``; sending it again within ``ttl`` seconds is counted as
+    a cache read, which also keeps it alive, as the provider's cache does.
+    """
+
+    def __init__(self, ttl=300, min_tokens=1024, max_entries=4096):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self._seen = OrderedDict()  # prefix hash -> last sent (monotonic)
+        self._lock = threading.Lock()
+
+    def uncached_tokens(self, request):
+        """Estimated prompt tokens of ``request`` that won't be read from the cache; records its prefixes as sent."""
+        system = request.get("system", "")
+        blocks = system if isinstance(system, list) else [{"type": "text", "text": system}]
+        sizes = [estimate_tokens(json.dumps(block)) for block in blocks]
+        prefix = hashlib.sha1(request.get("model", "").encode())
+        now = time.monotonic()
+        cached_blocks = 0
+        with self._lock:
+            for index, block in enumerate(blocks):
+                prefix.update(json.dumps(block, sort_keys=True).encode())
+                if not block.get("cache_control") or sum(sizes[:index + 1]) < self.min_tokens:
+                    continue
+                key = prefix.hexdigest()
+                if now - self._seen.get(key, -self.ttl) < self.ttl:
+                    cached_blocks = index + 1
+                self._seen[key] = now
+                self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return sum(sizes[cached_blocks:]) + estimate_tokens(json.dumps(request["messages"]))
+
+
+prompt_cache = PromptCacheTracker(
+    ttl=config.SCHEDULER_PROMPT_CACHE_SECONDS,
+    min_tokens=config.SCHEDULER_PROMPT_CACHE_MIN_TOKENS,
+)
+
+
+def request_tokens(request):
+    """Estimated prompt tokens of a Messages API request charged to the token bucket (cache reads are free)."""
+    return prompt_cache.uncached_tokens(request)
+
+
+def is_transient(error):
+    """True for errors worth retrying: rate limits, overload, timeouts, dropped connections."""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def is_overloaded(error):
+    """True when another model may succeed: overload (529/503) or a timeout."""
+    if isinstance(error, anthropic.APITimeoutError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in (503, 529)
+
+
+def is_model_unavailable(error):
+    """True when the model doesn't exist for this API key, e.g. a retired model (404 not_found)."""
+    return isinstance(error, anthropic.NotFoundError)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def describe_error(error):
+    """Short message for the student; transient overload is not shown as a raw API error."""
+    if is_transient(error):
+        return "the AI service is busy right now, please try again in a moment"
+    return str(error)
+
+
+class RequestScheduler:
+    """Priority queue with concurrency, request and token limits."""
+
+    def __init__(self, max_concurrency=16, requests_per_minute=0, tokens_per_minute=0,
+                 max_retries=4, backoff_base=0.5, backoff_max=20.0, priorities=None):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.priorities = priorities or {}
+        self._cond = threading.Condition()
+        self._queue = []  # (priority, sequence)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._waits = deque(maxlen=1000)  # Recent (call type, seconds queued)
+        self.admitted = 0
+        self.retries = 0
+        self.failures = 0
+
+    def priority(self, call_type):
+        """Lower runs first; unknown call types go last."""
+        return self.priorities.get(call_type, max(self.priorities.values(), default=0) + 1)
+
+    def _admit(self, priority, tokens, call_type):
+        """Block until this call may start."""
+        enqueued = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = None
+                    if self._queue[0] == entry and self._in_flight < self.max_concurrency:
+                        timeout = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                        if timeout == 0:
+                            break
+                    self._cond.wait(timeout)
+                heapq.heappop(self._queue)
+                self.requests.take(1, now)
+                self.tokens.take(tokens, now)
+                self._in_flight += 1
+                self.admitted += 1
+                self._waits.append((call_type, now - enqueued))
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                raise
+            finally:
+                self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, call_type, tokens=1):
+        """Hold one admitted call for the duration of the block (e.g. a whole stream)."""
+        self._admit(self.priority(call_type), tokens, call_type)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after ``error``, or None to give up."""
+        if not is_transient(error) or attempt >= self.max_retries:
+            with self._cond:
+                self.failures += 1
+            return None
+        with self._cond:
+            self.retries += 1
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, min(retry_after, self.backoff_max)) if retry_after else delay
+
+    def run(self, fn, call_type, tokens=1):
+        """Call ``fn()`` when admitted, retrying transient failures."""
+        for attempt in itertools.count():
+            with self.slot(call_type, tokens):
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self.retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+
+    def snapshot(self):
+        """Queue depth, calls in flight, counters and recent wait times."""
+        with self._cond:
+            queued = {}
+            for priority, _ in self._queue:
+                queued[priority] = queued.get(priority, 0) + 1
+            waits = list(self._waits)
+            snapshot = {
+                "queued": len(self._queue),
+                "queued_by_priority": dict(sorted(queued.items())),
+                "in_flight": self._in_flight,
+                "admitted": self.admitted,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+        wait_ms = sorted(seconds * 1000 for _, seconds in waits)
+        snapshot["wait_p50_ms"] = round(statistics.median(wait_ms), 1) if wait_ms else 0.0
+        snapshot["wait_p95_ms"] = round(wait_ms[min(len(wait_ms) - 1, int(len(wait_ms) * 0.95))], 1) if wait_ms else 0.0
+        by_type = {}
+        for call_type, seconds in waits:
+            by_type.setdefault(call_type, []).append(seconds * 1000)
+        snapshot["wait_by_call_type"] = [
+            {"call_type": call_type, "calls": len(values), "wait_p50_ms": round(statistics.median(values), 1),
+             "wait_max_ms": round(max(values), 1)}
+            for call_type, values in sorted(by_type.items())
+        ]
+        return snapshot
+
+
+scheduler = RequestScheduler(
+    max_concurrency=config.SCHEDULER_MAX_CONCURRENCY,
+    requests_per_minute=config.SCHEDULER_REQUESTS_PER_MINUTE,
+    tokens_per_minute=config.SCHEDULER_TOKENS_PER_MINUTE,
+    max_retries=config.SCHEDULER_MAX_RETRIES,
+    backoff_base=config.SCHEDULER_BACKOFF_BASE,
+    backoff_max=config.SCHEDULER_BACKOFF_MAX,
+    priorities=config.SCHEDULER_PRIORITIES,
+)
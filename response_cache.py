@@ -0,0 +1,168 @@
+"""
+MAAS Practice - Response Cache
+Content-addressed cache of model replies, in memory and on disk
+
+A reply is stored under a hash of everything that determines it: the call
+type, model, system prompt, messages and max_tokens. Asking ``summary``
+twice with no new turns, repeating ``feedback`` back-to-back, or replaying a
+scripted session therefore costs one model call instead of several. Only
+call types listed in config.RESPONSE_CACHE_CALL_TYPES are cached.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import config
+from session_store import connect
+
+
+def request_key(request, call_type):
+    """Hash of everything in a request that determines the reply."""
+    payload = {
+        "call_type": call_type,
+        "model": request["model"],
+        "system": request.get("system"),
+        "messages": request["messages"],
+        "max_tokens": request.get("max_tokens"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier LRU cache with a time-to-live.
+
+    The memory tier holds ``memory_entries`` replies for this process; the
+    optional SQLite tier at ``disk_path`` holds ``disk_entries`` and is
+    shared by every worker on the host. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, call_types, memory_entries=512, disk_path=None, disk_entries=10000, ttl=7 * 86400):
+        self.call_types = set(call_types)
+        self.memory_entries = memory_entries
+        self.disk_path = str(disk_path) if disk_path else None
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (text, stored at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_ready = False
+        self._stats = {}  # call_type -> {"memory_hits", "disk_hits", "misses"}
+        self._puts = 0
+
+    def enabled(self, call_type):
+        return call_type in self.call_types
+
+    def _count(self, call_type, outcome):
+        with self._lock:
+            counts = self._stats.setdefault(call_type, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def _disk(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.disk_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = self._local.conn = connect(self.disk_path)
+            if not self._disk_ready:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS responses ("
+                        "key TEXT PRIMARY KEY, call_type TEXT, stored_at REAL NOT NULL, "
+                        "used_at REAL NOT NULL, text TEXT NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_used ON responses (used_at)")
+                self._disk_ready = True
+        return conn
+
+    def get(self, key, call_type):
+        """Return the cached reply for ``key``, or None (counted as a miss)."""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and now - item[1] > self.ttl:
+                del self._memory[key]
+                item = None
+            if item is not None:
+                self._memory.move_to_end(key)
+        if item is not None:
+            self._count(call_type, "memory_hits")
+            return item[0]
+
+        if self.disk_path:
+            try:
+                conn = self._disk()
+                row = conn.execute(
+                    "SELECT text, stored_at FROM responses WHERE key = ? AND stored_at >= ?", (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    with conn:
+                        conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+                    self._remember(key, row["text"], row["stored_at"])
+                    self._count(call_type, "disk_hits")
+                    return row["text"]
+            except Exception:
+                pass  # A broken cache is just a slower app
+        self._count(call_type, "misses")
+        return None
+
+    def _remember(self, key, text, stored_at):
+        with self._lock:
+            self._memory[key] = (text, stored_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key, call_type, text):
+        """Store a complete reply."""
+        now = time.time()
+        self._remember(key, text, now)
+        if not self.disk_path:
+            return
+        try:
+            conn = self._disk()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, call_type, stored_at, used_at, text) VALUES (?, ?, ?, ?, ?)",
+                    (key, call_type, now, now, text),
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    conn.execute("DELETE FROM responses WHERE stored_at < ?", (now - self.ttl,))
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_entries,),
+                    )
+        except Exception:
+            pass
+
+    def clear(self):
+        """Drop every cached reply (both tiers)."""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            with self._disk() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """Hit counts and hit rate per call type."""
+        with self._lock:
+            stats = {call_type: dict(counts) for call_type, counts in self._stats.items()}
+        rows = []
+        for call_type, counts in sorted(stats.items()):
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            lookups = hits + counts["misses"]
+            rows.append({"call_type": call_type, **counts, "hit_rate": round(hits / lookups, 3) if lookups else 0.0})
+        return rows
+
+
+response_cache = ResponseCache(
+    config.RESPONSE_CACHE_CALL_TYPES,
+    memory_entries=config.RESPONSE_CACHE_MEMORY_ENTRIES,
+    disk_path=config.RESPONSE_CACHE_DISK_PATH,
+    disk_entries=config.RESPONSE_CACHE_DISK_ENTRIES,
+    ttl=config.RESPONSE_CACHE_TTL_SECONDS,
+)
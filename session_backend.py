@@ -0,0 +1,265 @@
+"""
+MAAS Practice - Session Backend
+Checkpoints each browser session's state outside the Streamlit process
+
+Streamlit keeps ``st.session_state`` in the memory of the process that
+serves the websocket, so a restart or a second worker behind a load
+balancer loses every consultation in progress. The app checkpoints a small,
+JSON-serialisable snapshot of the session (ids, messages and flags; never
+the patient dicts) after each script run and rehydrates it on whichever
+worker picks the session up next.
+
+Each snapshot carries a version. A save only succeeds if the stored
+snapshot is still the version this session last loaded or saved, so two
+tabs or workers writing the same session can't silently overwrite each
+other: the second one is told to reload instead.
+
+Backends: ``SQLiteSessionBackend`` (one file shared by every worker on a
+host) and ``RedisSessionBackend`` (any Redis-compatible server, or the
+in-process ``LocalRedis`` stand-in for development).
+"""
+
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from urllib.parse import urlparse
+
+from session_store import connect
+
+try:
+    import redis
+except ImportError:  # Only needed for the Redis backend
+    redis = None
+
+
+class SessionBackend(ABC):
+    """Stores one JSON snapshot per session id."""
+
+    @abstractmethod
+    def load(self, session_id):
+        """Return the stored snapshot dict, or None."""
+
+    @abstractmethod
+    def save(self, session_id, snapshot, version):
+        """Store a snapshot as ``version + 1`` if the stored one is still ``version`` (0 = none yet).
+
+        Returns False, and stores nothing, if another writer saved the session first.
+        """
+
+    @abstractmethod
+    def delete(self, session_id):
+        """Forget a session."""
+
+
+class NullSessionBackend(SessionBackend):
+    """Keeps nothing; sessions live only in the Streamlit process."""
+
+    def load(self, session_id):
+        return None
+
+    def save(self, session_id, snapshot, version):
+        return True
+
+    def delete(self, session_id):
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Snapshots in an SQLite table (WAL mode, safe across processes).
+
+    Writes are synchronous so a snapshot is visible to every worker as soon
+    as ``save`` returns; the version check and write share one write
+    transaction. Snapshots older than ``ttl`` seconds are purged.
+    """
+
+    def __init__(self, path, ttl=86400):
+        self.path = str(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                "session_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, state TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_state_updated ON session_state (updated_at)")
+            conn.execute("DELETE FROM session_state WHERE updated_at < ?", (time.time() - ttl,))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def load(self, session_id):
+        row = self._conn().execute(
+            "SELECT state FROM session_state WHERE session_id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        return json.loads(row["state"]) if row else None
+
+    def save(self, session_id, snapshot, version):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+            if (json.loads(row["state"]).get("version", 0) if row else 0) != version:
+                conn.rollback()
+                return False
+            conn.execute(
+                "INSERT INTO session_state (session_id, updated_at, state) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at, state = excluded.state",
+                (session_id, time.time(), json.dumps({**snapshot, "version": version + 1})),
+            )
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return True
+
+    def delete(self, session_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+
+class WatchError(Exception):
+    """A watched key changed before a LocalRedis transaction ran (redis.WatchError on a real server)."""
+
+
+WATCH_ERRORS = (WatchError, redis.WatchError) if redis is not None else (WatchError,)
+
+
+class LocalRedis:
+    """In-process stand-in for the few Redis commands the backend uses.
+
+    It shares nothing between processes; use it to run the Redis backend
+    locally without a server.
+    """
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires at or None)
+        self._changes = {}  # key -> number of writes, for WATCH
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.monotonic():
+                del self._data[key]
+                return None
+            return item[0]
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            self._changes[key] = self._changes.get(key, 0) + 1
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._changes[key] = self._changes.get(key, 0) + 1
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def pipeline(self):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    """The WATCH / MULTI / EXEC subset of a redis-py pipeline, for LocalRedis."""
+
+    def __init__(self, client):
+        self.client = client
+        self._watched = {}  # key -> change count when watched
+        self._queued = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._watched, self._queued = {}, None
+
+    def watch(self, *keys):
+        with self.client._lock:
+            for key in keys:
+                self._watched[key] = self.client._changes.get(key, 0)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        self._queued = []
+
+    def set(self, key, value, ex=None):
+        self._queued.append((key, value, ex))
+
+    def execute(self):
+        with self.client._lock:
+            if any(self.client._changes.get(key, 0) != count for key, count in self._watched.items()):
+                raise WatchError("Watched variable changed.")
+            results = [self.client.set(key, value, ex=ex) for key, value, ex in self._queued]
+        self._watched, self._queued = {}, None
+        return results
+
+
+class RedisSessionBackend(SessionBackend):
+    """Snapshots as ``<prefix><session id>`` keys that expire after ``ttl`` seconds.
+
+    ``client`` is anything with redis-py's ``get``, ``set(ex=)``, ``delete``
+    and ``pipeline`` (WATCH / MULTI / EXEC, used for the version check): a
+    ``redis.Redis`` connection, ``LocalRedis``, or a client for another
+    Redis-compatible server.
+    """
+
+    def __init__(self, client, prefix="maas:session:", ttl=86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Connect to ``redis://`` / ``rediss://`` URLs, or use LocalRedis for ``memory://``."""
+        if urlparse(url).scheme == "memory":
+            return cls(LocalRedis(), **kwargs)
+        if redis is None:
+            raise RuntimeError("The Redis session backend needs the redis package (pip install redis)")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def load(self, session_id):
+        value = self.client.get(self.prefix + session_id)
+        return json.loads(value) if value else None
+
+    def save(self, session_id, snapshot, version):
+        key = self.prefix + session_id
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                stored = pipe.get(key)
+                if (json.loads(stored).get("version", 0) if stored else 0) != version:
+                    return False
+                pipe.multi()
+                pipe.set(key, json.dumps({**snapshot, "version": version + 1}), ex=self.ttl)
+                pipe.execute()
+            except WATCH_ERRORS:
+                return False
+        return True
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+def create_backend(kind, sqlite_path=None, redis_url=None, ttl=86400):
+    """Build the backend named by config.SESSION_BACKEND ("sqlite", "redis" or "none")."""
+    if kind == "sqlite":
+        return SQLiteSessionBackend(sqlite_path, ttl=ttl)
+    if kind == "redis":
+        return RedisSessionBackend.from_url(redis_url, ttl=ttl)
+    if kind in ("none", "", None):
+        return NullSessionBackend()
+    raise ValueError(f"Unknown session backend: {kind!r}")
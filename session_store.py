@@ -0,0 +1,292 @@
+"""
+MAAS Practice - Session Store
+Embedded SQLite store for feedback, transcripts, generated outputs, visit digests and call metrics
+
+All writes go through one background writer thread that commits in
+batches, so request threads never wait on disk. The database runs in WAL
+mode, so reads from other threads and processes don't block the writer.
+"""
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_feedback (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    session_id TEXT,
+    patient_id TEXT,
+    consultation_id INTEGER,
+    feedback_text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_feedback_case ON user_feedback (patient_id, consultation_id);
+CREATE INDEX IF NOT EXISTS idx_user_feedback_created ON user_feedback (created_at);
+
+CREATE TABLE IF NOT EXISTS transcripts (
+    interview_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    patient_id TEXT NOT NULL,
+    consultation_id INTEGER NOT NULL,
+    focus TEXT,
+    started_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    ended_at TEXT,
+    exchanges INTEGER NOT NULL DEFAULT 0,
+    messages TEXT NOT NULL,
+    feedback TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_case ON transcripts (patient_id, consultation_id);
+CREATE INDEX IF NOT EXISTS idx_transcripts_started ON transcripts (started_at);
+
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    interview_id TEXT,
+    patient_id TEXT,
+    consultation_id INTEGER,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outputs_case ON outputs (patient_id, consultation_id);
+CREATE INDEX IF NOT EXISTS idx_outputs_interview ON outputs (interview_id);
+CREATE INDEX IF NOT EXISTS idx_outputs_created ON outputs (created_at);
+
+CREATE TABLE IF NOT EXISTS visit_digests (
+    student_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    consultation_id INTEGER NOT NULL,
+    interview_id TEXT,
+    created_at TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (student_id, patient_id, consultation_id)
+);
+
+CREATE TABLE IF NOT EXISTS call_metrics (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    call_type TEXT,
+    model TEXT,
+    patient_id TEXT,
+    consultation_id INTEGER,
+    stream INTEGER,
+    wall_ms REAL,
+    ttft_ms REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cache_read_tokens INTEGER,
+    cache_write_tokens INTEGER,
+    retries INTEGER,
+    error TEXT,
+    cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS idx_call_metrics_case ON call_metrics (patient_id, consultation_id);
+CREATE INDEX IF NOT EXISTS idx_call_metrics_ts ON call_metrics (ts);
+"""
+
+METRIC_COLUMNS = (
+    "ts", "call_type", "model", "patient_id", "consultation_id", "stream", "wall_ms", "ttft_ms",
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "retries", "error", "cost_usd",
+)
+
+_STOP = object()
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def connect(path):
+    """Open a connection with the settings every store connection uses."""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class SessionStore:
+    """Concurrent-safe store with batched writes from a background thread."""
+
+    def __init__(self, path, batch_size=100, flush_interval=0.5):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_errors = 0
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        with connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="maas-session-store", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # Writing
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            stop = any(item is _STOP for item in batch)
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            statements = [item for item in batch if isinstance(item, tuple)]
+            try:
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            except sqlite3.Error:
+                # Retry one by one so a single bad write doesn't lose the batch
+                for sql, params in statements:
+                    try:
+                        with conn:
+                            conn.execute(sql, params)
+                    except sqlite3.Error:
+                        self.write_errors += 1  # Persistence must never break a consultation
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                conn.close()
+                return
+
+    def _write(self, sql, params):
+        self._queue.put((sql, params))
+
+    def flush(self, timeout=10):
+        """Block until every write queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Commit pending writes and stop the writer thread."""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+
+    def log_user_feedback(self, patient_id, consultation_id, feedback_text, session_id=None):
+        """Store the student's answer to the end-of-session question."""
+        self._write(
+            "INSERT INTO user_feedback (created_at, session_id, patient_id, consultation_id, feedback_text) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (_now(), session_id, patient_id, consultation_id, feedback_text),
+        )
+
+    def save_transcript(self, interview_id, patient_id, consultation_id, messages,
+                        session_id=None, focus=None, ended=False, feedback=None):
+        """Insert or update the transcript for one interview."""
+        now = _now()
+        self._write(
+            "INSERT INTO transcripts (interview_id, session_id, patient_id, consultation_id, focus, "
+            "started_at, updated_at, ended_at, exchanges, messages, feedback) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(interview_id) DO UPDATE SET updated_at = excluded.updated_at, "
+            "ended_at = COALESCE(excluded.ended_at, transcripts.ended_at), exchanges = excluded.exchanges, "
+            "messages = excluded.messages, feedback = COALESCE(excluded.feedback, transcripts.feedback)",
+            (interview_id, session_id, patient_id, consultation_id, focus, now, now,
+             now if ended else None, len(messages) // 2, json.dumps(messages), feedback),
+        )
+
+    def save_output(self, interview_id, patient_id, consultation_id, kind, content):
+        """Store a generated summary or feedback text."""
+        self._write(
+            "INSERT INTO outputs (created_at, interview_id, patient_id, consultation_id, kind, content) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (_now(), interview_id, patient_id, consultation_id, kind, content),
+        )
+
+    def save_visit_digest(self, student_id, patient_id, consultation_id, interview_id, digest):
+        """Store a student's digest of one consultation, replacing an earlier one of the same case."""
+        self._write(
+            "INSERT INTO visit_digests (student_id, patient_id, consultation_id, interview_id, created_at, digest) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(student_id, patient_id, consultation_id) DO UPDATE SET "
+            "interview_id = excluded.interview_id, created_at = excluded.created_at, digest = excluded.digest",
+            (student_id, patient_id, consultation_id, interview_id, _now(), json.dumps(digest)),
+        )
+
+    def record_call(self, record):
+        """instrumentation sink: store one call metrics record."""
+        self._write(
+            f"INSERT INTO call_metrics ({', '.join(METRIC_COLUMNS)}) VALUES ({', '.join('?' for _ in METRIC_COLUMNS)})",
+            tuple(record.get(column) for column in METRIC_COLUMNS),
+        )
+
+    # Reading
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def _select(self, table, date_column, since=None, until=None, limit=None, **equals):
+        """Rows matching column=value filters and a date range, newest first."""
+        clauses, params = [], []
+        for column, value in equals.items():
+            if not column.isidentifier():
+                raise ValueError(f"Invalid column name: {column!r}")
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append(f"{date_column} >= ?")
+            params.append(str(since))
+        if until is not None:
+            clauses.append(f"{date_column} < ?")
+            params.append(str(until))
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {date_column} DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def user_feedback(self, **filters):
+        """User feedback filtered by patient_id, consultation_id, since, until, limit."""
+        return self._select("user_feedback", "created_at", **filters)
+
+    def transcripts(self, **filters):
+        """Transcripts (messages decoded) filtered like user_feedback."""
+        rows = self._select("transcripts", "started_at", **filters)
+        for row in rows:
+            row["messages"] = json.loads(row["messages"])
+        return rows
+
+    def transcript(self, interview_id):
+        """One interview's transcript, or None."""
+        row = self._reader().execute(
+            "SELECT * FROM transcripts WHERE interview_id = ?", (interview_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        row = dict(row)
+        row["messages"] = json.loads(row["messages"])
+        return row
+
+    def visit_digest(self, student_id, patient_id, consultation_id):
+        """A student's latest digest of one consultation (decoded), or None."""
+        row = self._reader().execute(
+            "SELECT digest FROM visit_digests WHERE student_id = ? AND patient_id = ? AND consultation_id = ?",
+            (student_id, patient_id, consultation_id),
+        ).fetchone()
+        return json.loads(row["digest"]) if row else None
+
+    def outputs(self, **filters):
+        """Generated outputs, also filterable by kind and interview_id."""
+        return self._select("outputs", "created_at", **filters)
+
+    def call_metrics(self, **filters):
+        """Call metrics, also filterable by call_type and model."""
+        return self._select("call_metrics", "ts", **filters)
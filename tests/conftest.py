@@ -0,0 +1,9 @@
+"""
+MAAS Practice - Test Setup
+Makes the app's top-level modules importable from the tests
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
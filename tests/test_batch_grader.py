@@ -0,0 +1,163 @@
+"""
+MAAS Practice - Batch Grader Tests
+Transcript parsing, resuming from the output file and matching batch results
+"""
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from batch_grader import (
+    ResultWriter, TranscriptFormatError, collect_batch, grade_in_batches, group_by_key, parse_transcript,
+    read_results,
+)
+
+TRANSCRIPT = """MAAS Practice - Consultation Transcript
+========================================
+Patient: Mr. Lee
+Consultation: Chest Pain — Initial Presentation
+Date: 2026-10-01 09:30
+
+TRANSCRIPT
+----------
+
+Student: Hello, what brings you in?
+
+Mr. Lee: It's my chest.
+It gets tight when I climb stairs.
+
+Student: Student: is how I'd start
+
+
+FEEDBACK
+--------
+Good opening.
+
+---
+Generated by MAAS Practice
+Patient Responses Adapted to Clinical Technique in Calibrated Encounters
+"""
+
+
+def job(item_id, key, focus="Balanced"):
+    item = {"id": item_id, "patient_id": "mr-lee", "consultation_id": 1, "focus": focus, "messages": []}
+    request = {"model": "model-a", "max_tokens": 900, "timeout": 60, "messages": [{"role": "user", "content": key}]}
+    return {"key": key, "item": item, "focus": focus, "request": request}
+
+
+def records(path):
+    return [json.loads(row) for row in path.read_text().splitlines()]
+
+
+class FakeBatches:
+    """The messages.batches endpoints, answering from a dict of custom_id -> result."""
+
+    def __init__(self, results):
+        self.results_by_batch = {"old": results}
+        self.created = []
+
+    def create(self, requests):
+        self.created.append(requests)
+        batch_id = f"new-{len(self.created)}"
+        self.results_by_batch[batch_id] = {request["custom_id"]: f"feedback for {request['custom_id']}"
+                                           for request in requests}
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        return SimpleNamespace(processing_status="ended")
+
+    def results(self, batch_id):
+        for custom_id, result in self.results_by_batch[batch_id].items():
+            if isinstance(result, str):
+                result = SimpleNamespace(type="succeeded", message=SimpleNamespace(content=[SimpleNamespace(text=result)]))
+            yield SimpleNamespace(custom_id=custom_id, result=result)
+
+
+def client(results=None):
+    return SimpleNamespace(messages=SimpleNamespace(batches=FakeBatches(results or {})))
+
+
+@pytest.fixture
+def output(tmp_path):
+    return tmp_path / "grades.jsonl"
+
+
+def test_parse_transcript():
+    name, title, messages = parse_transcript(TRANSCRIPT)
+    assert (name, title) == ("Mr. Lee", "Chest Pain — Initial Presentation")
+    assert messages == [
+        {"role": "user", "content": "Hello, what brings you in?"},
+        {"role": "assistant", "content": "It's my chest.\nIt gets tight when I climb stairs."},
+        {"role": "user", "content": "Student: is how I'd start"},
+    ]
+
+
+def test_parse_transcript_rejects_other_files():
+    with pytest.raises(TranscriptFormatError):
+        parse_transcript("Just some notes\n")
+    with pytest.raises(TranscriptFormatError):
+        parse_transcript(TRANSCRIPT.replace("Patient: Mr. Lee\n", ""))
+
+
+def test_read_results_resumes_where_a_run_stopped(output):
+    output.write_text("\n".join([
+        json.dumps({"id": "a", "key": "k1", "status": "graded", "feedback": "F1"}),
+        json.dumps({"id": "b", "key": "k2", "status": "error", "feedback": None}),
+        json.dumps({"id": "c", "key": "k3", "status": "submitted", "batch_id": "batch-1"}),
+        json.dumps({"id": "d", "key": "k4", "status": "submitted", "batch_id": "batch-1"}),
+        json.dumps({"id": "d", "key": "k4", "status": "graded", "feedback": "F4"}),
+        '{"id": "e", "key": "k5", "sta',  # Cut short by an interruption
+    ]) + "\n")
+    graded, answers, pending = read_results(output)
+    assert graded == {("a", "k1"), ("d", "k4")}
+    assert answers == {"k1": "F1", "k4": "F4"}
+    assert pending == {"batch-1": {"k3"}}
+
+
+def test_read_results_without_a_file(output):
+    assert read_results(output) == (set(), {}, {})
+
+
+def test_identical_requests_are_grouped():
+    groups = group_by_key([job("a", "k1"), job("b", "k2"), job("c", "k1")])
+    assert {key: [j["item"]["id"] for j in jobs] for key, jobs in groups.items()} == {"k1": ["a", "c"], "k2": ["b"]}
+
+
+def test_batch_results_are_matched_by_custom_id(output):
+    groups = group_by_key([job("a", "k1"), job("b", "k2"), job("c", "k1"), job("d", "k3")])
+    errored = SimpleNamespace(type="errored", error=SimpleNamespace(error=SimpleNamespace(message="overloaded")))
+    fake = client({"k2": "F2", "unknown": "ignored", "k1": "F1", "k3": errored})
+    writer = ResultWriter(output, 4, out=io.StringIO())
+    collect_batch(fake, "old", groups, writer, poll_seconds=0)
+    writer.close()
+    by_id = {record["id"]: record for record in records(output)}
+    assert sorted(by_id) == ["a", "b", "c", "d"]
+    assert by_id["a"]["feedback"] == by_id["c"]["feedback"] == "F1"
+    assert by_id["b"]["feedback"] == "F2"
+    assert (by_id["d"]["status"], by_id["d"]["error"]) == ("error", "overloaded")
+    assert (writer.graded, writer.failed) == (3, 1)
+
+
+def test_keys_missing_from_a_batch_are_errors(output):
+    writer = ResultWriter(output, 1, out=io.StringIO())
+    collect_batch(client({}), "old", group_by_key([job("a", "k1")]), writer, poll_seconds=0)
+    writer.close()
+    assert [(r["status"], r["error"]) for r in records(output)] == [("error", "missing from batch results")]
+
+
+def test_grade_in_batches_collects_pending_then_submits_one_request_per_key(output):
+    groups = group_by_key([job("a", "k1"), job("b", "k2"), job("c", "k2"), job("d", "k3")])
+    fake = client({"k1": "F1"})
+    writer = ResultWriter(output, 4, out=io.StringIO())
+    grade_in_batches(fake, groups, {"old": {"k1"}}, writer, batch_size=10, poll_seconds=0)
+    writer.close()
+    (submitted,) = fake.messages.batches.created
+    assert [request["custom_id"] for request in submitted] == ["k2", "k3"]
+    assert "timeout" not in submitted[0]["params"]
+    graded = {r["id"]: r["feedback"] for r in records(output) if r["status"] == "graded"}
+    assert graded == {"a": "F1", "b": "feedback for k2", "c": "feedback for k2", "d": "feedback for k3"}
+    assert [(r["id"], r["batch_id"]) for r in records(output) if r["status"] == "submitted"] == [
+        ("b", "new-1"), ("c", "new-1"), ("d", "new-1")
+    ]
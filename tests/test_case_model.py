@@ -0,0 +1,71 @@
+"""
+MAAS Practice - Case Model Tests
+Schema validation and compiled consultations
+"""
+
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+from case_model import CaseValidationError, compile_patient, validate_patient
+
+PATIENTS_DIR = Path(__file__).resolve().parent.parent / "data" / "patients"
+
+
+def load(name):
+    return json.loads((PATIENTS_DIR / f"{name}.json").read_text())
+
+
+@pytest.mark.parametrize("path", sorted(PATIENTS_DIR.glob("*.json")), ids=lambda path: path.stem)
+def test_shipped_patients_compile(path):
+    patient = json.loads(path.read_text())
+    compiled = compile_patient(patient, path.name)
+    assert sorted(compiled) == sorted(c["consultation_id"] for c in patient["consultations"])
+
+
+def test_every_problem_is_reported():
+    patient = load("mr-lee")
+    del patient["patient"]["name"]
+    patient["consultations"][0]["title"] = 3
+    with pytest.raises(CaseValidationError) as raised:
+        validate_patient(patient, "mr-lee.json")
+    assert raised.value.source == "mr-lee.json"
+    assert raised.value.problems == [
+        "patient.name is missing",
+        "consultations[0].title should be str, not int",
+    ]
+
+
+def test_optional_keys_may_be_missing_or_null():
+    patient = load("mr-lee")
+    consultation = patient["consultations"][0]
+    consultation.pop("difficulty", None)
+    consultation["ideas_concerns_expectations"] = None
+    validate_patient(patient)
+
+
+def test_duplicate_consultation_ids_are_rejected():
+    patient = load("mr-lee")
+    patient["consultations"].append(copy.deepcopy(patient["consultations"][0]))
+    with pytest.raises(CaseValidationError, match="duplicate consultation_id"):
+        compile_patient(patient)
+
+
+def test_compiled_case_is_immutable():
+    case = compile_patient(load("mr-lee"))[1]
+    with pytest.raises(AttributeError):
+        case.title = "Changed"
+    with pytest.raises(AttributeError):
+        case.extra = 1
+
+
+def test_carried_prompt_leaves_out_only_the_authored_previous_visit():
+    patient = load("mr-lee")
+    case = compile_patient(patient)[2]
+    follow_up = patient["consultations"][1]["for_follow_up"]
+    assert case.follow_up
+    assert "Previous consultation" in case.case_prompt
+    assert "Previous consultation" not in case.case_prompt_carried
+    assert follow_up["interval"]["duration"] in case.case_prompt_carried
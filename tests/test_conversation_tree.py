@@ -0,0 +1,79 @@
+"""
+MAAS Practice - Conversation Tree Tests
+Branching with "again", switching attempts and the alternatives sent for feedback
+"""
+
+import pytest
+
+from conversation_tree import ConversationTree
+
+
+def exchange(tree, student, patient):
+    tree.append("user", student)
+    tree.append("assistant", patient)
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+@pytest.fixture
+def tree():
+    """Hello, then two attempts at the second question."""
+    tree = ConversationTree()
+    exchange(tree, "Hello", "Hi doctor")
+    exchange(tree, "Why are you here?", "Chest pain")
+    tree.rewind(2)
+    exchange(tree, "What brings you in today?", "My chest has been hurting")
+    return tree
+
+
+def test_again_starts_a_sibling_branch_sharing_the_prefix(tree):
+    assert len(tree) == 6
+    assert contents(tree.messages()) == ["Hello", "Hi doctor", "What brings you in today?", "My chest has been hurting"]
+    first, second = tree.branches()
+    assert contents(tree.messages(first))[-1] == "Chest pain"
+    assert tree.common_prefix(first, second) == 2
+    assert tree.messages(first)[0] is tree.messages(second)[0]  # Shared, not copied
+
+
+def test_alternatives_are_the_other_branches_after_they_split(tree):
+    assert [contents(turns) for turns in tree.alternatives()] == [["Why are you here?", "Chest pain"]]
+
+
+def test_switch_makes_an_earlier_attempt_active(tree):
+    first, second = tree.branches()
+    tree.switch(first)
+    assert contents(tree.messages())[-1] == "Chest pain"
+    assert [contents(turns) for turns in tree.alternatives()] == [
+        ["What brings you in today?", "My chest has been hurting"]
+    ]
+    with pytest.raises(IndexError):
+        tree.switch(len(tree))
+
+
+def test_rewound_head_counts_as_a_branch(tree):
+    tree.rewind(2)
+    assert tree.branches()[-1] == tree.head
+    assert len(tree.alternatives()) == 2
+    tree.rewind(10)
+    assert tree.head is None and tree.messages() == []
+
+
+def test_discard_head_removes_only_the_newest_turn():
+    tree = ConversationTree()
+    exchange(tree, "Hello", "Hi doctor")
+    tree.append("user", "Any allergies?")
+    tree.discard_head()
+    assert len(tree) == 2 and contents(tree.messages()) == ["Hello", "Hi doctor"]
+
+    tree.rewind(1)
+    tree.discard_head()  # Not the newest turn: head moves back but the turn stays for its branch
+    assert len(tree) == 2 and tree.head is None
+
+
+def test_round_trip_through_a_checkpoint(tree):
+    restored = ConversationTree.from_dict(tree.to_dict())
+    assert restored.to_dict() == tree.to_dict()
+    assert contents(restored.messages()) == contents(tree.messages())
+    assert restored.alternatives() == tree.alternatives()
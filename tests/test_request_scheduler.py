@@ -0,0 +1,193 @@
+"""
+MAAS Practice - Request Scheduler Tests
+Token buckets, admission order, retries and prompt cache accounting
+"""
+
+import threading
+import time
+
+import anthropic
+import pytest
+
+try:
+    import httpx
+except ImportError:  # newer anthropic releases ship their httpx fork instead
+    import httpx2 as httpx
+
+from request_scheduler import PromptCacheTracker, RequestScheduler, TokenBucket
+
+
+def api_error(cls, status, headers=None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.test/v1/messages"))
+    return cls("error", response=response, body=None)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+# Token buckets
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # One unit a second
+    now = bucket._updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1) == 0
+
+
+def test_bucket_never_holds_more_than_a_minute():
+    bucket = TokenBucket(60)
+    now = bucket._updated
+    bucket.take(30, now)
+    assert bucket.wait_time(60, now + 3600) == 0
+    bucket.take(60, now + 3600)
+    assert bucket.wait_time(1, now + 3600) == pytest.approx(1.0)
+
+
+def test_oversized_call_waits_for_a_full_bucket():
+    bucket = TokenBucket(60)
+    now = bucket._updated
+    bucket.take(30, now)
+    assert bucket.wait_time(1000, now) == pytest.approx(30.0)
+
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0)
+    bucket.take(10 ** 9, 0)
+    assert bucket.wait_time(10 ** 9, 0) == 0
+
+
+# Admission
+
+def test_concurrency_cap():
+    scheduler = RequestScheduler(max_concurrency=1)
+    started = threading.Event()
+    with scheduler.slot("patient_turn"):
+        worker = threading.Thread(target=lambda: scheduler.run(started.set, "patient_turn"))
+        worker.start()
+        wait_until(lambda: scheduler.snapshot()["queued"] == 1)
+        assert not started.is_set()
+        assert scheduler.snapshot()["in_flight"] == 1
+    worker.join(5)
+    assert started.is_set()
+    assert scheduler.snapshot()["in_flight"] == 0
+
+
+def test_queued_calls_run_by_priority_then_arrival():
+    scheduler = RequestScheduler(max_concurrency=1, priorities={"patient_turn": 0, "advice": 1, "summary": 2})
+    order = []
+    workers = []
+    with scheduler.slot("patient_turn"):
+        for name, call_type in [("summary", "summary"), ("advice 1", "advice"), ("other", "warm_start"),
+                                ("turn", "patient_turn"), ("advice 2", "advice")]:
+            worker = threading.Thread(target=scheduler.run, args=(lambda name=name: order.append(name), call_type))
+            worker.start()
+            workers.append(worker)
+            wait_until(lambda: scheduler.snapshot()["queued"] == len(workers))
+    for worker in workers:
+        worker.join(5)
+    assert order == ["turn", "advice 1", "advice 2", "summary", "other"]
+
+
+def test_empty_buckets_delay_admission():
+    scheduler = RequestScheduler(requests_per_minute=600, tokens_per_minute=6000)  # 10 requests, 100 tokens a second
+    scheduler.requests.take(600, time.monotonic())
+    started = time.monotonic()
+    scheduler.run(lambda: None, "patient_turn", tokens=10)
+    assert time.monotonic() - started >= 0.09
+
+    scheduler.tokens.take(6000, time.monotonic())
+    started = time.monotonic()
+    scheduler.run(lambda: None, "patient_turn", tokens=20)
+    assert time.monotonic() - started >= 0.19
+
+
+# Retries
+
+def test_transient_errors_are_retried():
+    scheduler = RequestScheduler(backoff_base=0, backoff_max=0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise api_error(anthropic.RateLimitError, 429)
+        return "ok"
+
+    assert scheduler.run(flaky, "patient_turn") == "ok"
+    assert len(calls) == 3
+    assert scheduler.snapshot()["retries"] == 2
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RequestScheduler(max_retries=2, backoff_base=0, backoff_max=0)
+    calls = []
+
+    def overloaded():
+        calls.append(1)
+        raise api_error(anthropic.InternalServerError, 529)
+
+    with pytest.raises(anthropic.InternalServerError):
+        scheduler.run(overloaded, "patient_turn")
+    assert len(calls) == 3
+    assert scheduler.snapshot()["failures"] == 1
+
+
+def test_other_errors_are_not_retried():
+    scheduler = RequestScheduler(backoff_base=0)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise api_error(anthropic.BadRequestError, 400)
+
+    with pytest.raises(anthropic.BadRequestError):
+        scheduler.run(bad_request, "patient_turn")
+    assert len(calls) == 1
+
+
+def test_retry_after_is_respected_up_to_the_cap():
+    scheduler = RequestScheduler(backoff_base=0.01, backoff_max=5)
+    assert scheduler.retry_delay(api_error(anthropic.RateLimitError, 429, {"retry-after": "3"}), 0) == 3
+    assert scheduler.retry_delay(api_error(anthropic.RateLimitError, 429, {"retry-after": "60"}), 0) == 5
+
+
+# Prompt cache accounting
+
+def request(system_text, message="Hello", model="model-a", cached=True):
+    block = {"type": "text", "text": system_text}
+    if cached:
+        block["cache_control"] = {"type": "ephemeral"}
+    return {"model": model, "system": [block], "messages": [{"role": "user", "content": message}]}
+
+
+def test_repeated_system_prefix_is_not_charged():
+    tracker = PromptCacheTracker(ttl=300, min_tokens=100)
+    long_prompt = "x" * 2000
+    first = tracker.uncached_tokens(request(long_prompt))
+    second = tracker.uncached_tokens(request(long_prompt, "Tell me more"))
+    assert first > 500
+    assert second < 20
+    assert tracker.uncached_tokens(request(long_prompt, model="model-b")) == first
+
+
+def test_prefix_expires_after_ttl(monkeypatch):
+    tracker = PromptCacheTracker(ttl=300, min_tokens=100)
+    now = time.monotonic()
+    monkeypatch.setattr("request_scheduler.time.monotonic", lambda: now)
+    first = tracker.uncached_tokens(request("x" * 2000))
+    monkeypatch.setattr("request_scheduler.time.monotonic", lambda: now + 301)
+    assert tracker.uncached_tokens(request("x" * 2000)) == first
+
+
+def test_short_or_unmarked_prefixes_are_always_charged():
+    tracker = PromptCacheTracker(ttl=300, min_tokens=1024)
+    short = tracker.uncached_tokens(request("x" * 400))
+    assert tracker.uncached_tokens(request("x" * 400)) == short
+    unmarked = tracker.uncached_tokens(request("x" * 8000, cached=False))
+    assert tracker.uncached_tokens(request("x" * 8000, cached=False)) == unmarked
@@ -0,0 +1,102 @@
+"""
+MAAS Practice - Response Cache Tests
+Request keys, LRU eviction and expiry in both tiers
+"""
+
+import pytest
+
+from response_cache import ResponseCache, request_key
+
+REQUEST = {
+    "model": "model-a",
+    "system": [{"type": "text", "text": "You are Mr. Lee."}],
+    "messages": [{"role": "user", "content": "summary"}],
+    "max_tokens": 500,
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("response_cache.time.time", clock)
+    return clock
+
+
+def test_request_key_covers_what_determines_the_reply():
+    key = request_key(REQUEST, "summary")
+    assert request_key(dict(reversed(list(REQUEST.items()))), "summary") == key
+    assert request_key({**REQUEST, "temperature": 0.2}, "summary") == key
+    assert request_key(REQUEST, "advice") != key
+    assert request_key({**REQUEST, "model": "model-b"}, "summary") != key
+    assert request_key({**REQUEST, "max_tokens": 800}, "summary") != key
+    assert request_key({**REQUEST, "messages": REQUEST["messages"] * 2}, "summary") != key
+
+
+def test_memory_tier_evicts_least_recently_used(clock):
+    cache = ResponseCache({"summary"}, memory_entries=2)
+    cache.put("a", "summary", "A")
+    cache.put("b", "summary", "B")
+    assert cache.get("a", "summary") == "A"
+    cache.put("c", "summary", "C")
+    assert cache.get("b", "summary") is None
+    assert cache.get("a", "summary") == "A"
+    assert cache.get("c", "summary") == "C"
+
+
+def test_memory_tier_expires(clock):
+    cache = ResponseCache({"summary"}, ttl=60)
+    cache.put("a", "summary", "A")
+    clock.now += 59
+    assert cache.get("a", "summary") == "A"
+    clock.now += 2
+    assert cache.get("a", "summary") is None
+
+
+def test_disk_tier_is_shared_and_promoted_to_memory(clock, tmp_path):
+    path = tmp_path / "response_cache.db"
+    ResponseCache({"summary"}, disk_path=path).put("a", "summary", "A")
+    other_worker = ResponseCache({"summary"}, disk_path=path)
+    assert other_worker.get("a", "summary") == "A"
+    assert other_worker.get("a", "summary") == "A"
+    assert other_worker.stats() == [
+        {"call_type": "summary", "memory_hits": 1, "disk_hits": 1, "misses": 0, "hit_rate": 1.0}
+    ]
+
+
+def test_disk_tier_expires(clock, tmp_path):
+    path = tmp_path / "response_cache.db"
+    ResponseCache({"summary"}, disk_path=path, ttl=60).put("a", "summary", "A")
+    clock.now += 61
+    assert ResponseCache({"summary"}, disk_path=path, ttl=60).get("a", "summary") is None
+
+
+def test_disk_tier_keeps_the_most_recently_used(clock, tmp_path):
+    cache = ResponseCache({"summary"}, memory_entries=1, disk_path=tmp_path / "response_cache.db", disk_entries=50)
+    for number in range(99):
+        clock.now += 1
+        cache.put(f"k{number}", "summary", str(number))
+    clock.now += 1
+    assert cache.get("k0", "summary") == "0"  # Used again, so it outlives newer entries
+    clock.now += 1
+    cache.put("k99", "summary", "99")  # Every 100th put trims the disk tier
+    keys = {row["key"] for row in cache._disk().execute("SELECT key FROM responses")}
+    assert len(keys) == 50
+    assert "k0" in keys and "k99" in keys
+    assert "k1" not in keys and "k50" not in keys and "k51" in keys
+
+
+def test_stats_count_misses_per_call_type(clock):
+    cache = ResponseCache({"summary", "advice"})
+    cache.put("a", "summary", "A")
+    cache.get("a", "summary")
+    cache.get("b", "advice")
+    assert cache.enabled("advice") and not cache.enabled("patient_turn")
+    assert {row["call_type"]: row["hit_rate"] for row in cache.stats()} == {"advice": 0.0, "summary": 1.0}
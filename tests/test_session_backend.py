@@ -0,0 +1,96 @@
+"""
+MAAS Practice - Session Backend Tests
+Checkpoint round trips and the version check on save
+"""
+
+import time
+
+import pytest
+
+from session_backend import (
+    LocalPipeline, LocalRedis, RedisSessionBackend, SQLiteSessionBackend, WatchError, create_backend,
+)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_backend(request, tmp_path):
+    """Returns a factory for backends that share one store, like workers on one host."""
+    if request.param == "sqlite":
+        return lambda: SQLiteSessionBackend(tmp_path / "maas.db")
+    client = LocalRedis()
+    return lambda: RedisSessionBackend(client)
+
+
+def test_save_stores_the_next_version(make_backend):
+    backend = make_backend()
+    assert backend.load("s1") is None
+    assert backend.save("s1", {"messages": ["hi"]}, 0)
+    assert backend.load("s1") == {"messages": ["hi"], "version": 1}
+    assert backend.save("s1", {"messages": ["hi", "there"]}, 1)
+    assert backend.load("s1")["version"] == 2
+
+
+def test_stale_write_is_rejected(make_backend):
+    first, second = make_backend(), make_backend()
+    first.save("s1", {"tab": "first"}, 0)
+    version = second.load("s1")["version"]
+    assert first.save("s1", {"tab": "first again"}, version)
+    assert not second.save("s1", {"tab": "second"}, version)
+    assert second.load("s1") == {"tab": "first again", "version": 2}
+
+
+def test_new_session_cannot_overwrite_an_existing_one(make_backend):
+    backend = make_backend()
+    backend.save("s1", {"tab": "first"}, 0)
+    assert not backend.save("s1", {"tab": "second"}, 0)
+    assert backend.load("s1")["tab"] == "first"
+
+
+def test_delete(make_backend):
+    backend = make_backend()
+    backend.save("s1", {}, 0)
+    backend.delete("s1")
+    assert backend.load("s1") is None
+    assert backend.save("s1", {}, 0)
+
+
+def test_redis_save_loses_to_a_write_after_its_check():
+    client = LocalRedis()
+    backend = RedisSessionBackend(client)
+    backend.save("s1", {"tab": "first"}, 0)
+
+    class RacingPipeline(LocalPipeline):
+        """Another worker writes between this save's version check and its write."""
+
+        def multi(self):
+            client.set("maas:session:s1", '{"tab": "other", "version": 2}')
+            super().multi()
+
+    client.pipeline = lambda: RacingPipeline(client)
+    assert not backend.save("s1", {"tab": "mine"}, 1)
+    assert backend.load("s1") == {"tab": "other", "version": 2}
+
+
+def test_local_pipeline_raises_when_a_watched_key_changes():
+    client = LocalRedis()
+    pipe = client.pipeline()
+    pipe.watch("k")
+    client.set("k", "changed")
+    pipe.multi()
+    pipe.set("k", "mine")
+    with pytest.raises(WatchError):
+        pipe.execute()
+    assert client.get("k") == b"changed"
+
+
+def test_local_redis_expiry(monkeypatch):
+    client = LocalRedis()
+    client.set("k", "v", ex=10)
+    now = time.monotonic()
+    monkeypatch.setattr("session_backend.time.monotonic", lambda: now + 11)
+    assert client.get("k") is None
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend("memcached")
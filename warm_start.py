@@ -0,0 +1,130 @@
+"""
+MAAS Practice - Warm Start
+Prepares every consultation when the server starts, before the first student arrives
+
+The first turn of a session is the slowest: the case file has to be parsed
+and compiled, the system prompt is sent uncached, and the patient's reply to
+a greeting is generated from scratch even though it barely varies. The
+warm-up compiles every consultation, sends each system prompt once (which
+also writes it to the provider's prompt cache) and keeps a few generated
+replies per consultation to common opening greetings. A student who opens
+with one of those greetings gets a pooled reply at once; every later turn
+goes to the model as usual, with that reply in the history.
+"""
+
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+def normalize_greeting(text, names=()):
+    """Lower-case words of a greeting without punctuation or the patient's name."""
+    skip = set(re.findall(r"[a-z']+", " ".join(names).lower()))
+    return " ".join(word for word in re.findall(r"[a-z']+", str(text).lower()) if word not in skip)
+
+
+class OpenerPool:
+    """Pre-generated first replies, keyed by consultation and normalised greeting."""
+
+    def __init__(self, greetings, per_greeting=2):
+        self.greetings = list(greetings)
+        self.per_greeting = per_greeting
+        self._openers = {}  # (patient_id, consultation_id) -> {normalised greeting: [replies]}
+        self._lock = threading.Lock()
+        self.state = "idle"  # "idle", "running", "ready" or "disabled"
+        self.compiled = 0
+        self.primed = 0
+        self.errors = []
+        self.served = 0
+        self.started_at = None
+        self.seconds = None
+
+    def add(self, case, greeting, reply):
+        with self._lock:
+            replies = self._openers.setdefault(case, {}).setdefault(normalize_greeting(greeting), [])
+            replies.append(reply)
+
+    def match(self, case, text, names=()):
+        """A pooled reply to ``text`` as an opening line for ``case``, or None."""
+        with self._lock:
+            replies = self._openers.get(case, {}).get(normalize_greeting(text, names))
+            if not replies:
+                return None
+            self.served += 1
+            return random.choice(replies)
+
+    def stats(self):
+        """Progress of the warm-up and how often openers were served."""
+        with self._lock:
+            openers = sum(len(replies) for greetings in self._openers.values() for replies in greetings.values())
+            return {
+                "state": self.state,
+                "consultations_compiled": self.compiled,
+                "prompts_primed": self.primed,
+                "openers": openers,
+                "openers_served": self.served,
+                "errors": len(self.errors),
+                "seconds": self.seconds,
+            }
+
+    def warm_up(self, cases, prepare, generate, workers=4):
+        """Compile every case and pre-generate its openers.
+
+        ``cases`` yields (patient_id, consultation_id); ``prepare(case)``
+        loads and compiles one and returns its (patient, consultation), or
+        None if it can't be loaded; ``generate(patient, consultation,
+        greeting)`` returns one patient reply, or None when model calls are
+        unavailable. Failures are recorded in ``errors`` and never raised.
+        """
+        self.state = "running"
+        self.started_at = time.monotonic()
+        loaded = []
+        for case in cases:
+            try:
+                prepared = prepare(case)
+            except Exception as e:
+                self.errors.append(f"{case}: {e}")
+                continue
+            if prepared is not None:
+                self.compiled += 1
+                loaded.append((case, *prepared))
+
+        def fill(case, patient, consultation):
+            # The first call writes the prompt cache; the rest of this case's calls read it
+            for number in range(max(1, self.per_greeting)):
+                for greeting in self.greetings:
+                    try:
+                        reply = generate(patient, consultation, greeting)
+                    except Exception as e:
+                        self.errors.append(f"{case} {greeting!r}: {e}")
+                        return
+                    if reply is None:
+                        return
+                    if number == 0 and greeting == self.greetings[0]:
+                        with self._lock:
+                            self.primed += 1
+                    if number < self.per_greeting and reply.strip():
+                        self.add(case, greeting, reply.strip())
+                    if not self.per_greeting:  # Priming only
+                        return
+
+        if self.greetings:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="maas-warm") as executor:
+                for item in loaded:
+                    executor.submit(fill, *item)
+        self.seconds = round(time.monotonic() - self.started_at, 1)
+        self.state = "ready"
+
+    def start(self, *args, **kwargs):
+        """Run ``warm_up`` on a daemon thread and return at once."""
+        threading.Thread(target=self.warm_up, args=args, kwargs=kwargs, name="maas-warm-start", daemon=True).start()
+        return self
+
+
+opener_pool = OpenerPool(config.WARM_START_GREETINGS, per_greeting=config.WARM_START_OPENERS_PER_GREETING)
+if not config.WARM_START_ENABLED:
+    opener_pool.state = "disabled"